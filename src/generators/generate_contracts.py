@@ -7,13 +7,15 @@ import openai
 from dotenv import load_dotenv  # Add this import
 import os  # Add this import
 
+from ..lib.llm import LLMClient
+
 # Load environment variables at the start
 load_dotenv()
 
 
 class ContractGenerator:
   def __init__(self, template_dir="templates"):
-    self.llm = openai.OpenAI()  # or anthropic.Client()
+    self.llm = LLMClient(openai.OpenAI())  # or anthropic.Client()
     self.template_loader = jinja2.FileSystemLoader(template_dir)
     self.template_env = jinja2.Environment(loader=self.template_loader)
 
@@ -10,6 +10,8 @@ from dotenv import load_dotenv
 import openai
 from typing import Dict, List, Optional
 
+from ..lib.llm import LLMClient
+
 load_dotenv()
 
 class VendorContractGenerator:
@@ -25,9 +27,9 @@ class VendorContractGenerator:
       self.expense_data = json.load(f)["recurringOperationalExpenses"]
 
     # Initialize OpenAI
-    self.openai_client = openai.OpenAI(
+    self.openai_client = LLMClient(openai.OpenAI(
         api_key=os.getenv("OPENAI_API_KEY")
-    )
+    ))
 
   def _load_company_profile(self):
     """Load ServiceTech company profile"""
@@ -0,0 +1,321 @@
+import argparse
+import json
+from abc import ABC, abstractmethod
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Literal, Optional, TypedDict
+
+import openai
+import shortuuid
+from pydantic import ValidationError
+
+from ..lib.file_streams import write_text_atomic
+from ..lib.llm import LLMClient
+from .document_entity_extractor_agent import (
+  EXTRACTION_RESPONSE_FORMAT,
+  AgentContextVariables,
+  get_parsing_agent,
+  infer_document_type
+)
+from .extraction_repair import ExtractionRepairError
+from .extraction_schema import DocumentExtraction
+from .loader import DocumentLoader, ParsedContent, create_loader_from_env
+from .model_routing import Route
+
+BATCH_ENDPOINT = '/v1/chat/completions'
+
+BatchStatus = Literal['in_progress', 'completed', 'failed']
+
+class BatchResult(TypedDict):
+  status: BatchStatus
+  output: Optional[List[dict]]
+
+class BatchRequest(TypedDict, total=False):
+  file_name: str
+  cache_path: str
+  # Model tier the request was routed to, missing in batches submitted before routing
+  route: Route
+
+class BatchState(TypedDict):
+  batch_id: str
+  submitted_at: str
+  requests: Dict[str, BatchRequest]
+
+class BatchBackend(ABC):
+  """Submits JSONL request files to a batch API and reports their progress"""
+
+  @abstractmethod
+  def submit(self, requests_path: Path) -> str:
+    """Submit a JSONL file of chat completion requests and return the batch ID"""
+
+  @abstractmethod
+  def retrieve(self, batch_id: str) -> BatchResult:
+    """Status of a batch, with the output lines once it has completed"""
+
+class OpenAIBatchBackend(BatchBackend):
+  """Batch backend using the OpenAI batch API"""
+
+  def __init__(self, client: Optional[openai.OpenAI] = None):
+    self.client = client or openai.OpenAI()
+
+  def submit(self, requests_path: Path) -> str:
+    with open(requests_path, 'rb') as f:
+      input_file = self.client.files.create(file=f, purpose='batch')
+    batch = self.client.batches.create(
+      input_file_id=input_file.id,
+      endpoint=BATCH_ENDPOINT,
+      completion_window='24h'
+    )
+    return batch.id
+
+  def retrieve(self, batch_id: str) -> BatchResult:
+    batch = self.client.batches.retrieve(batch_id)
+    if batch.status in ('failed', 'expired', 'cancelled'):
+      return {'status': 'failed', 'output': None}
+    if batch.status != 'completed':
+      return {'status': 'in_progress', 'output': None}
+
+    output = []
+    for file_id in (batch.output_file_id, batch.error_file_id):
+      if file_id:
+        content = self.client.files.content(file_id).text
+        output.extend(json.loads(line) for line in content.splitlines() if line.strip())
+    return {'status': 'completed', 'output': output}
+
+class LocalBatchBackend(BatchBackend):
+  """Local stand-in for a batch API that completes after a delay.
+
+  Submitted request files are copied under the state directory, so a batch
+  submitted before a restart can still be retrieved afterwards. Once the delay
+  has passed, each request body is answered by the responder, which returns
+  the assistant message content for a chat completion request body.
+  """
+
+  def __init__(
+    self,
+    responder: Callable[[dict], str],
+    delay_seconds: float = 10,
+    state_dir: str = '.batches/local'
+  ):
+    self.responder = responder
+    self.delay_seconds = delay_seconds
+    self.state_dir = Path(state_dir)
+
+  def submit(self, requests_path: Path) -> str:
+    batch_id = f"local_batch_{shortuuid.uuid()}"
+    batch_dir = self.state_dir / batch_id
+    batch_dir.mkdir(parents=True, exist_ok=True)
+    (batch_dir / 'input.jsonl').write_text(requests_path.read_text())
+    (batch_dir / 'submitted_at').write_text(str(time.time()))
+    return batch_id
+
+  def retrieve(self, batch_id: str) -> BatchResult:
+    batch_dir = self.state_dir / batch_id
+    if not batch_dir.exists():
+      return {'status': 'failed', 'output': None}
+    submitted_at = float((batch_dir / 'submitted_at').read_text())
+    if time.time() - submitted_at < self.delay_seconds:
+      return {'status': 'in_progress', 'output': None}
+
+    output = []
+    for line in (batch_dir / 'input.jsonl').read_text().splitlines():
+      request = json.loads(line)
+      try:
+        content = self.responder(request['body'])
+        output.append({
+          'custom_id': request['custom_id'],
+          'response': {
+            'status_code': 200,
+            'body': {'choices': [{'message': {'role': 'assistant', 'content': content}}]}
+          },
+          'error': None
+        })
+      except Exception as e:
+        output.append({'custom_id': request['custom_id'], 'response': None, 'error': {'message': str(e)}})
+    return {'status': 'completed', 'output': output}
+
+def openai_responder(body: dict) -> str:
+  """Answer a batch request body with a regular chat completion call"""
+  response = LLMClient().chat.completions.create(**body)
+  return response.choices[0].message.content
+
+class BatchExtractor:
+  """Extracts triples for many documents through a batch API.
+
+  Pending extraction prompts are written to a JSONL submission file, and the
+  batch ID is persisted under the state directory together with the cache path
+  of every request. Polling resumes from these state files after a restart,
+  and completed results are written into the regular extraction cache, so the
+  normal loader run afterwards only hits the cache.
+  """
+
+  def __init__(self, loader: DocumentLoader, backend: BatchBackend, state_dir: str = '.batches'):
+    self.loader = loader
+    self.backend = backend
+    self.state_dir = Path(state_dir)
+
+  def open_batches(self) -> List[BatchState]:
+    """Load the state of all batches that have not been collected yet"""
+    if not self.state_dir.exists():
+      return []
+    return [json.loads(path.read_text()) for path in sorted(self.state_dir.glob('*.json'))]
+
+  def submit(self, parsed_contents: List[ParsedContent]) -> Optional[str]:
+    """Submit all documents that are neither cached nor part of an open batch.
+
+    Documents whose type cannot be inferred from the path are left for the
+    interactive extraction, since a batch request cannot call the triage agent.
+
+    Returns:
+      The batch ID, or None if there was nothing to submit
+    """
+    pending_paths = {
+      request['cache_path']
+      for state in self.open_batches()
+      for request in state['requests'].values()
+    }
+    processed_at = datetime.now().isoformat()
+
+    lines = []
+    requests: Dict[str, BatchRequest] = {}
+    for parsed_content in parsed_contents:
+      cache_path = self.loader.extraction_cache_path(parsed_content)
+      if cache_path.exists() or str(cache_path) in pending_paths:
+        continue
+      document_type = infer_document_type(parsed_content['file_name'])
+      if document_type is None:
+        print(f"Cannot infer document type, leaving for interactive extraction: {parsed_content['file_name']}")
+        continue
+
+      agent = get_parsing_agent(document_type)
+      context_variables = AgentContextVariables(
+        document_path=parsed_content['file_name'],
+        document_processed_at=processed_at,
+        structured_output=self.loader.structured_output
+      )
+      content = f"Here is the content of the document: {parsed_content['markdown']}"
+      route = self.loader.model_router.route(document_type, len(content) // 4)
+      body = {
+        'model': route['model'],
+        'max_tokens': route['max_tokens'],
+        'messages': [
+          {'role': 'system', 'content': agent.instructions(context_variables)},
+          {'role': 'user', 'content': content}
+        ]
+      }
+      if self.loader.structured_output:
+        body['response_format'] = EXTRACTION_RESPONSE_FORMAT
+      custom_id = f"request-{len(lines)}"
+      lines.append(json.dumps({
+        'custom_id': custom_id,
+        'method': 'POST',
+        'url': BATCH_ENDPOINT,
+        'body': body
+      }))
+      requests[custom_id] = {'file_name': parsed_content['file_name'], 'cache_path': str(cache_path), 'route': route}
+
+    if not lines:
+      print("No pending extractions to submit")
+      return None
+
+    self.state_dir.mkdir(parents=True, exist_ok=True)
+    requests_path = self.state_dir / f"submission_{shortuuid.uuid()}.jsonl"
+    requests_path.write_text("\n".join(lines) + "\n")
+    batch_id = self.backend.submit(requests_path)
+    requests_path.unlink()
+
+    state: BatchState = {'batch_id': batch_id, 'submitted_at': processed_at, 'requests': requests}
+    write_text_atomic(self.state_dir / f"{batch_id}.json", json.dumps(state))
+    print(f"Submitted batch {batch_id} with {len(requests)} extraction requests")
+    return batch_id
+
+  def poll(self) -> int:
+    """Check all open batches once and collect the completed ones.
+
+    Returns:
+      Number of batches that are still in progress
+    """
+    in_progress = 0
+    for state in self.open_batches():
+      result = self.backend.retrieve(state['batch_id'])
+      if result['status'] == 'in_progress':
+        in_progress += 1
+        continue
+      if result['status'] == 'completed':
+        self._collect(state, result['output'])
+      else:
+        print(f"Batch {state['batch_id']} failed, its documents will be extracted interactively")
+      (self.state_dir / f"{state['batch_id']}.json").unlink()
+    return in_progress
+
+  def _collect(self, state: BatchState, output: List[dict]) -> None:
+    """Write completed batch results into the extraction cache.
+
+    Results are validated and repaired like interactive extractions. Results
+    the repair cannot fix are left uncached, so the loader extracts them again
+    and escalates to a larger tier as it would for its own requests.
+    """
+    written = 0
+    for line in output:
+      request = state['requests'].get(line['custom_id'])
+      if request is None:
+        continue
+      if line.get('error') or not line.get('response') or line['response']['status_code'] != 200:
+        print(f"Batch request failed for {request['file_name']}: {line.get('error')}")
+        continue
+
+      content = line['response']['body']['choices'][0]['message']['content']
+      route = request.get('route') or self.loader.model_router.route(infer_document_type(request['file_name']), 0)
+      try:
+        if self.loader.structured_output:
+          document_extraction = DocumentExtraction.model_validate_json(content)
+        else:
+          document_extraction = DocumentExtraction.model_validate(json.loads(content))
+      except (ValidationError, json.JSONDecodeError) as e:
+        print(f"Error validating batch extraction for {request['file_name']}, attempting repair: {e}")
+        try:
+          # The prompt is not kept with the batch state, the response length stands in for the cost of a retry
+          document_extraction = self.loader.extraction_repairer.repair(content, route['model'], len(content) // 4)
+        except ExtractionRepairError:
+          print(f"Batch extraction of {request['file_name']} could not be repaired, leaving it for interactive extraction")
+          continue
+
+      cache_path = Path(request['cache_path'])
+      cache_path.parent.mkdir(parents=True, exist_ok=True)
+      write_text_atomic(cache_path, document_extraction.model_dump_json())
+      self.loader.model_router.record(request['file_name'], route)
+      written += 1
+    print(f"Collected batch {state['batch_id']}: {written} of {len(state['requests'])} extractions cached")
+
+  def run(self, directory_path: str, poll_interval: float = 60) -> None:
+    """Submit every pending document under a directory and wait for the results"""
+    # Collect anything that finished while we were not running
+    self.poll()
+
+    parsed_contents = []
+    for file_path in Path(directory_path).glob('**/*'):
+      if not self.loader.check_file_supported(file_path):
+        continue
+      parsed_content, _ = self.loader.prepare_content(str(file_path))
+      parsed_contents.append(parsed_content)
+    self.submit(parsed_contents)
+
+    while self.poll():
+      print(f"Waiting {poll_interval} seconds for open batches")
+      time.sleep(poll_interval)
+
+def run_batch_backfill():
+  parser = argparse.ArgumentParser(description="Extract triples for a document tree through a batch API")
+  parser.add_argument('directory', nargs='?', default='company_documents')
+  parser.add_argument('--local', action='store_true', help="Use the local batch stand-in instead of the OpenAI batch API")
+  parser.add_argument('--poll-interval', type=float, default=60)
+  args = parser.parse_args()
+
+  loader = create_loader_from_env()
+  backend = LocalBatchBackend(openai_responder) if args.local else OpenAIBatchBackend()
+  BatchExtractor(loader, backend).run(args.directory, poll_interval=args.poll_interval)
+  loader.process_directory(args.directory)
+
+if __name__ == "__main__":
+  run_batch_backfill()
@@ -0,0 +1,142 @@
+import json
+import re
+from typing import Dict, List, Optional, Tuple
+
+from ..lib.llama_parse import DEFAULT_PAGE_SEPARATOR
+from .extraction_schema import DocumentExtraction, Entity, EntityType, Relationship
+
+HEADING_PATTERN = re.compile(r'\n(?=#{1,6} )')
+
+# A document describes one of each of these, so every chunk refers to the same entity
+DOCUMENT_LEVEL_TYPES = [
+  EntityType.DOCUMENT,
+  EntityType.CONTRACT,
+  EntityType.INVOICE,
+  EntityType.PAYROLL,
+]
+
+def split_markdown(markdown: str, max_chars: int) -> List[str]:
+  """Split markdown into chunks of at most max_chars.
+
+  Pages (split on the LlamaParse page separator) are packed together while they
+  fit. Pages that are too long are split on headings and then on paragraphs.
+  """
+  if len(markdown) <= max_chars:
+    return [markdown]
+
+  pieces = []
+  for page in markdown.split(DEFAULT_PAGE_SEPARATOR):
+    pieces.extend(_split_piece(page, max_chars))
+
+  chunks = []
+  current = ''
+  for piece in pieces:
+    if current and len(current) + len(piece) + 2 > max_chars:
+      chunks.append(current)
+      current = piece
+    else:
+      current = f"{current}\n\n{piece}" if current else piece
+  if current:
+    chunks.append(current)
+  return chunks
+
+def _split_piece(text: str, max_chars: int) -> List[str]:
+  if len(text) <= max_chars:
+    return [text]
+  for pattern in (HEADING_PATTERN, re.compile(r'\n\n+')):
+    parts = [part for part in pattern.split(text) if part.strip()]
+    if len(parts) > 1:
+      return [piece for part in parts for piece in _split_piece(part, max_chars)]
+  # A single paragraph longer than a chunk is cut at the limit
+  return [text[i:i + max_chars] for i in range(0, len(text), max_chars)]
+
+def _natural_key(entity: Entity) -> Optional[Tuple]:
+  """Key identifying the same real-world entity across chunks"""
+  if entity.type in DOCUMENT_LEVEL_TYPES:
+    return (entity.type,)
+  for prop in ('name', 'description'):
+    value = entity.properties.get(prop)
+    if isinstance(value, str) and value.strip():
+      return (entity.type, prop, ' '.join(value.lower().split()))
+  return None
+
+def _compatible(existing: Entity, entity: Entity, key: Tuple) -> bool:
+  """Whether two entities with the same natural key agree on every other property both have, except the ID"""
+  if entity.type in DOCUMENT_LEVEL_TYPES:
+    return True
+  return all(
+    existing.properties[prop] == value
+    for prop, value in entity.properties.items()
+    if prop not in ('id', key[1]) and prop in existing.properties
+  )
+
+def _relationship_key(relationship: Relationship) -> Tuple:
+  return (
+    relationship.from_.type,
+    relationship.from_.id,
+    relationship.type,
+    relationship.to.type,
+    relationship.to.id,
+    json.dumps(relationship.properties, sort_keys=True, default=str)
+  )
+
+def merge_chunk_extractions(extractions: List[DocumentExtraction]) -> DocumentExtraction:
+  """Merge per-chunk extractions into one, reconciling the local IDs of each chunk.
+
+  An entity is merged into an entity of an earlier chunk with the same natural
+  key (the document-level entity of its type, or the same normalised name or
+  description) that does not contradict its properties, filling in the
+  properties missing from the earlier one. Each earlier entity takes at most
+  one entity per chunk, and entities of the same chunk are never merged, so
+  two line items with the same description stay apart. Other entities keep
+  their ID unless it is already taken by another chunk, in which case it gets
+  a chunk suffix. Relationships are rewritten to the merged IDs; only exact
+  duplicates, including their properties, are dropped.
+  """
+  entities: List[Entity] = []
+  by_key: Dict[Tuple, List[Entity]] = {}
+  used_ids = set()
+  relationships: Dict[Tuple, Relationship] = {}
+
+  for chunk_index, extraction in enumerate(extractions):
+    id_mapping: Dict[Tuple[EntityType, str], str] = {}
+    # Entities of earlier chunks already merged with one of this chunk, and the entities this chunk adds
+    claimed = set()
+    added: List[Tuple[Tuple, Entity]] = []
+    for entity in extraction.entities:
+      local_id = entity.properties.get('id')
+      key = _natural_key(entity)
+      existing = next(
+        (
+          candidate for candidate in by_key.get(key, [])
+          if id(candidate) not in claimed and _compatible(candidate, entity, key)
+        ),
+        None
+      ) if key is not None else None
+      if existing is not None:
+        claimed.add(id(existing))
+        for prop, value in entity.properties.items():
+          existing.properties.setdefault(prop, value)
+        id_mapping[(entity.type, local_id)] = existing.properties['id']
+        continue
+
+      merged = entity.model_copy(deep=True)
+      merged_id = local_id
+      if (entity.type, merged_id) in used_ids:
+        merged_id = f"{local_id}_chunk{chunk_index}"
+      merged.properties['id'] = merged_id
+      used_ids.add((entity.type, merged_id))
+      id_mapping[(entity.type, local_id)] = merged_id
+      entities.append(merged)
+      if key is not None:
+        added.append((key, merged))
+    for key, merged in added:
+      by_key.setdefault(key, []).append(merged)
+
+    for relationship in extraction.relationships:
+      merged = relationship.model_copy(deep=True)
+      merged.from_.id = id_mapping.get((merged.from_.type, merged.from_.id), merged.from_.id)
+      merged.to.id = id_mapping.get((merged.to.type, merged.to.id), merged.to.id)
+      relationships.setdefault(_relationship_key(merged), merged)
+
+  return DocumentExtraction(entities=entities, relationships=list(relationships.values()))
@@ -0,0 +1,163 @@
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from ..lib.artifact import read_artifact, write_artifact
+from .extraction_schema import DocumentExtraction, Entity, EntityRef, EntityType, Relationship, RelationshipType
+
+# Dimensions of the all-MiniLM-L6-v2 embeddings
+EMBEDDING_DIMENSIONS = 384
+
+# Layout version of the artifact structure written by CompactExtraction.to_artifact.
+# Artifacts of this version are trusted and loaded without validation, so bump it
+# whenever the layout or the extraction schema changes.
+ARTIFACT_STRUCTURE_VERSION = 1
+
+class CompactEntity:
+  """Entity without its embedding, which is a row of the extraction's embedding block"""
+  __slots__ = ('type', 'properties', 'row')
+
+  def __init__(self, type: EntityType, properties: Dict[str, Any], row: int = -1):
+    self.type = type
+    self.properties = properties
+    # Row in CompactExtraction.embeddings, -1 when the entity has no embedding
+    self.row = row
+
+class CompactRelationship:
+  __slots__ = ('type', 'from_type', 'from_id', 'to_type', 'to_id', 'properties')
+
+  def __init__(
+    self,
+    type: RelationshipType,
+    from_type: EntityType,
+    from_id: str,
+    to_type: EntityType,
+    to_id: str,
+    properties: Dict[str, Any]
+  ):
+    self.type = type
+    self.from_type = from_type
+    self.from_id = from_id
+    self.to_type = to_type
+    self.to_id = to_id
+    self.properties = properties
+
+class CompactExtraction:
+  """Internal form of a DocumentExtraction used between extraction and the graph write.
+
+  Embeddings of all entities of a document are kept in one contiguous float32
+  block instead of as lists of Python floats in each entity's properties.
+  Conversion to and from DocumentExtraction only happens at the cache boundaries.
+  """
+  __slots__ = ('entities', 'relationships', 'embeddings')
+
+  def __init__(
+    self,
+    entities: List[CompactEntity],
+    relationships: List[CompactRelationship],
+    embeddings: Optional[np.ndarray] = None
+  ):
+    self.entities = entities
+    self.relationships = relationships
+    self.embeddings = embeddings if embeddings is not None else np.empty((0, EMBEDDING_DIMENSIONS), dtype=np.float32)
+
+  @classmethod
+  def from_extraction(cls, extraction: DocumentExtraction) -> 'CompactExtraction':
+    """Convert a DocumentExtraction, moving any embedding properties into the block"""
+    entities = []
+    vectors = []
+    for entity in extraction.entities:
+      properties = dict(entity.properties)
+      embedding = properties.pop('embedding', None)
+      row = -1
+      if embedding is not None:
+        row = len(vectors)
+        vectors.append(embedding)
+      entities.append(CompactEntity(entity.type, properties, row))
+
+    relationships = [
+      CompactRelationship(r.type, r.from_.type, r.from_.id, r.to.type, r.to.id, dict(r.properties))
+      for r in extraction.relationships
+    ]
+    embeddings = np.asarray(vectors, dtype=np.float32) if vectors else None
+    return cls(entities, relationships, embeddings)
+
+  def copy(self) -> 'CompactExtraction':
+    """Copy with its own entity and relationship properties, sharing the embedding block"""
+    return CompactExtraction(
+      [CompactEntity(e.type, dict(e.properties), e.row) for e in self.entities],
+      [
+        CompactRelationship(r.type, r.from_type, r.from_id, r.to_type, r.to_id, dict(r.properties))
+        for r in self.relationships
+      ],
+      self.embeddings
+    )
+
+  def embedding(self, entity: CompactEntity) -> Optional[np.ndarray]:
+    """Embedding of an entity as a view into the block, or None"""
+    return self.embeddings[entity.row] if entity.row >= 0 else None
+
+  def set_embeddings(self, entities: List[CompactEntity], vectors: np.ndarray) -> None:
+    """Append embeddings for the given entities to the block"""
+    if not entities:
+      return
+    start = len(self.embeddings)
+    self.embeddings = np.concatenate([self.embeddings, np.asarray(vectors, dtype=np.float32)])
+    for offset, entity in enumerate(entities):
+      entity.row = start + offset
+
+  def entity_properties(self, entity: CompactEntity, include_embedding: bool = True) -> Dict[str, Any]:
+    """Properties of an entity including its embedding as a list, as stored in caches and the graph"""
+    if entity.row < 0 or not include_embedding:
+      return entity.properties
+    return {**entity.properties, 'embedding': self.embeddings[entity.row].tolist()}
+
+  def to_extraction(self) -> DocumentExtraction:
+    """Convert back to a DocumentExtraction without revalidating"""
+    return DocumentExtraction.model_construct(
+      entities=[
+        Entity.model_construct(type=entity.type, properties=self.entity_properties(entity))
+        for entity in self.entities
+      ],
+      relationships=[
+        Relationship.model_construct(
+          from_=EntityRef.model_construct(type=r.from_type, id=r.from_id),
+          to=EntityRef.model_construct(type=r.to_type, id=r.to_id),
+          type=r.type,
+          properties=r.properties
+        )
+        for r in self.relationships
+      ]
+    )
+
+  def to_artifact(self, path: Path, vector_dtype: str = 'float32') -> None:
+    """Write the extraction as a binary artifact with the embedding block stored as raw float32 or float16"""
+    structure = {
+      'entities': [[e.type.value, e.properties, e.row] for e in self.entities],
+      'relationships': [
+        [r.type.value, r.from_type.value, r.from_id, r.to_type.value, r.to_id, r.properties]
+        for r in self.relationships
+      ]
+    }
+    write_artifact(path, structure, self.embeddings, ARTIFACT_STRUCTURE_VERSION, vector_dtype)
+
+  @classmethod
+  def from_artifact(cls, path: Path) -> 'CompactExtraction':
+    """Load an extraction written by to_artifact without validating it.
+
+    The embedding block is a read-only view over the file contents, or a
+    float32 copy of it when the artifact stores float16.
+
+    Raises:
+      ArtifactError: The file is not an artifact of the current structure version
+    """
+    structure, vectors = read_artifact(path, ARTIFACT_STRUCTURE_VERSION)
+    entities = [CompactEntity(EntityType(type), properties, row) for type, properties, row in structure['entities']]
+    relationships = [
+      CompactRelationship(RelationshipType(type), EntityType(from_type), from_id, EntityType(to_type), to_id, properties)
+      for type, from_type, from_id, to_type, to_id, properties in structure['relationships']
+    ]
+    if not len(vectors):
+      return cls(entities, relationships)
+    return cls(entities, relationships, vectors.astype(np.float32, copy=False))
@@ -0,0 +1,122 @@
+import argparse
+import hashlib
+import json
+import random
+import time
+import traceback
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, List, Optional, TypedDict, TypeVar
+
+T = TypeVar('T')
+
+# Errors that come out the same on every attempt: validation failures that
+# survived repair and escalation, unsupported files, malformed input
+NON_RETRYABLE_ERRORS = (ValueError,)
+
+class StageError(Exception):
+  """A pipeline stage of a document failed on every attempt"""
+
+  def __init__(self, stage: str, error: BaseException, attempts: int):
+    super().__init__(f"{stage} failed after {attempts} attempts: {error}")
+    self.stage = stage
+    self.error = error
+    self.attempts = attempts
+
+def retry_stage(stage: str, func: Callable[[], T], attempts: int = 3, base_delay: float = 2.0) -> T:
+  """Run one stage of a document, retrying transient errors with exponential backoff and jitter.
+
+  Raises:
+    StageError: The stage failed with a non-retryable error or on every attempt
+  """
+  for attempt in range(1, attempts + 1):
+    try:
+      return func()
+    except NON_RETRYABLE_ERRORS as e:
+      raise StageError(stage, e, attempt) from e
+    except Exception as e:
+      if attempt == attempts:
+        raise StageError(stage, e, attempt) from e
+      delay = base_delay * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+      print(f"{stage} failed ({e}), retrying in {delay:.1f}s (attempt {attempt} of {attempts})")
+      time.sleep(delay)
+
+class DeadLetter(TypedDict):
+  path: str
+  stage: str
+  error_type: str
+  error: str
+  traceback: str
+  attempts: int
+  failed_at: str
+  artifacts: List[str]
+
+class DeadLetterStore:
+  """Documents that failed a stage on every attempt, one JSON file per document in .dead_letters/"""
+
+  def __init__(self, directory: str = '.dead_letters'):
+    self.directory = Path(directory)
+
+  def _letter_path(self, file_path: str) -> Path:
+    name = hashlib.md5(file_path.encode()).hexdigest()
+    return self.directory / f"{Path(file_path).name}.{name}.json"
+
+  def add(self, file_path: str, error: StageError, artifacts: List[Path]) -> None:
+    """Record a failed document with its error, stage and the cache artifacts it had produced"""
+    letter: DeadLetter = {
+      'path': file_path,
+      'stage': error.stage,
+      'error_type': type(error.error).__name__,
+      'error': str(error.error),
+      'traceback': ''.join(traceback.format_exception(error.error)),
+      'attempts': error.attempts,
+      'failed_at': datetime.now().isoformat(),
+      'artifacts': [str(artifact) for artifact in artifacts if artifact.exists()],
+    }
+    self.directory.mkdir(parents=True, exist_ok=True)
+    with open(self._letter_path(file_path), 'w') as f:
+      json.dump(letter, f, indent=2)
+    print(f"Dead-lettered {file_path} at stage {error.stage}: {error.error}")
+
+  def remove(self, file_path: str) -> None:
+    self._letter_path(file_path).unlink(missing_ok=True)
+
+  def get(self, file_path: str) -> Optional[DeadLetter]:
+    letter_path = self._letter_path(file_path)
+    if not letter_path.exists():
+      return None
+    with open(letter_path, 'r') as f:
+      return json.load(f)
+
+  def letters(self, stage: Optional[str] = None) -> List[DeadLetter]:
+    if not self.directory.exists():
+      return []
+    letters = []
+    for letter_path in sorted(self.directory.glob('*.json')):
+      with open(letter_path, 'r') as f:
+        letter = json.load(f)
+      if stage is None or letter['stage'] == stage:
+        letters.append(letter)
+    return letters
+
+def run_redrive():
+  from .loader import create_loader_from_env
+
+  parser = argparse.ArgumentParser(description="Process the dead-lettered documents again")
+  parser.add_argument('--stage', help="Only re-drive documents that failed at this stage")
+  parser.add_argument('--list', action='store_true', help="List the dead letters without processing them")
+  args = parser.parse_args()
+
+  store = DeadLetterStore()
+  letters = store.letters(args.stage)
+  if args.list:
+    for letter in letters:
+      print(f"{letter['path']}: {letter['stage']} {letter['error_type']}: {letter['error']}")
+    return
+
+  loader = create_loader_from_env()
+  recovered = sum(loader.process_file_isolated(letter['path']) for letter in letters)
+  print(f"Re-drove {len(letters)} dead letters, {recovered} succeeded")
+
+if __name__ == "__main__":
+  run_redrive()
@@ -0,0 +1,177 @@
+import difflib
+import glob
+import re
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from ..lib.llm import LLMClient
+from .document_entity_extractor_agent import infer_document_type
+from .extraction_repair import ExtractionRepairError, repair_truncated_json, strip_fences
+from .extraction_schema import DocumentExtraction, Entity, EntityType, Relationship
+
+if TYPE_CHECKING:
+  from .loader import DocumentLoader, ParsedContent
+
+# Recurring documents end in their period, e.g. RENT-MAIN-202301, INV-CLI001-202301, paystub_E001_202301
+SERIES_PATTERN = re.compile(r'^(?P<series>.*?[-_])(?P<period>\d{6})$')
+
+DELTA_INSTRUCTIONS = """You update the extraction of a recurring document for a new period.
+You are given the extraction of the previous period's document and a unified diff
+from the previous document's text to the new one.
+Output only what changed, as a JSON object:
+{
+  "entities": [entities that are new or whose properties changed, with all their properties; keep the previous id for changed entities],
+  "removed_entity_ids": [ids of entities that no longer appear],
+  "relationships": [relationships that are new or whose properties changed, in the same format as the previous extraction],
+  "removed_relationships": [{"from_": {"type", "id"}, "to": {"type", "id"}, "type": ...} of relationships that no longer apply]
+}
+Unchanged entities and relationships must not be repeated.
+Output the JSON string only, nothing else."""
+
+def series_key(file_path: str) -> Optional[Tuple[str, str]]:
+  """Split a recurring document path into its series (path without the period) and period"""
+  path = Path(file_path)
+  match = SERIES_PATTERN.match(path.stem)
+  if not match:
+    return None
+  return f"{match.group('series')}{path.suffix}", match.group('period')
+
+class DeltaExtractor:
+  """Extracts recurring documents as a change against the previous period.
+
+  The most similar earlier document of the same series that already has a
+  cached extraction is used as a template. The LLM gets that extraction and a
+  diff of the document text and only returns what changed, which is applied to
+  the template and validated. When there is no close enough template, or the
+  result does not validate, the caller falls back to a full extraction.
+  """
+
+  def __init__(self, loader: 'DocumentLoader', min_similarity: float = 0.6, max_candidates: int = 3):
+    self.loader = loader
+    self.min_similarity = min_similarity
+    self.max_candidates = max_candidates
+
+  def find_template(self, parsed_content: 'ParsedContent') -> Optional[Tuple['ParsedContent', DocumentExtraction, float]]:
+    """Find the most similar previously extracted document of the same series"""
+    key = series_key(parsed_content['file_name'])
+    if key is None:
+      return None
+    series, period = key
+    path = Path(parsed_content['file_name'])
+    prefix = path.stem[:-len(period)]
+
+    candidates = []
+    # Cache files are named <file path>.<content hash>.json
+    for cache_path in Path('.extracted').glob(f"**/{glob.escape(prefix)}??????{path.suffix}.*.json"):
+      file_name = str(cache_path.relative_to('.extracted').with_suffix('').with_suffix(''))
+      candidate_key = series_key(file_name)
+      if candidate_key and candidate_key[0] == series and candidate_key[1] < period and Path(file_name).exists():
+        candidates.append((candidate_key[1], file_name))
+    # Only the latest periods of the series, the closest matches are usually the previous months
+    candidates = sorted(set(candidates), reverse=True)[:self.max_candidates]
+
+    best = None
+    for _, file_name in candidates:
+      candidate_content, _ = self.loader.prepare_content(file_name)
+      cache_path = self.loader.extraction_cache_path(candidate_content)
+      if not cache_path.exists():
+        continue
+      similarity = difflib.SequenceMatcher(None, candidate_content['markdown'], parsed_content['markdown']).ratio()
+      if similarity >= self.min_similarity and (best is None or similarity > best[2]):
+        best = (candidate_content, DocumentExtraction.model_validate_json(cache_path.read_text()), similarity)
+    return best
+
+  def extract(self, parsed_content: 'ParsedContent', processed_at: str) -> Optional[DocumentExtraction]:
+    """Extract a document as a delta against its template, or return None to extract it in full"""
+    template = self.find_template(parsed_content)
+    if template is None:
+      return None
+    template_content, template_extraction, similarity = template
+    print(f"Delta extraction of {parsed_content['file_name']} against {template_content['file_name']} (similarity {similarity:.2f})")
+
+    diff = "\n".join(difflib.unified_diff(
+      template_content['markdown'].splitlines(),
+      parsed_content['markdown'].splitlines(),
+      fromfile=template_content['file_name'],
+      tofile=parsed_content['file_name'],
+      lineterm=''
+    ))
+    document_type = infer_document_type(parsed_content['file_name'])
+    route = self.loader.model_router.route(document_type, len(diff) // 4)
+
+    response = LLMClient().chat.completions.create(
+      model=route['model'],
+      timeout=route['timeout'],
+      max_tokens=route['max_tokens'],
+      messages=[
+        {'role': 'system', 'content': DELTA_INSTRUCTIONS},
+        {'role': 'user', 'content': f"Previous extraction:\n{template_extraction.model_dump_json()}\n\nDiff:\n{diff}"}
+      ]
+    )
+    usage = getattr(response, 'usage', None)
+    if usage is not None:
+      print(f"Delta extraction used {usage.completion_tokens} output tokens")
+
+    try:
+      data, _ = repair_truncated_json(strip_fences(response.choices[0].message.content))
+      document_extraction = apply_delta(template_extraction, data, parsed_content['file_name'], processed_at)
+    except (ExtractionRepairError, ValidationError, ValueError) as e:
+      print(f"Delta extraction failed validation, extracting in full: {e}")
+      return None
+    self.loader.model_router.record(parsed_content['file_name'], route)
+    return document_extraction
+
+def _relationship_key(relationship: Relationship) -> Tuple:
+  return (relationship.from_.type, relationship.from_.id, relationship.type, relationship.to.type, relationship.to.id)
+
+def apply_delta(template: DocumentExtraction, delta: dict, file_name: str, processed_at: str) -> DocumentExtraction:
+  """Apply a delta response to the template extraction and validate the result.
+
+  The Document entity always gets the new path and processing time, whatever the delta says.
+
+  Raises:
+    ValueError: The delta is malformed or leaves relationships pointing at missing entities
+  """
+  if not isinstance(delta, dict):
+    raise ValueError("Delta is not a JSON object")
+
+  entities = {(e.type, e.properties.get('id')): e.model_copy(deep=True) for e in template.entities}
+  removed_ids = set(delta.get('removed_entity_ids') or [])
+  entities = {key: e for key, e in entities.items() if key[1] not in removed_ids}
+  for item in delta.get('entities') or []:
+    entity = Entity.model_validate(item)
+    key = (entity.type, entity.properties.get('id'))
+    if key in entities:
+      entities[key].properties.update(entity.properties)
+    else:
+      entities[key] = entity
+
+  relationships = {
+    _relationship_key(r): r.model_copy(deep=True)
+    for r in template.relationships
+    if r.from_.id not in removed_ids and r.to.id not in removed_ids
+  }
+  for item in delta.get('removed_relationships') or []:
+    removed = Relationship.model_validate({**item, 'properties': item.get('properties') or {}})
+    relationships.pop(_relationship_key(removed), None)
+  for item in delta.get('relationships') or []:
+    relationship = Relationship.model_validate(item)
+    relationships[_relationship_key(relationship)] = relationship
+
+  for entity in entities.values():
+    if entity.type == EntityType.DOCUMENT:
+      entity.properties['path'] = file_name
+      entity.properties['processedAt'] = processed_at
+
+  missing: List[str] = [
+    f"{ref.type.value} {ref.id}"
+    for relationship in relationships.values()
+    for ref in (relationship.from_, relationship.to)
+    if (ref.type, ref.id) not in entities
+  ]
+  if missing:
+    raise ValueError(f"Relationships reference missing entities: {', '.join(missing)}")
+
+  return DocumentExtraction(entities=list(entities.values()), relationships=list(relationships.values()))
@@ -1,10 +1,12 @@
-from typing import TypedDict
+from typing import NotRequired, Optional, TypedDict
 from swarm import Agent
-from src.graph.extraction_schema import DocumentExtraction
+from src.graph.extraction_schema import COMPACT_EXTRACTION_SCHEMA, DocumentExtraction
 
 class AgentContextVariables(TypedDict):
   document_path: str
   document_processed_at: str
+  # Use the compact output format, for agents whose output is constrained by EXTRACTION_RESPONSE_FORMAT
+  structured_output: NotRequired[bool]
 
 OUTPUT_FORMAT = f"""
 Output your findings as a list of triplets in the following schema:
@@ -54,6 +56,28 @@ Foe example:
 Output the JSON string only, nothing else.
 """
 
+# Structured output already constrains the response to the schema, so the
+# prompt only has to explain how entities and relationships refer to each other
+COMPACT_OUTPUT_FORMAT = """
+Output a JSON object with "entities" and "relationships".
+Each entity has a "type" and "properties", including a unique "id" such as "organization_1".
+Each relationship has "from_" and "to" references ({"type", "id"}) to entities by their id, a "type" and "properties".
+"""
+
+EXTRACTION_RESPONSE_FORMAT = {
+  'type': 'json_schema',
+  'json_schema': {
+    'name': 'document_extraction',
+    'schema': COMPACT_EXTRACTION_SCHEMA,
+    # Entity and relationship properties are free-form, which strict mode does not allow
+    'strict': False
+  }
+}
+
+def output_format(context_variables: AgentContextVariables) -> str:
+  """Output format section of the parsing agent instructions"""
+  return COMPACT_OUTPUT_FORMAT if context_variables.get('structured_output') else OUTPUT_FORMAT
+
 def invoice_parsing_agent_instructions(context_variables: AgentContextVariables):
   return f"""You analyze invoices to extract entities and their relationships according to the following schema:
 
@@ -74,7 +98,7 @@ RELATIONSHIP TYPES:
 2. Document Flow:
 - (Invoice) MENTIONED_IN (Document) (confidence*=1.0)
 
-{OUTPUT_FORMAT}
+{output_format(context_variables)}
 
 Here are additional contexts:
 - Document Path: {context_variables['document_path']}
@@ -99,7 +123,7 @@ RELATIONSHIP TYPES:
 2. Document Flow:
 - (Contract) MENTIONED_IN (Document) (confidence*=1.0)
 
-{OUTPUT_FORMAT}
+{output_format(context_variables)}
 
 Here are additional contexts:
 - Document Path: {context_variables['document_path']}
@@ -131,7 +155,7 @@ RELATIONSHIP TYPES:
 3. Document Flow:
 - (Payroll) MENTIONED_IN (Document) (confidence*=1.0)
 
-{OUTPUT_FORMAT}
+{output_format(context_variables)}
 
 Here are additional contexts:
 - Document Path: {context_variables['document_path']}
@@ -185,5 +209,30 @@ def get_triage_agent():
   """Get the triage agent"""
   return triage_agent
 
-
-__all__ = ["get_triage_agent"]
+PARSING_AGENTS = {
+  'invoice': invoice_parsing_agent,
+  'contract': contract_parsing_agent,
+  'paystub': paystub_parsing_agent,
+}
+
+def get_parsing_agent(document_type: str) -> Agent:
+  """Get the parsing agent for a document type (invoice, contract or paystub)"""
+  return PARSING_AGENTS[document_type]
+
+def infer_document_type(document_path: str) -> Optional[str]:
+  """Guess the document type from its path without calling the triage agent.
+
+  Returns None when the path does not identify the type, in which case the
+  triage agent has to decide.
+  """
+  path = document_path.lower()
+  if 'contract' in path:
+    return 'contract'
+  if 'invoice' in path:
+    return 'invoice'
+  if 'payroll' in path or 'paystub' in path:
+    return 'paystub'
+  return None
+
+
+__all__ = ["get_triage_agent", "get_parsing_agent", "infer_document_type", "EXTRACTION_RESPONSE_FORMAT"]
@@ -0,0 +1,56 @@
+from collections import defaultdict
+from typing import Dict, List
+
+from .compact import CompactExtraction
+from .extraction_schema import EntityType
+
+# Appended to the SET of a relationship write: the paths of the documents that
+# wrote the relationship, so a changed document can take back its share of it
+SET_RELATIONSHIP_SOURCES = "r.sources = [source IN coalesce(r.sources, []) WHERE source <> $path] + $path"
+
+def document_entity_keys(extraction: CompactExtraction) -> List[str]:
+  """'<type>:<id>' of the resolved entities a document writes, stored on its Document node"""
+  keys = (
+    f"{entity.type.value}:{entity.properties['id']}"
+    for entity in extraction.entities
+    if entity.type != EntityType.DOCUMENT
+  )
+  return list(dict.fromkeys(keys))
+
+def remove_document_contributions(tx, file_path: str, entity_keys: List[str]) -> None:
+  """Remove what an earlier version of a document wrote, before its new version is written.
+
+  Relationships of the Document node are deleted. Relationships between its
+  entities drop the document from their sources and are deleted when no other
+  document wrote them; entities left without any relationship are deleted.
+  Entities and relationships shared with other documents are kept.
+  """
+  tx.run("MATCH (:Document {path: $path})-[r]-() DELETE r", path=file_path)
+
+  ids_by_type: Dict[str, List[str]] = defaultdict(list)
+  for key in entity_keys:
+    entity_type, _, entity_id = key.partition(':')
+    ids_by_type[entity_type].append(entity_id)
+  for entity_type, ids in ids_by_type.items():
+    tx.run(
+      f"""
+      MATCH (e:`{entity_type}`)-[r]-()
+      WHERE e.id IN $ids AND $path IN r.sources
+      WITH DISTINCT r
+      SET r.sources = [source IN r.sources WHERE source <> $path]
+      WITH r
+      WHERE size(r.sources) = 0
+      DELETE r
+      """,
+      ids=ids,
+      path=file_path
+    )
+  for entity_type, ids in ids_by_type.items():
+    tx.run(
+      f"""
+      MATCH (e:`{entity_type}`)
+      WHERE e.id IN $ids AND NOT EXISTS {{ (e)--() }}
+      DELETE e
+      """,
+      ids=ids
+    )
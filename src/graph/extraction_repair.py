@@ -0,0 +1,261 @@
+import json
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from ..lib.llm import LLMClient
+from .extraction_schema import DocumentExtraction, Entity, Relationship
+
+FENCE_PATTERN = re.compile(r'```(?:json)?\s*(.*?)(?:```|$)', re.DOTALL)
+
+REASK_INSTRUCTIONS = """You fix document extractions that failed validation.
+Return a JSON object with "entities" and "relationships" containing only the corrected
+or missing items, not the ones that are already valid.
+Each entity has a "type" and "properties", including its "id".
+Each relationship has "from_" and "to" references ({"type", "id"}), a "type" and "properties".
+Output the JSON string only, nothing else."""
+
+class ExtractionRepairError(ValueError):
+  pass
+
+class RepairStats:
+  """Counts how failed extractions were repaired and the tokens spent compared with full retries"""
+
+  def __init__(self):
+    self.failures = 0
+    self.repaired = 0
+    self.reasks = 0
+    self.reask_tokens = 0
+    self.full_retry_tokens = 0
+    self.dropped_items = 0
+    self._lock = threading.Lock()
+
+  def record(self, repaired: bool, reasked: bool, reask_tokens: int, full_retry_tokens: int, dropped_items: int) -> None:
+    with self._lock:
+      self.failures += 1
+      self.repaired += int(repaired)
+      self.reasks += int(reasked)
+      self.reask_tokens += reask_tokens
+      self.dropped_items += dropped_items
+      if repaired:
+        self.full_retry_tokens += full_retry_tokens
+
+  def summary(self) -> Dict[str, Any]:
+    with self._lock:
+      return {
+        'failures': self.failures,
+        'repaired': self.repaired,
+        'success_rate': self.repaired / self.failures if self.failures else None,
+        'reasks': self.reasks,
+        'dropped_items': self.dropped_items,
+        'reask_tokens': self.reask_tokens,
+        'tokens_saved': self.full_retry_tokens - self.reask_tokens,
+      }
+
+def strip_fences(text: str) -> str:
+  """Remove markdown code fences and any prose around the outermost JSON object"""
+  match = FENCE_PATTERN.search(text)
+  if match:
+    text = match.group(1)
+  start = text.find('{')
+  if start == -1:
+    return text.strip()
+  end = text.rfind('}')
+  # Keep everything after the last brace when the output was cut off mid-object
+  return text[start:end + 1] if end > start and _parses(text[start:end + 1]) else text[start:].strip()
+
+def _parses(text: str) -> bool:
+  try:
+    json.loads(text)
+    return True
+  except json.JSONDecodeError:
+    return False
+
+def repair_truncated_json(text: str) -> Tuple[Any, bool]:
+  """Parse JSON that may have been cut off, dropping the incomplete trailing element.
+
+  Returns:
+    The parsed value and whether anything had to be cut off
+  """
+  try:
+    return json.loads(text), False
+  except json.JSONDecodeError:
+    pass
+
+  # Points inside arrays where the text can be cut so that only complete
+  # elements remain, with the brackets that are open at that point
+  cut_points: List[Tuple[int, str]] = []
+  stack = []
+  in_string = False
+  escaped = False
+  for index, char in enumerate(text):
+    if in_string:
+      if escaped:
+        escaped = False
+      elif char == '\\':
+        escaped = True
+      elif char == '"':
+        in_string = False
+      continue
+    if char == '"':
+      in_string = True
+    elif char in '{[':
+      stack.append('}' if char == '{' else ']')
+      if char == '[':
+        cut_points.append((index + 1, ''.join(reversed(stack))))
+    elif char in '}]':
+      if stack:
+        stack.pop()
+      if not stack or stack[-1] == ']':
+        cut_points.append((index + 1, ''.join(reversed(stack))))
+    elif char == ',' and stack and stack[-1] == ']':
+      cut_points.append((index, ''.join(reversed(stack))))
+
+  for index, closers in reversed(cut_points):
+    try:
+      return json.loads(text[:index] + closers), True
+    except json.JSONDecodeError:
+      continue
+  raise ExtractionRepairError("Could not repair truncated JSON")
+
+def salvage_extraction(data: Any) -> Tuple[DocumentExtraction, List[Dict[str, Any]]]:
+  """Keep the entities and relationships that validate, and describe the ones that do not.
+
+  Relationships pointing at entities that are not in the extraction are dropped as well.
+
+  Returns:
+    The valid part of the extraction and a list of invalid items with their errors
+
+  Raises:
+    ExtractionRepairError: The output is not shaped like an extraction, or none of its entities is valid
+  """
+  if not isinstance(data, dict):
+    raise ExtractionRepairError(f"Extraction is not a JSON object: {type(data).__name__}")
+  if not isinstance(data.get('entities'), list):
+    raise ExtractionRepairError(f"Extraction has no entities list, keys: {', '.join(map(str, data)) or 'none'}")
+
+  invalid = []
+  entities = []
+  for item in data['entities']:
+    try:
+      entities.append(Entity.model_validate(item))
+    except ValidationError as e:
+      invalid.append({'kind': 'entity', 'item': item, 'errors': _error_messages(e)})
+  if not entities:
+    raise ExtractionRepairError(f"No valid entity in the extraction, {len(invalid)} invalid")
+
+  entity_keys = {(e.type, e.properties.get('id')) for e in entities}
+  relationships = []
+  for item in data.get('relationships') or []:
+    try:
+      relationship = Relationship.model_validate(item)
+    except ValidationError as e:
+      invalid.append({'kind': 'relationship', 'item': item, 'errors': _error_messages(e)})
+      continue
+    missing = [
+      f"{ref.type.value} {ref.id} is not an extracted entity"
+      for ref in (relationship.from_, relationship.to)
+      if (ref.type, ref.id) not in entity_keys
+    ]
+    if missing:
+      invalid.append({'kind': 'relationship', 'item': item, 'errors': missing})
+      continue
+    relationships.append(relationship)
+
+  return DocumentExtraction(entities=entities, relationships=relationships), invalid
+
+def _error_messages(error: ValidationError) -> List[str]:
+  return [f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" for e in error.errors()]
+
+class ExtractionRepairer:
+  """Repairs extraction output that failed to parse or validate.
+
+  The output is first fixed locally: code fences and surrounding prose are
+  stripped, truncated JSON is closed after its last complete element and
+  invalid entities or relationships are dropped. Only when items were dropped
+  or the output was truncated is a short follow-up prompt sent, containing the
+  validation errors and the ids of the valid entities, not the document.
+  """
+
+  def __init__(self, stats: Optional[RepairStats] = None, llm_client: Optional[LLMClient] = None):
+    self.stats = stats or RepairStats()
+    self.llm_client = llm_client
+
+  def repair(self, raw_output: str, model: str, full_retry_tokens: int, document: Optional[str] = None) -> DocumentExtraction:
+    """Repair raw extraction output.
+
+    Args:
+      raw_output: The response content that failed validation
+      model: Model to send the follow-up prompt to
+      full_retry_tokens: Estimated tokens of extracting the whole document again
+      document: Document content, only sent when the output was truncated so
+        the model can produce the items that were cut off
+
+    Returns:
+      The repaired DocumentExtraction
+    """
+    reask_tokens = 0
+    reasked = False
+    dropped = 0
+    try:
+      data, truncated = repair_truncated_json(strip_fences(raw_output))
+      extraction, invalid = salvage_extraction(data)
+      dropped = len(invalid)
+      if invalid or truncated:
+        reasked = True
+        followup, reask_tokens = self._reask(extraction, invalid, truncated and document, model)
+        extraction = self._merge(extraction, followup)
+    except ExtractionRepairError:
+      self.stats.record(False, reasked, reask_tokens, full_retry_tokens, dropped)
+      raise
+    self.stats.record(True, reasked, reask_tokens, full_retry_tokens, dropped)
+    print(f"Repaired extraction: {dropped} invalid items, follow-up prompt: {reasked}")
+    return extraction
+
+  def _reask(self, extraction: DocumentExtraction, invalid: List[Dict[str, Any]], truncated_document: Optional[str], model: str) -> Tuple[DocumentExtraction, int]:
+    problems = []
+    if truncated_document:
+      problems.append(
+        "Your output was truncated. Add the entities and relationships that were cut off, "
+        f"based on this document:\n{truncated_document}"
+      )
+    for entry in invalid:
+      problems.append(f"Invalid {entry['kind']}: {json.dumps(entry['item'], default=str)}\nErrors: {'; '.join(entry['errors'])}")
+    valid_ids = [f"{e.type.value} {e.properties.get('id')}" for e in extraction.entities]
+
+    llm_client = self.llm_client or LLMClient()
+    response = llm_client.chat.completions.create(
+      model=model,
+      messages=[
+        {'role': 'system', 'content': REASK_INSTRUCTIONS},
+        {'role': 'user', 'content': "Valid entities: " + ", ".join(valid_ids) + "\n\n" + "\n\n".join(problems)}
+      ]
+    )
+    usage = getattr(response, 'usage', None)
+    tokens = usage.total_tokens if usage is not None else 0
+
+    try:
+      data, _ = repair_truncated_json(strip_fences(response.choices[0].message.content))
+    except ExtractionRepairError:
+      print("Follow-up response could not be parsed, keeping the valid part of the extraction")
+      return DocumentExtraction(entities=[], relationships=[]), tokens
+    if not isinstance(data, dict):
+      return DocumentExtraction(entities=[], relationships=[]), tokens
+    try:
+      followup, still_invalid = salvage_extraction({
+        # Relationships may point at entities from the first response, so validate them together
+        'entities': [e.model_dump() for e in extraction.entities] + list(data.get('entities') or []),
+        'relationships': data.get('relationships') or []
+      })
+    except ExtractionRepairError:
+      return DocumentExtraction(entities=[], relationships=[]), tokens
+    if still_invalid:
+      print(f"Dropping {len(still_invalid)} items that are still invalid after the follow-up prompt")
+    return followup, tokens
+
+  def _merge(self, extraction: DocumentExtraction, followup: DocumentExtraction) -> DocumentExtraction:
+    keys = {(e.type, e.properties.get('id')) for e in extraction.entities}
+    entities = extraction.entities + [e for e in followup.entities if (e.type, e.properties.get('id')) not in keys]
+    return DocumentExtraction(entities=entities, relationships=extraction.relationships + followup.relationships)
@@ -64,3 +64,53 @@ class DocumentExtraction(BaseModel):
   """Complete extraction result from a document"""
   entities: List[Entity] = Field(..., description="List of entities found in the document")
   relationships: List[Relationship] = Field(..., description="List of relationships between entities")
+
+# Entity types that are embedded and resolved against existing entities in the graph
+ENTITY_RESOLUTION_TYPES = [
+  EntityType.ORGANIZATION,
+  EntityType.EMPLOYEE,
+  EntityType.DEPARTMENT,
+  EntityType.COST_CENTER,
+  EntityType.SERVICE_ITEM,
+]
+
+ENTITY_REF_SCHEMA = {
+  'type': 'object',
+  'properties': {
+    'type': {'type': 'string', 'enum': [t.value for t in EntityType]},
+    'id': {'type': 'string'}
+  },
+  'required': ['type', 'id']
+}
+
+# Compact JSON schema of DocumentExtraction without field descriptions, used for structured output
+COMPACT_EXTRACTION_SCHEMA = {
+  'type': 'object',
+  'properties': {
+    'entities': {
+      'type': 'array',
+      'items': {
+        'type': 'object',
+        'properties': {
+          'type': {'type': 'string', 'enum': [t.value for t in EntityType]},
+          'properties': {'type': 'object'}
+        },
+        'required': ['type', 'properties']
+      }
+    },
+    'relationships': {
+      'type': 'array',
+      'items': {
+        'type': 'object',
+        'properties': {
+          'from_': ENTITY_REF_SCHEMA,
+          'to': ENTITY_REF_SCHEMA,
+          'type': {'type': 'string', 'enum': [t.value for t in RelationshipType]},
+          'properties': {'type': 'object'}
+        },
+        'required': ['from_', 'to', 'type', 'properties']
+      }
+    }
+  },
+  'required': ['entities', 'relationships']
+}
@@ -0,0 +1,119 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional, TypedDict
+
+# Stages of a document in process_file, in order
+STAGES = ['parsed', 'extracted', 'embedded', 'written']
+
+class JournalEntry(TypedDict):
+  path: str
+  size: int
+  mtime_ns: int
+  digest: Optional[str]
+  stage: str
+  at: float
+
+class CheckpointJournal:
+  """Append-only journal of the stages each document has completed.
+
+  Every completed stage is appended as one JSON line and fsynced, so the
+  journal survives a crash at any point; a torn last line is ignored on load.
+  A file counts as unchanged while its size and modification time match the
+  journal, so a restarted run skips finished documents without hashing or
+  reading them. Appends and compaction hold an exclusive flock on a separate
+  lock file, which makes the journal safe to share between threads and
+  processes. Compaction rewrites the journal with only the latest entry per
+  document and replaces it atomically.
+  """
+
+  def __init__(self, path: str = '.journal/loader.jsonl', compact_every: int = 500):
+    self.path = Path(path)
+    self.lock_path = self.path.with_suffix('.lock')
+    self.compact_every = compact_every
+    self.entries: Dict[str, JournalEntry] = {}
+    self._appended = 0
+    self._lock = threading.Lock()
+    self.path.parent.mkdir(parents=True, exist_ok=True)
+    with self._locked():
+      self.entries = self._read()
+
+  @contextmanager
+  def _locked(self) -> Iterator[None]:
+    with self._lock, open(self.lock_path, 'a') as lock_file:
+      fcntl.flock(lock_file, fcntl.LOCK_EX)
+      try:
+        yield
+      finally:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+  def _read(self) -> Dict[str, JournalEntry]:
+    entries: Dict[str, JournalEntry] = {}
+    if not self.path.exists():
+      return entries
+    with open(self.path, 'r') as f:
+      for line in f:
+        try:
+          entry = json.loads(line)
+        except json.JSONDecodeError:
+          # Torn write of a crashed process
+          continue
+        entries[entry['path']] = entry
+    return entries
+
+  def completed(self, file_path: str, stage: str) -> bool:
+    """Whether the unchanged file has completed the given stage"""
+    entry = self.entries.get(file_path)
+    if entry is None or STAGES.index(entry['stage']) < STAGES.index(stage):
+      return False
+    try:
+      stat = os.stat(file_path)
+    except FileNotFoundError:
+      return False
+    return entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+
+  def record(self, file_path: str, stage: str, digest: Optional[str] = None) -> None:
+    """Append a completed stage of a document, compacting the journal every compact_every appends"""
+    stat = os.stat(file_path)
+    previous = self.entries.get(file_path)
+    if digest is None and previous is not None and previous['size'] == stat.st_size and previous['mtime_ns'] == stat.st_mtime_ns:
+      digest = previous['digest']
+    entry: JournalEntry = {
+      'path': file_path,
+      'size': stat.st_size,
+      'mtime_ns': stat.st_mtime_ns,
+      'digest': digest,
+      'stage': stage,
+      'at': time.time(),
+    }
+    with self._locked():
+      with open(self.path, 'a') as f:
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+      self.entries[file_path] = entry
+      self._appended += 1
+      if self._appended >= self.compact_every:
+        self._compact()
+
+  def compact(self) -> None:
+    """Rewrite the journal with only the latest entry per document"""
+    with self._locked():
+      self._compact()
+
+  def _compact(self) -> None:
+    # Other processes may have appended since this one loaded the journal
+    entries = self._read()
+    temp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+    with open(temp_path, 'w') as f:
+      for entry in entries.values():
+        f.write(json.dumps(entry) + "\n")
+      f.flush()
+      os.fsync(f.fileno())
+    os.replace(temp_path, self.path)
+    self.entries = entries
+    self._appended = 0
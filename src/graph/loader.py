@@ -4,27 +4,54 @@ import json
 import mimetypes
 import os
 import string
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List, TypedDict
+from typing import Any, Callable, Dict, List, Literal, Optional, Tuple, TypedDict, Union
 
 import numpy as np
 from pydantic import ValidationError
 import shortuuid
-from neo4j import GraphDatabase
-from sentence_transformers import SentenceTransformer
-from swarm import Swarm
-
+from neo4j import GraphDatabase, Session
+from swarm import Agent, Swarm
+
+from ..lib.artifact import VECTOR_DTYPES, ArtifactError
+from ..lib.embedding_backends import EmbeddingBackend, canonical_backend_spec, create_embedding_backend
+from ..lib.embedding_server import EmbeddingClient
+from ..lib.file_streams import file_md5, write_text_atomic
+from ..lib.llm import LLMClient
+from ..lib.adaptive_concurrency import concurrency_windows, get_concurrency_limiter
+from ..lib.rate_limiter import rate_limit_metrics
+from ..lib.single_flight import SingleFlight
 from ..lib.llama_parse import (
   SUPPORTED_MIME_TYPES,
+  JsonJobResult,
   LlamaParseClient,
   MarkdownJobResult
 )
+from .chunking import merge_chunk_extractions, split_markdown
+from .compact import CompactExtraction, CompactRelationship
+from .delta_extraction import DeltaExtractor
 from .document_entity_extractor_agent import (
+  EXTRACTION_RESPONSE_FORMAT,
+  get_parsing_agent,
   get_triage_agent,
+  infer_document_type,
   AgentContextVariables
 )
-from .extraction_schema import DocumentExtraction, EntityType
+from .dead_letters import DeadLetterStore, StageError, retry_stage
+from .document_versions import SET_RELATIONSHIP_SOURCES, document_entity_keys, remove_document_contributions
+from .extraction_repair import ExtractionRepairError, ExtractionRepairer
+from .extraction_schema import ENTITY_RESOLUTION_TYPES, DocumentExtraction, EntityType
+from .journal import CheckpointJournal
+from .model_routing import ModelRouter, Route
+from .packing import PackedExtractor
+from .resolution_keys import ResolutionIndex, resolution_keys
+from .scheduling import WorkItem, makespan_report, plan_work
+from .streaming import StreamingExtractor
+from .table_extraction import LineItemTable, merge_table_items, split_tables
+from .vector_storage import GRAPH_VECTOR_TYPES, set_vector_clause
 
 
 # Add this type definition before the DocumentLoader class
@@ -32,23 +59,100 @@ class ParsedContent(TypedDict):
   file_name: str
   markdown: str
 
-ENTITY_RESOLUTION_TYPES = [
-  EntityType.ORGANIZATION,
-  EntityType.EMPLOYEE,
-  EntityType.DEPARTMENT,
-  EntityType.COST_CENTER,
-  EntityType.SERVICE_ITEM,
-]
-
 class DocumentLoader:
-  def __init__(self, neo4j_uri: str, neo4j_user: str, neo4j_password: str, llama_parse_api_key: str):
-    """Initialize connections to Neo4j and LlamaParse"""
+  def __init__(
+    self,
+    neo4j_uri: str,
+    neo4j_user: str,
+    neo4j_password: str,
+    llama_parse_api_key: str,
+    table_extraction: bool = False,
+    structured_output: bool = False,
+    chunk_tokens: Optional[int] = None,
+    pack_token_budget: Optional[int] = None,
+    delta_extraction: bool = False,
+    stream_extraction: bool = False,
+    journal_path: Optional[str] = None,
+    stage_attempts: int = 3,
+    max_workers: int = 1,
+    schedule_policy: str = 'longest-first',
+    embedding_server: Optional[str] = None,
+    embedding_backend: Optional[str] = None,
+    embedding_threads: Optional[int] = None,
+    cache_vector_dtype: str = 'float32',
+    graph_vector_type: str = 'list'
+  ):
+    """Initialize connections to Neo4j and LlamaParse
+
+    Args:
+      table_extraction: Request JSON results from LlamaParse and map line item
+        tables straight into entities, sending only the remainder to the LLM
+      structured_output: Request schema-constrained output from the parsing agents
+        with a compact schema in the prompt instead of the full JSON schema
+      chunk_tokens: Split documents longer than this many tokens (estimated at
+        4 characters per token) on pages or headings and extract the chunks
+        concurrently; None extracts every document in one prompt
+      pack_token_budget: Extract small documents of the same type several at a
+        time in one request of at most this many document tokens; None disables packing
+      delta_extraction: Extract recurring documents (e.g. RENT-MAIN-YYYYMM) as a
+        change against the most similar extracted document of the same series
+      stream_extraction: Stream the extraction of documents that are extracted in
+        one prompt, embedding and resolving entities while the response is generated
+      journal_path: Record the completed stages of each document in a checkpoint
+        journal at this path, so a restarted run skips documents already written
+      stage_attempts: Attempts per pipeline stage before a document is moved to
+        the dead-letter store and the run continues with the next document
+      max_workers: Documents processed in parallel by process_directory
+      schedule_policy: Order in which process_directory starts documents, one of
+        SCHEDULE_POLICIES ('longest-first', 'recent-first', 'path')
+      embedding_server: Socket path of a shared embedding server to encode with
+        instead of loading the embedding model in this process
+      embedding_backend: Backend that runs the embedding model in this process,
+        'sentence-transformers' (None) or 'onnx[:<model dir>]' for the int8 ONNX
+        export; with an embedding server, the backend it must serve, None for any
+      embedding_threads: CPU threads of the embedding backend, None for its default
+      cache_vector_dtype: Type of the vectors in the embedding cache, 'float32' or 'float16'
+      graph_vector_type: How embeddings are stored on nodes, 'list' for a list of
+        64-bit floats or 'float32' for a float32 vector property
+    """
     self.neo4j_uri = neo4j_uri
     self.neo4j_user = neo4j_user
     self.neo4j_password = neo4j_password
     self.llama_parse_api_key = llama_parse_api_key
     self.llama_parse_client = LlamaParseClient(llama_parse_api_key)
     self.neo4j_driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
+    self.table_extraction = table_extraction
+    self.structured_output = structured_output
+    self.chunk_tokens = chunk_tokens
+    self.pack_token_budget = pack_token_budget
+    self.delta_extractor = DeltaExtractor(self) if delta_extraction else None
+    self.extraction_repairer = ExtractionRepairer()
+    self.model_router = ModelRouter()
+    self.streaming_extractor = StreamingExtractor(self) if stream_extraction else None
+    self._embedding_model: Optional[EmbeddingBackend] = None
+    self.embedding_backend = embedding_backend or 'sentence-transformers'
+    self.embedding_threads = embedding_threads
+    if cache_vector_dtype not in VECTOR_DTYPES:
+      raise ValueError(f"Unknown cache vector type {cache_vector_dtype}, expected one of {', '.join(VECTOR_DTYPES)}")
+    if graph_vector_type not in GRAPH_VECTOR_TYPES:
+      raise ValueError(f"Unknown graph vector type {graph_vector_type}, expected one of {', '.join(GRAPH_VECTOR_TYPES)}")
+    self.cache_vector_dtype = cache_vector_dtype
+    self.graph_vector_type = graph_vector_type
+    self.embedding_client = EmbeddingClient(embedding_server, embedding_backend) if embedding_server else None
+    self.journal = CheckpointJournal(journal_path) if journal_path else None
+    self._digests: Dict[Tuple[str, int, int], str] = {}
+    self.stage_attempts = stage_attempts
+    self.dead_letters = DeadLetterStore()
+    self.resolution_index = ResolutionIndex()
+    # Concurrent workers and processes with the same uncached content share one
+    # parse, extraction and embedding instead of each paying for it
+    self.single_flight = SingleFlight()
+    self.max_workers = max_workers
+    self.schedule_policy = schedule_policy
+    # Resolution and graph writes of concurrent documents are serialised, so
+    # each document is resolved against everything written before it
+    self._graph_lock = threading.Lock()
+    self._embedding_model_lock = threading.Lock()
 
     # Print all variables
     print(f"Neo4j URI: {self.neo4j_uri}")
@@ -57,49 +161,235 @@ class DocumentLoader:
     print(f"LlamaParse API Key: {'*' * len(self.llama_parse_api_key)}")  # Masked for security
     print(f"LlamaParse Client: {self.llama_parse_client}")
     print(f"Neo4j Driver: {self.neo4j_driver}")
+    print(f"Table Extraction: {self.table_extraction}")
+    print(f"Structured Output: {self.structured_output}")
+    print(f"Chunk Tokens: {self.chunk_tokens}")
+    print(f"Pack Token Budget: {self.pack_token_budget}")
+    print(f"Delta Extraction: {self.delta_extractor is not None}")
+    print(f"Stream Extraction: {self.streaming_extractor is not None}")
+    print(f"Checkpoint Journal: {journal_path}")
+    print(f"Stage Attempts: {self.stage_attempts}")
+    print(f"Max Workers: {self.max_workers}")
+    print(f"Schedule Policy: {self.schedule_policy}")
+    print(f"Embedding Server: {embedding_server}")
+    print(f"Embedding Backend: {self.embedding_backend}")
+    print(f"Cache Vector Type: {self.cache_vector_dtype}")
+    print(f"Graph Vector Type: {self.graph_vector_type}")
+    print(f"Model Tiers: {self.model_router.policy['tiers']}")
 
 
 
   def process_directory(self, directory_path: str) -> None:
     """Iterate through all files in the directory and process each"""
     print(f"Processing directory: {directory_path}")
-    for file_path in Path(directory_path).glob('**/*'):
+    file_paths = self.supported_files(directory_path)
+    if self.journal is not None:
+      pending = [file_path for file_path in file_paths if not self.journal.completed(file_path, 'written')]
+      print(f"Resuming from the checkpoint journal, {len(file_paths) - len(pending)} documents already written")
+      file_paths = pending
+
+    if self.pack_token_budget:
+      parsed_contents = []
+      for file_path in file_paths:
+        try:
+          parsed_contents.append(self._run_stage('parse', lambda: self.prepare_content(file_path))[0])
+        except StageError as e:
+          # Left for process_file_isolated, which dead-letters the document
+          print(f"Not packing {file_path}: {e}")
+      try:
+        packed = PackedExtractor(self, self.pack_token_budget).run(parsed_contents)
+        print(f"Extracted {packed} documents through packed requests")
+      except Exception as e:
+        # Packing only warms the extraction cache, the documents are still extracted one by one
+        print(f"Packed extraction failed, extracting documents individually: {e}")
+
+    plan = plan_work(self, file_paths, self.schedule_policy)
+    print(f"Planned {len(plan)} documents {self.schedule_policy}, "
+          f"estimated {sum(item.estimated_seconds for item in plan):.0f}s of work")
+
+    durations = []
+    def process_item(item: WorkItem) -> bool:
+      start = time.perf_counter()
+      processed = self.process_file_isolated(item.file_path)
+      durations.append(time.perf_counter() - start)
+      return processed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+      results = list(executor.map(process_item, plan))
+    print(f"Schedule: {makespan_report(durations, time.perf_counter() - start, self.max_workers)}")
+
+    failed = results.count(False)
+    if failed:
+      print(f"{failed} documents failed and were moved to the dead-letter store")
+
+    for model, metrics in rate_limit_metrics().items():
+      print(f"LLM rate limit usage for {model}: {metrics}")
+    for service, window in concurrency_windows().items():
+      print(f"Concurrency window for {service}: {window}")
+    for tier, documents in self.model_router.report().items():
+      print(f"Documents extracted on the {tier} tier: {documents}")
+    if self.single_flight.coalesced or self.single_flight.waited:
+      print(f"Single-flight parse, extraction and embedding: {self.single_flight.report()}")
+    print(f"Entity resolution tiers: {self.resolution_index.summary()}")
+    if self.extraction_repairer.stats.failures:
+      print(f"Extraction repairs: {self.extraction_repairer.stats.summary()}")
+
+  def supported_files(self, directory_path: str) -> List[str]:
+    """Supported files in the directory tree, in path order"""
+    file_paths = []
+    for file_path in sorted(Path(directory_path).glob('**/*')):
       if not self.check_file_supported(file_path):
         print(f"Skipping unsupported file: {file_path}")
         continue
-      parse_result = self.parse_document(str(file_path))
-      parsed_content = {
-        'file_name': str(file_path),
-        'markdown': parse_result['markdown']
-      }
-      document_extraction = self.extract_triples(parsed_content)
-      updated_extraction = self.generate_embedding(document_extraction)
-      resolved_extraction = self.resolve_and_update_entities(updated_extraction)
-      self.add_triples_to_graph(resolved_extraction, str(file_path))
+      file_paths.append(str(file_path))
+    return file_paths
+
+  def process_file(self, file_path: str) -> None:
+    """Run a single file through parsing, extraction, embedding, resolution and graph writes"""
+    if self.journal is not None and self.journal.completed(file_path, 'written'):
+      print(f"Skipping {file_path}, already written according to the checkpoint journal")
+      return
+
+    parsed_content, tables = self._run_stage('parse', lambda: self.prepare_content(file_path))
+    self._checkpoint(file_path, 'parsed')
+    streamed = None
+    if self._should_stream(parsed_content):
+      streamed = self._run_stage('extract', lambda: self.streaming_extractor.run(parsed_content, tables))
+    if streamed is None:
+      document_extraction = self._run_stage('extract', lambda: merge_table_items(self.extract_triples(parsed_content), tables))
+      self._checkpoint(file_path, 'extracted')
+      updated_extraction = self._run_stage('embed', lambda: self.generate_embedding(document_extraction))
+      self._checkpoint(file_path, 'embedded')
+    else:
+      self._checkpoint(file_path, 'embedded')
+    with self._graph_lock:
+      if streamed is None:
+        # Resolution rewrites IDs in place, so every attempt starts from a fresh copy
+        resolved_extraction = self._run_stage(
+          'resolve',
+          lambda: self.resolve_and_update_entities(updated_extraction.copy())
+        )
+      else:
+        # Entities the stream did not match are resolved against everything written since
+        resolved_extraction = self._run_stage('resolve', lambda: self.streaming_extractor.resolve(streamed))
+      self._run_stage('write', lambda: self.add_triples_to_graph(resolved_extraction, file_path))
+    self._checkpoint(file_path, 'written')
+
+  def process_file_isolated(self, file_path: str) -> bool:
+    """Process a file, moving it to the dead-letter store instead of raising when a stage keeps failing.
+
+    Errors raised outside a stage, e.g. by the checks between stages or when
+    the file disappears while it is processed, are dead-lettered as well, so
+    one document never aborts a directory run or the watch loop.
+
+    Returns:
+      Whether the file was processed
+    """
+    try:
+      self.process_file(file_path)
+    except StageError as e:
+      self.dead_letters.add(file_path, e, self._artifacts(file_path))
+      return False
+    except Exception as e:
+      self.dead_letters.add(file_path, StageError('process', e, 1), self._artifacts(file_path))
+      return False
+    self.dead_letters.remove(file_path)
+    return True
+
+  def _run_stage(self, stage: str, func: Callable[[], Any]) -> Any:
+    return retry_stage(stage, func, attempts=self.stage_attempts)
+
+  def _artifacts(self, file_path: str) -> List[Path]:
+    """Cache files a document has produced so far"""
+    artifacts = []
+    try:
+      cache_path = self.parse_cache_path(file_path, 'json' if self.table_extraction else 'markdown')
+      if cache_path.exists():
+        artifacts.append(cache_path)
+        parsed_content, _ = self.prepare_content(file_path)
+        artifacts.append(self.extraction_cache_path(parsed_content))
+    except Exception:
+      # Best effort, the document is dead-lettered either way
+      pass
+    return artifacts
+
+  def _checkpoint(self, file_path: str, stage: str) -> None:
+    if self.journal is not None:
+      self.journal.record(file_path, stage, self.file_digest(file_path))
+
+  def _should_stream(self, parsed_content: ParsedContent) -> bool:
+    """Stream uncached documents that are extracted in one prompt and not as a delta"""
+    if self.streaming_extractor is None or self.find_cached_extraction(self.extraction_digest(parsed_content)) is not None:
+      return False
+    if self.chunk_tokens and len(parsed_content['markdown']) > self.chunk_tokens * 4:
+      return False
+    return self.delta_extractor is None or self.delta_extractor.find_template(parsed_content) is None
+
+  def prepare_content(self, file_path: str) -> Tuple[ParsedContent, List[LineItemTable]]:
+    """Parse a document and build the content that is sent to the LLM.
+
+    In table extraction mode, tables that look like line items are split out of
+    the LlamaParse JSON result so they can be mapped into ServiceItem/PayrollItem
+    entities without the LLM; only the non-tabular remainder is returned as markdown.
+
+    Args:
+      file_path: Path to the document file as a string
+
+    Returns:
+      The parsed content for extract_triples and any line item tables to merge afterwards
+    """
+    if not self.table_extraction:
+      parse_result = self.parse_document(file_path)
+      return {'file_name': file_path, 'markdown': parse_result['markdown']}, []
+
+    parse_result = self.parse_document(file_path, result_type='json')
+    remainder, tables = split_tables(parse_result)
+    full_length = sum(len(page.get('md') or '') for page in parse_result['pages'])
+    print(f"Mapped {sum(len(t['rows']) for t in tables)} table rows directly, "
+          f"sending {len(remainder)} of {full_length} characters to the LLM")
+    return {'file_name': file_path, 'markdown': remainder}, tables
 
   def check_file_supported(self, file_path: str) -> bool:
     """Check if the file is supported by LlamaParse"""
     mime_type, _ = mimetypes.guess_type(file_path)
     return mime_type and mime_type in SUPPORTED_MIME_TYPES
 
-  def parse_document(self, file_path: str) -> MarkdownJobResult:
+  def file_digest(self, file_path: str) -> str:
+    """MD5 of a file, computed once per file version (path, size and modification time)"""
+    stat = os.stat(file_path)
+    key = (file_path, stat.st_size, stat.st_mtime_ns)
+    if key not in self._digests:
+      # Streamed so large files are not read into memory
+      self._digests[key] = file_md5(file_path)
+    return self._digests[key]
+
+  def parse_cache_path(self, file_path: str, result_type: Literal['markdown', 'json'] = 'markdown') -> Path:
+    """Return the cache file path of the LlamaParse result for the given file"""
+    # Generate hash of content for cache key
+    content_hash = self.file_digest(file_path)
+    suffix = 'md' if result_type == 'markdown' else 'json'
+    return Path('.parsed') / f"{file_path}.{content_hash}.{suffix}"
+
+  def parse_document(
+    self,
+    file_path: str,
+    result_type: Literal['markdown', 'json'] = 'markdown'
+  ) -> Union[MarkdownJobResult, JsonJobResult]:
     """Send document content to LlamaParse and get structured content with caching
 
     Args:
       file_path: Path to the document file as a string
+      result_type: Whether to request markdown or per-page JSON results
 
     Returns:
       Parsed document structure from LlamaParse
     """
     print(f"Parsing document: {file_path}")
     path = Path(file_path)
-    content = path.read_bytes()
-
-    # Generate hash of content for cache key
-    content_hash = hashlib.md5(content).hexdigest()
 
     # Create cache file path
-    cache_path = Path('.parsed') / f"{file_path}.{content_hash}.md"
+    cache_path = self.parse_cache_path(file_path, result_type)
 
     # Ensure cache directory exists
     cache_path.parent.mkdir(parents=True, exist_ok=True)
@@ -116,17 +406,68 @@ class DocumentLoader:
     if not mime_type or mime_type not in SUPPORTED_MIME_TYPES:
       raise ValueError(f"Unsupported file type: {file_path}")
 
-    start_time = time.time()
-    response = self.llama_parse_client.process_file(content, file_path, mime_type)
-    end_time = time.time()
-    print(f"Processed {file_path} in {end_time - start_time} seconds")
-
-    # Cache the response
-    with open(cache_path, 'w') as f:
-      json.dump(response, f)
+    def parse() -> Union[MarkdownJobResult, JsonJobResult]:
+      start_time = time.time()
+      response = self.llama_parse_client.process_file(path, file_path, mime_type, result_type=result_type)
+      end_time = time.time()
+      print(f"Processed {file_path} in {end_time - start_time} seconds")
+
+      # Cache the response
+      write_text_atomic(cache_path, json.dumps(response))
+      return response
+
+    # Keyed by content, so duplicate files at other paths share the parse
+    digest = self.file_digest(file_path)
+    response = self.single_flight.do(
+      f"parse:{digest}:{result_type}",
+      parse,
+      lookup=lambda: self.find_cached_parse(digest, result_type)
+    )
+    if not cache_path.exists():
+      # Coalesced with a duplicate file at another path
+      write_text_atomic(cache_path, json.dumps(response))
 
     return response
 
+  def find_cached_parse(self, digest: str, result_type: Literal['markdown', 'json'] = 'markdown') -> Optional[Union[MarkdownJobResult, JsonJobResult]]:
+    """Cached LlamaParse result of any file with the given content digest"""
+    suffix = 'md' if result_type == 'markdown' else 'json'
+    cache_path = next(Path('.parsed').glob(f"**/*.{digest}.{suffix}"), None)
+    if cache_path is None:
+      return None
+    with open(cache_path, 'r') as f:
+      return json.loads(f.read())
+
+  def extraction_digest(self, parsed_content: ParsedContent) -> str:
+    """Digest of the content that is extracted, the same for identical documents at other paths"""
+    return hashlib.md5(parsed_content['markdown'].encode()).hexdigest()
+
+  def extraction_cache_path(self, parsed_content: ParsedContent) -> Path:
+    """Return the cache file path of the extraction for the given parsed content"""
+    return Path('.extracted') / f"{parsed_content['file_name']}.{self.extraction_digest(parsed_content)}.json"
+
+  def find_cached_extraction(self, digest: str) -> Optional[DocumentExtraction]:
+    """Cached extraction of any document with the given content digest"""
+    cache_path = next(Path('.extracted').glob(f"**/*.{digest}.json"), None)
+    if cache_path is None:
+      return None
+    return DocumentExtraction.model_validate_json(cache_path.read_bytes())
+
+  def adopt_extraction(self, extraction: DocumentExtraction, parsed_content: ParsedContent) -> DocumentExtraction:
+    """Cache the extraction of an identical document at another path for this document.
+
+    The copy's Document entities point at this document's path, so it gets its
+    own Document node in the graph.
+    """
+    adopted = extraction.model_copy(deep=True)
+    for entity in adopted.entities:
+      if entity.type == EntityType.DOCUMENT:
+        entity.properties['path'] = parsed_content['file_name']
+    cache_path = self.extraction_cache_path(parsed_content)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    write_text_atomic(cache_path, adopted.model_dump_json())
+    return adopted
+
   def extract_triples(self, parsed_content: ParsedContent) -> DocumentExtraction:
     """Use LLM to extract subject-predicate-object triples from parsed content.
 
@@ -138,11 +479,7 @@ class DocumentLoader:
     Returns:
       Parsed triples as a JSON string
     """
-    # Generate hash of content for cache key
-    content_hash = hashlib.md5(parsed_content['markdown'].encode()).hexdigest()
-
-    # Create cache file path
-    cache_path = Path('.extracted') / f"{parsed_content['file_name']}.{content_hash}.json"
+    cache_path = self.extraction_cache_path(parsed_content)
 
     # Ensure cache directory exists
     cache_path.parent.mkdir(parents=True, exist_ok=True)
@@ -150,267 +487,525 @@ class DocumentLoader:
     # Check if cached version exists
     if cache_path.exists():
       print(f"Loading cached triples for {parsed_content['file_name']}")
-      with open(cache_path, 'r') as f:
-        cached_data = json.loads(f.read())
-        return DocumentExtraction.model_validate(cached_data)
+      return DocumentExtraction.model_validate_json(cache_path.read_bytes())
+
+    # Keyed by content, so duplicate documents at other paths share the extraction
+    digest = self.extraction_digest(parsed_content)
+    cached = self.find_cached_extraction(digest)
+    if cached is not None:
+      print(f"Loading cached triples of a document identical to {parsed_content['file_name']}")
+      return self.adopt_extraction(cached, parsed_content)
+    document_extraction = self.single_flight.do(
+      f"extract:{digest}",
+      lambda: self._extract_uncached(parsed_content, cache_path),
+      lookup=lambda: self.find_cached_extraction(digest)
+    )
+    if not cache_path.exists():
+      # Coalesced with a duplicate document at another path
+      document_extraction = self.adopt_extraction(document_extraction, parsed_content)
+    return document_extraction
 
-    # If not cached, process normally
+  def _extract_uncached(self, parsed_content: ParsedContent, cache_path: Path) -> DocumentExtraction:
     print(f"Extracting triples from {parsed_content['file_name']}")
+    processed_at = datetime.now().isoformat()
+
+    document_extraction = None
+    if self.delta_extractor is not None:
+      document_extraction = self.delta_extractor.extract(parsed_content, processed_at)
+
+    if document_extraction is None:
+      chunks = split_markdown(parsed_content['markdown'], self.chunk_tokens * 4) if self.chunk_tokens else []
+      if len(chunks) > 1:
+        document_extraction = self._extract_chunks(parsed_content['file_name'], chunks, processed_at)
+      else:
+        document_extraction = self._run_extraction(
+          parsed_content['file_name'],
+          f"Here is the content of the document: {parsed_content['markdown']}",
+          processed_at
+        )
+
+    # Cache the response using native Pydantic JSON serialization
+    write_text_atomic(cache_path, document_extraction.model_dump_json())
+
+    return document_extraction
 
+  def _extract_chunks(self, file_name: str, chunks: List[str], processed_at: str) -> DocumentExtraction:
+    """Extract the chunks of a long document concurrently and merge the results"""
+    print(f"Extracting {file_name} in {len(chunks)} chunks")
+    # Every chunk goes to the same parsing agent so a chunk without a title page is not misclassified
+    document_type = infer_document_type(file_name)
+    agent = get_parsing_agent(document_type) if document_type else get_triage_agent()
+
+    with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+      extractions = list(executor.map(
+        lambda indexed_chunk: self._run_extraction(
+          file_name,
+          f"Here is part {indexed_chunk[0] + 1} of {len(chunks)} of the document: {indexed_chunk[1]}",
+          processed_at,
+          agent=agent
+        ),
+        enumerate(chunks)
+      ))
+    return merge_chunk_extractions(extractions)
+
+  def _run_extraction(self, file_name: str, content: str, processed_at: str, agent: Optional[Agent] = None) -> DocumentExtraction:
+    """Run the extraction agents on one prompt on the model tier routed for the document.
+
+    Output that does not validate is repaired first; only when the repair fails
+    is the prompt sent again on the next larger tier.
+    """
+    document_type = infer_document_type(file_name)
+    route = self.model_router.route(document_type, len(content) // 4)
+    while True:
+      try:
+        document_extraction = self._run_agents(file_name, content, processed_at, agent, route)
+        break
+      except (ValidationError, json.JSONDecodeError):
+        larger_route = self.model_router.escalate(document_type, route)
+        if larger_route is None:
+          raise
+        print(f"Escalating {file_name} from the {route['tier']} to the {larger_route['tier']} tier")
+        route = larger_route
+    self.model_router.record(file_name, route)
+    print(f"Extracted {file_name} on the {route['tier']} tier ({route['model']})")
+    return document_extraction
+
+  def _run_agents(
+    self,
+    file_name: str,
+    content: str,
+    processed_at: str,
+    agent: Optional[Agent],
+    route: Route
+  ) -> DocumentExtraction:
+    """Run the extraction agents on one prompt, repairing the output if it does not validate"""
     context_variables = AgentContextVariables(
-      document_path=parsed_content['file_name'],
-      document_processed_at=datetime.now().isoformat()
+      document_path=file_name,
+      document_processed_at=processed_at,
+      structured_output=self.structured_output
     )
 
-    swarm = Swarm()
+    swarm = Swarm(client=LLMClient(
+      response_format=EXTRACTION_RESPONSE_FORMAT if self.structured_output else None,
+      request_params={'timeout': route['timeout'], 'max_tokens': route['max_tokens']}
+    ))
 
     response = swarm.run(
-      agent=get_triage_agent(),
+      agent=agent or get_triage_agent(),
       context_variables=context_variables,
+      model_override=route['model'],
       messages=[{
       'role': 'user',
-      'content': f"Here is the content of the document: {parsed_content['markdown']}"
+      'content': content
       }]
     )
     results = response.messages[-1]["content"]
-    json_results = json.loads(results)
 
     # Parse directly into DocumentExtraction using Pydantic
     try:
-      document_extraction = DocumentExtraction.model_validate(json_results)
-    except ValidationError as e:
-      print(f"Error validating extraction: {json_results}")
-      raise e
-
-    # Cache the response using native Pydantic JSON serialization
-    with open(cache_path, 'w') as f:
-      f.write(document_extraction.model_dump_json())
-
-    return document_extraction
-
-  def generate_embedding(self, extraction: DocumentExtraction) -> DocumentExtraction:
-    """Set embedding property for each entity using SentenceTransformer with caching.
+      if self.structured_output:
+        return DocumentExtraction.model_validate_json(results)
+      return DocumentExtraction.model_validate(json.loads(results))
+    except (ValidationError, json.JSONDecodeError) as e:
+      print(f"Error validating extraction, attempting repair: {e}")
+      instructions = response.agent.instructions(context_variables)
+      full_retry_tokens = (len(instructions) + len(content) + len(results)) // 4
+      try:
+        return self.extraction_repairer.repair(
+          results,
+          route['model'],
+          full_retry_tokens,
+          document=content
+        )
+      except ExtractionRepairError:
+        print(f"Error validating extraction: {results}")
+        raise e
+
+  @property
+  def embedding_model(self) -> EmbeddingBackend:
+    """Embedding backend used for entity embeddings, loaded on first use"""
+    with self._embedding_model_lock:
+      if self._embedding_model is None:
+        self._embedding_model = create_embedding_backend(self.embedding_backend, self.embedding_threads)
+    return self._embedding_model
+
+  def preload_embeddings(self) -> None:
+    """Load the embedding model, or connect to the embedding server, before the first document"""
+    if self.embedding_client is not None:
+      self.embedding_client.encode([])
+    else:
+      self.embedding_model
+
+  def embedding_cache_path(self, extraction: DocumentExtraction) -> Path:
+    """Return the cache file path of the embedded version of the given extraction"""
+    # Generate hash of the extraction for cache key, other backends than the
+    # reference one get their own cache entries
+    key = extraction.model_dump_json()
+    model = self.embedding_client.model if self.embedding_client is not None else canonical_backend_spec(self.embedding_backend)
+    if model != 'sentence-transformers':
+      key += model
+    content_hash = hashlib.md5(key.encode()).hexdigest()
+    return Path('.embeddings') / f"{content_hash}.bin"
+
+  def load_embedding_cache(self, cache_path: Path) -> Optional[CompactExtraction]:
+    """Load a cached embedded extraction, or None on a cache miss.
+
+    Binary artifacts of the current version are loaded without validation; JSON
+    caches written before the binary format are validated and still accepted.
+    """
+    if cache_path.exists():
+      try:
+        return CompactExtraction.from_artifact(cache_path)
+      except ArtifactError as e:
+        print(f"Ignoring cached embeddings: {e}")
+    legacy_path = cache_path.with_suffix('.json')
+    if legacy_path.exists():
+      return CompactExtraction.from_extraction(DocumentExtraction.model_validate_json(legacy_path.read_bytes()))
+    return None
+
+  def entity_text(self, entity_type: EntityType, properties: Dict[str, Any]) -> str:
+    """Text that is embedded for an entity that takes part in entity resolution"""
+    return f"{properties.get('name') or properties.get('description')} : {entity_type}"
+
+  def embed_texts(self, texts: List[str]) -> np.ndarray:
+    """Embed texts in one batch as float32 rows"""
+    if self.embedding_client is not None:
+      return self.embedding_client.encode(texts)
+    return self.embedding_model.encode(texts)
+
+  def generate_embedding(self, extraction: DocumentExtraction) -> CompactExtraction:
+    """Embed the entities that take part in entity resolution using SentenceTransformer with caching.
 
     Args:
         extraction: DocumentExtraction object containing entities to embed
-    """
-    # Generate hash of the extraction for cache key
-    extraction_json = extraction.model_dump_json()
-    content_hash = hashlib.md5(extraction_json.encode()).hexdigest()
 
+    Returns:
+        CompactExtraction with the embeddings in its embedding block
+    """
     # Create cache file path
-    cache_path = Path('.embeddings') / f"{content_hash}.json"
-
-    # Ensure cache directory exists
-    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    cache_path = self.embedding_cache_path(extraction)
 
     # Check if cached version exists
-    if cache_path.exists():
+    cached = self.load_embedding_cache(cache_path)
+    if cached is not None:
         print("Loading cached embeddings")
-        with open(cache_path, 'r') as f:
-            cached_data = json.loads(f.read())
-            return DocumentExtraction.model_validate(cached_data)
+        return cached
 
-    # If not cached, process normally
+    return self.single_flight.do(
+      f"embed:{cache_path}",
+      lambda: self._embed_uncached(extraction, cache_path),
+      lookup=lambda: self.load_embedding_cache(cache_path)
+    )
+
+  def _embed_uncached(self, extraction: DocumentExtraction, cache_path: Path) -> CompactExtraction:
     print("Generating new embeddings")
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    updated_extraction = extraction.model_copy()
+    compact = CompactExtraction.from_extraction(extraction)
 
-    # Generate embeddings for each entity's name
-    for entity in updated_extraction.entities:
-      if entity.type in ENTITY_RESOLUTION_TYPES:
-        text_to_embed = f"{entity.properties.get('name') or entity.properties.get('description')} : {entity.type}"
-        embedding = model.encode(text_to_embed, convert_to_numpy=True)
-        entity.properties['embedding'] = embedding.tolist()
+    # Generate embeddings for each entity's name in one batch
+    to_embed = [entity for entity in compact.entities if entity.type in ENTITY_RESOLUTION_TYPES]
+    if to_embed:
+      compact.set_embeddings(to_embed, self.embed_texts([self.entity_text(e.type, e.properties) for e in to_embed]))
 
     # Cache the updated extraction
-    with open(cache_path, 'w') as f:
-        f.write(updated_extraction.model_dump_json())
+    compact.to_artifact(cache_path, self.cache_vector_dtype)
+
+    return compact
+
+  def resolve_entity(
+    self,
+    session: Session,
+    entity_type: EntityType,
+    properties: Dict[str, Any],
+    embedding: Optional[np.ndarray]
+  ) -> str:
+    """Resolve one entity against the graph and set the ID in its properties,
+    a new ID when match_entity finds no existing entity.
 
-    return updated_extraction
+    Returns:
+      The resolved ID of the entity
+    """
+    resolved_id = self.match_entity(session, entity_type, properties, embedding)
+    if resolved_id is None:
+      if embedding is not None:
+        self.resolution_index.record('new')
+      resolved_id = shortuuid.uuid()
+    properties['id'] = resolved_id
+    return resolved_id
+
+  def match_entity(
+    self,
+    session: Session,
+    entity_type: EntityType,
+    properties: Dict[str, Any],
+    embedding: Optional[np.ndarray]
+  ) -> Optional[str]:
+    """Find the existing entity an extracted entity refers to, and set its ID in the properties.
+    The lookups run in the Neo4j concurrency window, next to the graph writes.
+
+    Documents are matched by path. Other entities are matched by the first of
+    these tiers that hits: their normalised name in the in-process index of
+    written entities, their normalised name in the graph (indexed nameKey),
+    embedding similarity among the nodes sharing their blocking key (indexed
+    blockKey), and embedding similarity among all nodes of their type.
+    The resolution keys are set in the properties as well.
 
-  def resolve_and_update_entities(self, extraction: DocumentExtraction) -> DocumentExtraction:
+    Returns:
+      The ID of the matching entity, or None
+    """
+    with get_concurrency_limiter('neo4j').slot('resolve'):
+      return self._match_entity(session, entity_type, properties, embedding)
+
+  def _match_entity(
+    self,
+    session: Session,
+    entity_type: EntityType,
+    properties: Dict[str, Any],
+    embedding: Optional[np.ndarray]
+  ) -> Optional[str]:
+    # Special case for Document entities - look up by path
+    if entity_type == EntityType.DOCUMENT:
+      query = """
+      MATCH (e:Document {path: $path})
+      RETURN e.id AS id
+      """
+      result = session.run(
+        query,
+        path=properties.get('path')
+      )
+      match = result.single()
+      if match:
+        properties['id'] = match['id']
+        return match['id']
+
+    # Entities without embedding are not matched
+    if embedding is None:
+      return None
+
+    # The keys are stored on the node, so later documents can find it by name
+    name_key, block_key = resolution_keys(properties)
+    if name_key:
+      properties['nameKey'] = name_key
+      properties['blockKey'] = block_key
+
+      resolved_id = self.resolution_index.get(entity_type, name_key)
+      if resolved_id:
+        self.resolution_index.record('exact-local')
+        properties['id'] = resolved_id
+        return resolved_id
+
+      match = session.run(
+        f"MATCH (e:`{entity_type.value}` {{nameKey: $name_key}}) RETURN e.id AS id LIMIT 1",
+        name_key=name_key
+      ).single()
+      if match:
+        self.resolution_index.record('exact-graph')
+        properties['id'] = match['id']
+        return match['id']
+
+    # Query Neo4j for similar entities using vector similarity, first among the
+    # nodes of the same block, then among all nodes of the type
+    tiers = [('block', f"MATCH (e:`{entity_type.value}` {{blockKey: $block_key}})")] if block_key else []
+    tiers.append(('vector', f"MATCH (e:`{entity_type.value}`)"))
+    for tier, match_clause in tiers:
+      query = f"""
+      {match_clause}
+      WITH e, vector.similarity.cosine(e.embedding, $embedding) AS similarity
+      WHERE similarity > 0.95
+      RETURN e.id AS id, e.name AS name, similarity
+      ORDER BY similarity DESC
+      LIMIT 1
+      """
+
+      result = session.run(
+        query,
+        embedding=embedding.tolist(),
+        block_key=block_key
+      )
+
+      match = result.single()
+      if match:
+        # Update entity ID to match existing entity
+        self.resolution_index.record(tier)
+        properties['id'] = match['id']
+        return match['id']
+
+    return None
+
+  def remap_relationships(self, relationships: List[CompactRelationship], id_mapping: Dict[str, str]) -> None:
+    """Update relationship entity references using an id mapping keyed by '<type>_<original id>'"""
+    for relationship in relationships:
+      from_typed_id = f"{relationship.from_type}_{relationship.from_id}"
+      to_typed_id = f"{relationship.to_type}_{relationship.to_id}"
+
+      if from_typed_id in id_mapping:
+        relationship.from_id = id_mapping[from_typed_id]
+      if to_typed_id in id_mapping:
+        relationship.to_id = id_mapping[to_typed_id]
+
+  def resolve_and_update_entities(self, extraction: CompactExtraction) -> CompactExtraction:
     """Connect to neo4j, find entities based on embedding, and resolve entities based on cosine distance.
 
     For each entity in the extraction, this method:
     1. Finds similar entities in Neo4j using embedding similarity
     2. If a similar entity is found above threshold, updates the ID to match
     3. Updates all relationships referencing the old entity ID
-    4. Returns updated DocumentExtraction with resolved entities
+    4. Returns the extraction with resolved entities
 
     Args:
-      extraction: DocumentExtraction object containing entities to resolve
+      extraction: CompactExtraction containing entities to resolve, updated in place
 
     Returns:
-      Updated DocumentExtraction with resolved entity IDs
+      The CompactExtraction with resolved entity IDs
     """
     print("Resolving entities with Neo4j")
-    updated_extraction = extraction.model_copy()
     id_mapping = {}  # Store old_id -> new_id mappings
 
     with self.neo4j_driver.session() as session:
-      for entity in updated_extraction.entities:
-        # Special case for Document entities - look up by path
-        if entity.type == EntityType.DOCUMENT:
-          query = """
-          MATCH (e:Document {path: $path})
-          RETURN e.id AS id
-          """
-          result = session.run(
-            query,
-            path=entity.properties.get('path')
-          )
-          match = result.single()
-          original_id = entity.properties.get('id')
-          if match:
-            entity.properties['id'] = match['id']
-            if original_id:
-              id_mapping[f"{entity.type}_{original_id}"] = match['id']
-            continue
-
-        # Regular handling for entities without embedding
-        if 'embedding' not in entity.properties:
-          short_guid = shortuuid.uuid()
-          original_id = entity.properties.get('id')
-          entity.properties['id'] = short_guid
-          if original_id:
-            id_mapping[f"{entity.type}_{original_id}"] = short_guid
-          continue
-
-        # Store original ID before potential update
+      for entity in extraction.entities:
         original_id = entity.properties.get('id')
-        typed_original_id = f"{entity.type}_{original_id}" if original_id else None
-
-        # Query Neo4j for similar entities using vector similarity
-        query = f"""
-        MATCH (e:`{entity.type.value}`)
-        WITH e, vector.similarity.cosine(e.embedding, $embedding) AS similarity
-        WHERE similarity > 0.95
-        RETURN e.id AS id, e.name AS name, similarity
-        ORDER BY similarity DESC
-        LIMIT 1
-        """
+        resolved_id = self.resolve_entity(session, entity.type, entity.properties, extraction.embedding(entity))
+        if original_id:
+          id_mapping[f"{entity.type}_{original_id}"] = resolved_id
 
-        result = session.run(
-          query,
-          embedding=entity.properties['embedding']
-        )
+    self.remap_relationships(extraction.relationships, id_mapping)
+    return extraction
 
-        match = result.single()
-        if match:
-          # Update entity ID to match existing entity, ensuring type prefix
-          matched_id = match['id']
-          entity.properties['id'] = matched_id
-          if typed_original_id:
-            id_mapping[typed_original_id] = matched_id
-        else:
-          # No match found, generate new type-prefixed ID
-          new_id = shortuuid.uuid()
-          entity.properties['id'] = new_id
-          if typed_original_id:
-            id_mapping[typed_original_id] = new_id
-
-      # Update relationship entity references using the id_mapping
-      for relationship in updated_extraction.relationships:
-        from_typed_id = f"{relationship.from_.type}_{relationship.from_.id}"
-        to_typed_id = f"{relationship.to.type}_{relationship.to.id}"
-
-        if from_typed_id in id_mapping:
-          relationship.from_.id = id_mapping[from_typed_id]
-        if to_typed_id in id_mapping:
-          relationship.to.id = id_mapping[to_typed_id]
-
-    return updated_extraction
-
-  def add_triples_to_graph(self, extraction: DocumentExtraction, file_path: str) -> None:
-    """Add entities and relationships from DocumentExtraction to Neo4j.
-    Skips processing if document was already processed.
+  def add_triples_to_graph(self, extraction: CompactExtraction, file_path: str) -> None:
+    """Add entities and relationships from a CompactExtraction to Neo4j in one transaction.
+    Skips processing if the same version of the document was already processed,
+    and replaces what an earlier version wrote when the file has changed since.
 
     Args:
-        extraction: DocumentExtraction object containing entities and relationships
+        extraction: CompactExtraction containing entities and relationships
     """
-    with self.neo4j_driver.session() as session:
+    digest = self.file_digest(file_path)
+    with get_concurrency_limiter('neo4j').slot('write'), self.neo4j_driver.session() as session:
         # Check if document was already processed and create if not exists
         check_query = """
         MATCH (d:Document {path: $path})
-        RETURN d.processedAt
+        RETURN d.digest AS digest, d.entityKeys AS entity_keys
         """
-        result = session.run(check_query, path=file_path)
-        if result.single():
+        existing = session.run(check_query, path=file_path).single()
+        if existing is not None and existing['digest'] == digest:
             print(f"Document already processed: {file_path}")
             return
 
-        # Create new document node if it doesn't exist
-        create_doc_query = """
-        MERGE (d:Document {path: $path})
-        ON CREATE SET
-            d.processedAt = datetime(),
-            d.id = $id
-        """
-        session.run(
-            create_doc_query,
-            path=file_path,
-            id=shortuuid.uuid()
-        )
-
-        # First, create or update all entities
-        for entity in extraction.entities:
-          try:
-            # Create entity with properties, merging on ID if exists
-            query = f"""
-            MERGE (e:`{entity.type.value}` {{id: $id}})
-            SET e += $properties
-            """
-
-            # Convert numpy arrays to lists if present
-            properties = {k: v.tolist() if isinstance(v, np.ndarray) else v
-                        for k, v in entity.properties.items()}
-
-            print(f"Creating or updating entity: {entity.type.value} with ID: {entity.properties['id']}")
-
-            session.run(
-                query,
-                id=entity.properties['id'],
-              properties=properties or {}
-            )
-          except Exception as e:
-            print(f"Error creating or updating entity: {entity.type.value} with ID: {entity.properties['id']}")
-            raise e
-
-        # Then create all relationships
-        for rel in extraction.relationships:
-          try:
-            from_type = rel.from_.type.value
-            to_type = rel.to.type.value
-            rel_type = rel.type.value
-            # Create relationship between entities, using the type as relationship type
-            query = f"""
-            MATCH (from:`{from_type}` {{id: $from_id}})
-            MATCH (to:`{to_type}` {{id: $to_id}})
-            MERGE (from)-[r:`{rel_type}`]->(to)
-            SET r += $properties
-            """
-
-            print(f"Creating relationship: {rel_type} between {from_type} and {to_type}")
-            # Clean relationship type to be Neo4j compatible
-            session.run(
-                query,
-                from_id=rel.from_.id,
-                to_id=rel.to.id,
-                properties=rel.properties or {}
-            )
-          except Exception as e:
-            print(f"Error creating relationship: {rel_type} between {from_type} and {to_type}")
-            raise e
+        # Write the document in one transaction, so a failed write leaves nothing behind
+        # and the document is not mistaken for an already processed one on retry
+        with session.begin_transaction() as tx:
+          if existing is not None:
+            print(f"Document changed since it was written, replacing it: {file_path}")
+            remove_document_contributions(tx, file_path, existing['entity_keys'] or [])
+
+          # Create new document node if it doesn't exist
+          create_doc_query = """
+          MERGE (d:Document {path: $path})
+          ON CREATE SET
+              d.id = $id
+          SET
+              d.processedAt = datetime(),
+              d.digest = $digest,
+              d.entityKeys = $entity_keys
+          """
+          tx.run(
+              create_doc_query,
+              path=file_path,
+              id=shortuuid.uuid(),
+              digest=digest,
+              entity_keys=document_entity_keys(extraction)
+          )
 
-def test_load_contracts():
+          # First, create or update all entities
+          for entity in extraction.entities:
+            try:
+              # Create entity with properties, merging on ID if exists
+              query = f"""
+              MERGE (e:`{entity.type.value}` {{id: $id}})
+              SET e += $properties
+              """
+
+              # Embeddings are converted from the float32 block to lists here, and
+              # set separately when they are stored as float32 vector properties
+              embedding = extraction.embedding(entity)
+              vector_property = self.graph_vector_type == 'float32' and embedding is not None
+              properties = extraction.entity_properties(entity, include_embedding=not vector_property)
+              if vector_property:
+                query += set_vector_clause('e', '$embedding')
+
+              print(f"Creating or updating entity: {entity.type.value} with ID: {entity.properties['id']}")
+
+              tx.run(
+                  query,
+                  id=entity.properties['id'],
+                properties=properties or {},
+                embedding=embedding.tolist() if vector_property else None
+              )
+            except Exception as e:
+              print(f"Error creating or updating entity: {entity.type.value} with ID: {entity.properties['id']}")
+              raise e
+
+          # Then create all relationships
+          for rel in extraction.relationships:
+            try:
+              from_type = rel.from_type.value
+              to_type = rel.to_type.value
+              rel_type = rel.type.value
+              # Create relationship between entities, using the type as relationship type
+              query = f"""
+              MATCH (from:`{from_type}` {{id: $from_id}})
+              MATCH (to:`{to_type}` {{id: $to_id}})
+              MERGE (from)-[r:`{rel_type}`]->(to)
+              SET r += $properties, {SET_RELATIONSHIP_SOURCES}
+              """
+
+              print(f"Creating relationship: {rel_type} between {from_type} and {to_type}")
+              # Clean relationship type to be Neo4j compatible
+              tx.run(
+                  query,
+                  from_id=rel.from_id,
+                  to_id=rel.to_id,
+                  properties=rel.properties or {},
+                  path=file_path
+              )
+            except Exception as e:
+              print(f"Error creating relationship: {rel_type} between {from_type} and {to_type}")
+              raise e
+
+          tx.commit()
+        self.resolution_index.remember(extraction)
+
+def create_loader_from_env() -> DocumentLoader:
+  """Create a DocumentLoader configured from environment variables"""
   import dotenv
   dotenv.load_dotenv()
   neo4j_uri = os.getenv('NEO4J_URI')
   neo4j_user = os.getenv('NEO4J_USERNAME')
   neo4j_password = os.getenv('NEO4J_PASSWORD')
   llama_parse_api_key = os.getenv('LLAMA_PARSE_API_KEY')
-  loader = DocumentLoader(neo4j_uri, neo4j_user, neo4j_password, llama_parse_api_key)
+  return DocumentLoader(
+    neo4j_uri,
+    neo4j_user,
+    neo4j_password,
+    llama_parse_api_key,
+    table_extraction=os.getenv('LOADER_TABLE_EXTRACTION', 'false').lower() == 'true',
+    structured_output=os.getenv('LOADER_STRUCTURED_OUTPUT', 'false').lower() == 'true',
+    chunk_tokens=int(os.getenv('LOADER_CHUNK_TOKENS')) if os.getenv('LOADER_CHUNK_TOKENS') else None,
+    pack_token_budget=int(os.getenv('LOADER_PACK_TOKEN_BUDGET')) if os.getenv('LOADER_PACK_TOKEN_BUDGET') else None,
+    delta_extraction=os.getenv('LOADER_DELTA_EXTRACTION', 'false').lower() == 'true',
+    stream_extraction=os.getenv('LOADER_STREAM_EXTRACTION', 'false').lower() == 'true',
+    journal_path=os.getenv('LOADER_CHECKPOINT_JOURNAL'),
+    stage_attempts=int(os.getenv('LOADER_STAGE_ATTEMPTS', '3')),
+    max_workers=int(os.getenv('LOADER_MAX_WORKERS', '1')),
+    schedule_policy=os.getenv('LOADER_SCHEDULE_POLICY', 'longest-first'),
+    embedding_server=os.getenv('LOADER_EMBEDDING_SERVER'),
+    embedding_backend=os.getenv('LOADER_EMBEDDING_BACKEND'),
+    embedding_threads=int(os.getenv('LOADER_EMBEDDING_THREADS')) if os.getenv('LOADER_EMBEDDING_THREADS') else None,
+    cache_vector_dtype=os.getenv('LOADER_CACHE_VECTOR_DTYPE', 'float32'),
+    graph_vector_type=os.getenv('LOADER_GRAPH_VECTOR_TYPE', 'list')
+  )
+
+def test_load_contracts():
+  loader = create_loader_from_env()
   loader.process_directory('company_documents')
 
 if __name__ == "__main__":
@@ -0,0 +1,110 @@
+import json
+import os
+import threading
+from collections import Counter
+from typing import Dict, Optional, TypedDict
+
+class TypePolicy(TypedDict, total=False):
+  # Documents estimated above this many tokens skip the fast tier
+  max_fast_tokens: int
+  # Request timeout, so a stuck call fails over instead of stalling the run
+  latency_budget_seconds: float
+  # Completion token budget of a single request
+  max_completion_tokens: int
+
+class RoutingPolicy(TypedDict):
+  tiers: Dict[str, str]
+  # Tiers from fastest to largest, escalation moves one step along this list
+  tier_order: list
+  document_types: Dict[str, TypePolicy]
+  # Most completion tokens a model returns in one response
+  output_token_limits: Dict[str, int]
+
+class Route(TypedDict):
+  tier: str
+  model: str
+  timeout: float
+  max_tokens: int
+
+DEFAULT_ROUTING_POLICY: RoutingPolicy = {
+  'tiers': {'fast': 'gpt-4o-mini', 'large': 'gpt-4o'},
+  'tier_order': ['fast', 'large'],
+  'output_token_limits': {'gpt-4o-mini': 16384, 'gpt-4o': 16384},
+  'document_types': {
+    'paystub': {'max_fast_tokens': 4000, 'latency_budget_seconds': 30, 'max_completion_tokens': 2000},
+    'invoice': {'max_fast_tokens': 6000, 'latency_budget_seconds': 60, 'max_completion_tokens': 4000},
+    'contract': {'max_fast_tokens': 12000, 'latency_budget_seconds': 120, 'max_completion_tokens': 8000},
+    'default': {'max_fast_tokens': 8000, 'latency_budget_seconds': 90, 'max_completion_tokens': 4000},
+  }
+}
+
+def load_routing_policy() -> RoutingPolicy:
+  """Routing policy, with overrides from the JSON file named by EXTRACTION_ROUTING_POLICY.
+
+  The file has the same shape as DEFAULT_ROUTING_POLICY; tiers and document
+  types it mentions replace or extend the defaults.
+  """
+  policy = json.loads(json.dumps(DEFAULT_ROUTING_POLICY))
+  path = os.getenv('EXTRACTION_ROUTING_POLICY')
+  if path:
+    with open(path, 'r') as f:
+      overrides = json.load(f)
+    policy['tiers'].update(overrides.get('tiers', {}))
+    policy['tier_order'] = overrides.get('tier_order', policy['tier_order'])
+    policy['output_token_limits'].update(overrides.get('output_token_limits', {}))
+    for document_type, type_policy in overrides.get('document_types', {}).items():
+      policy['document_types'].setdefault(document_type, {}).update(type_policy)
+  return policy
+
+class ModelRouter:
+  """Picks the model tier for each extraction and records which tier served each document"""
+
+  def __init__(self, policy: Optional[RoutingPolicy] = None):
+    self.policy = policy or load_routing_policy()
+    self.served: Dict[str, str] = {}
+    self._lock = threading.Lock()
+
+  def _type_policy(self, document_type: Optional[str]) -> TypePolicy:
+    document_types = self.policy['document_types']
+    return {**document_types['default'], **document_types.get(document_type or 'default', {})}
+
+  def _route(self, tier: str, type_policy: TypePolicy) -> Route:
+    return {
+      'tier': tier,
+      'model': self.policy['tiers'][tier],
+      'timeout': type_policy['latency_budget_seconds'],
+      'max_tokens': type_policy['max_completion_tokens'],
+    }
+
+  def route(self, document_type: Optional[str], content_tokens: int) -> Route:
+    """Fastest tier for small documents, the largest tier for documents over the type's limit"""
+    type_policy = self._type_policy(document_type)
+    tiers = self.policy['tier_order']
+    tier = tiers[0] if content_tokens <= type_policy['max_fast_tokens'] else tiers[-1]
+    return self._route(tier, type_policy)
+
+  def escalate(self, document_type: Optional[str], route: Route) -> Optional[Route]:
+    """Next larger tier after a failed validation, or None if already on the largest"""
+    tiers = self.policy['tier_order']
+    index = tiers.index(route['tier'])
+    if index + 1 >= len(tiers):
+      return None
+    return self._route(tiers[index + 1], self._type_policy(document_type))
+
+  def output_token_limit(self, model: str) -> int:
+    """Most completion tokens the model returns, the smallest known limit for models not in the policy"""
+    limits = self.policy['output_token_limits']
+    return limits.get(model, min(limits.values()))
+
+  def record(self, file_name: str, route: Route) -> None:
+    """Record the tier that served a document, keeping the largest for chunked documents"""
+    tiers = self.policy['tier_order']
+    with self._lock:
+      previous = self.served.get(file_name)
+      if previous is None or tiers.index(route['tier']) > tiers.index(previous):
+        self.served[file_name] = route['tier']
+
+  def report(self) -> Dict[str, int]:
+    """Number of documents served by each tier"""
+    with self._lock:
+      return dict(Counter(self.served.values()))
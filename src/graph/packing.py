@@ -0,0 +1,178 @@
+from datetime import datetime
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from pydantic import ValidationError
+
+from ..lib.file_streams import write_text_atomic
+from ..lib.llm import LLMClient
+from .document_entity_extractor_agent import (
+  AgentContextVariables,
+  get_parsing_agent,
+  infer_document_type
+)
+from .extraction_repair import ExtractionRepairError, repair_truncated_json, strip_fences
+from .extraction_schema import COMPACT_EXTRACTION_SCHEMA, DocumentExtraction
+
+if TYPE_CHECKING:
+  from .loader import DocumentLoader, ParsedContent
+
+PACKING_INSTRUCTIONS = """
+You are given several documents at once. Each starts with a line
+<<<DOCUMENT n path=...>>> and ends with <<<END DOCUMENT n>>>.
+Extract each document separately, using that document's path for its Document entity.
+Output a JSON object {"documents": [{"document_index": n, "entities": [...], "relationships": [...]}, ...]}
+with one entry per document, where entities and relationships follow the format above.
+"""
+
+PACKED_RESPONSE_FORMAT = {
+  'type': 'json_schema',
+  'json_schema': {
+    'name': 'packed_document_extractions',
+    'schema': {
+      'type': 'object',
+      'properties': {
+        'documents': {
+          'type': 'array',
+          'items': {
+            'type': 'object',
+            'properties': {
+              'document_index': {'type': 'integer'},
+              **COMPACT_EXTRACTION_SCHEMA['properties']
+            },
+            'required': ['document_index', 'entities', 'relationships']
+          }
+        }
+      },
+      'required': ['documents']
+    },
+    'strict': False
+  }
+}
+
+def estimate_tokens(text: str) -> int:
+  return len(text) // 4 + 1
+
+def pack_documents(parsed_contents: List['ParsedContent'], token_budget: int) -> List[List['ParsedContent']]:
+  """Group small documents of the same type into packs within a token budget.
+
+  Documents whose type cannot be inferred from the path, or that take more than
+  half the budget on their own, are left out, as are packs of one document.
+  """
+  by_type: Dict[str, List['ParsedContent']] = {}
+  for parsed_content in parsed_contents:
+    document_type = infer_document_type(parsed_content['file_name'])
+    if document_type and estimate_tokens(parsed_content['markdown']) <= token_budget // 2:
+      by_type.setdefault(document_type, []).append(parsed_content)
+
+  packs = []
+  for documents in by_type.values():
+    pack, pack_tokens = [], 0
+    for parsed_content in documents:
+      tokens = estimate_tokens(parsed_content['markdown'])
+      if pack and pack_tokens + tokens > token_budget:
+        packs.append(pack)
+        pack, pack_tokens = [], 0
+      pack.append(parsed_content)
+      pack_tokens += tokens
+    packs.append(pack)
+  return [pack for pack in packs if len(pack) > 1]
+
+class PackedExtractor:
+  """Extracts several small documents of the same type with one LLM request.
+
+  The fixed part of the prompt (agent instructions and output format) is sent
+  once per pack instead of once per document. The response is split back into
+  one DocumentExtraction per document and written to each document's regular
+  extraction cache, so the per-document pipeline afterwards hits the cache.
+  Documents missing from or invalid in the response are left uncached and get
+  extracted on their own.
+  """
+
+  def __init__(self, loader: 'DocumentLoader', token_budget: int):
+    self.loader = loader
+    self.token_budget = token_budget
+
+  def run(self, parsed_contents: List['ParsedContent']) -> int:
+    """Extract all uncached documents that can be packed.
+
+    Returns:
+      Number of documents extracted through packs
+    """
+    pending = [p for p in parsed_contents if not self.loader.extraction_cache_path(p).exists()]
+    extracted = 0
+    for pack in pack_documents(pending, self.token_budget):
+      extracted += self.extract_pack(pack)
+    return extracted
+
+  def extract_pack(self, pack: List['ParsedContent']) -> int:
+    document_type = infer_document_type(pack[0]['file_name'])
+    route = self.loader.model_router.route(
+      document_type,
+      sum(estimate_tokens(parsed_content['markdown']) for parsed_content in pack) // len(pack)
+    )
+    # The completion budgets of all documents have to fit in one response of the model
+    per_request = max(1, self.loader.model_router.output_token_limit(route['model']) // route['max_tokens'])
+    if len(pack) > per_request:
+      # Remainders of one document are left to the per-document pipeline
+      return sum(
+        self.extract_pack(pack[start:start + per_request])
+        for start in range(0, len(pack), per_request)
+        if len(pack[start:start + per_request]) > 1
+      )
+
+    agent = get_parsing_agent(document_type)
+    context_variables = AgentContextVariables(
+      document_path="given in the header of each document",
+      document_processed_at=datetime.now().isoformat(),
+      structured_output=self.loader.structured_output
+    )
+    documents = "\n\n".join(
+      f"<<<DOCUMENT {index} path={parsed_content['file_name']}>>>\n{parsed_content['markdown']}\n<<<END DOCUMENT {index}>>>"
+      for index, parsed_content in enumerate(pack, start=1)
+    )
+    print(f"Extracting {len(pack)} {document_type} documents in one request on the {route['tier']} tier")
+
+    # Budgets scale with the documents in the pack, max_tokens is also what the rate limiter reserves
+    llm_client = LLMClient(response_format=PACKED_RESPONSE_FORMAT if self.loader.structured_output else None)
+    response = llm_client.chat.completions.create(
+      model=route['model'],
+      timeout=route['timeout'] * len(pack),
+      max_tokens=min(route['max_tokens'] * len(pack), self.loader.model_router.output_token_limit(route['model'])),
+      messages=[
+        {'role': 'system', 'content': agent.instructions(context_variables) + PACKING_INSTRUCTIONS},
+        {'role': 'user', 'content': f"Here are the contents of the documents:\n\n{documents}"}
+      ]
+    )
+
+    extractions = split_packed_response(response.choices[0].message.content, len(pack))
+    for index, parsed_content in enumerate(pack, start=1):
+      document_extraction = extractions.get(index)
+      if document_extraction is None:
+        print(f"Packed response has no valid extraction for {parsed_content['file_name']}")
+        continue
+      cache_path = self.loader.extraction_cache_path(parsed_content)
+      cache_path.parent.mkdir(parents=True, exist_ok=True)
+      write_text_atomic(cache_path, document_extraction.model_dump_json())
+      self.loader.model_router.record(parsed_content['file_name'], route)
+    return len(extractions)
+
+def split_packed_response(content: str, pack_size: int) -> Dict[int, DocumentExtraction]:
+  """Split a packed response into one DocumentExtraction per document index"""
+  try:
+    data, _ = repair_truncated_json(strip_fences(content))
+  except ExtractionRepairError:
+    return {}
+
+  extractions = {}
+  for document in (data.get('documents') or []) if isinstance(data, dict) else []:
+    index: Optional[int] = document.get('document_index')
+    if not isinstance(index, int) or not 1 <= index <= pack_size:
+      continue
+    try:
+      extractions[index] = DocumentExtraction.model_validate({
+        'entities': document.get('entities'),
+        'relationships': document.get('relationships')
+      })
+    except ValidationError as e:
+      print(f"Invalid extraction for packed document {index}: {e}")
+  return extractions
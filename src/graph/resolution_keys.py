@@ -0,0 +1,119 @@
+import argparse
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, Optional, Tuple
+
+from .compact import CompactExtraction
+from .extraction_schema import ENTITY_RESOLUTION_TYPES, EntityType
+
+# Resolution tiers in the order they are tried
+RESOLUTION_TIERS = ['exact-local', 'exact-graph', 'block', 'vector', 'new']
+# Leading tokens skipped when choosing the blocking token
+STOP_TOKENS = {'the', 'a', 'an', 'and', 'of'}
+NON_ALPHANUMERIC_PATTERN = re.compile(r'[^0-9a-z]+')
+
+def normalise_name(text: str) -> str:
+  """Case-folded name with punctuation and repeated whitespace removed, e.g. 'servicetech solutions inc'"""
+  return NON_ALPHANUMERIC_PATTERN.sub(' ', text.casefold().replace('&', ' and ')).strip()
+
+def resolution_keys(properties: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+  """Name key and blocking key of an entity, from the same name or description that is embedded.
+
+  The name key is the normalised name. The blocking key is its first
+  significant token; together with the node label it selects the few nodes
+  worth comparing by embedding.
+  """
+  text = properties.get('name') or properties.get('description')
+  if not isinstance(text, str):
+    return None, None
+  name_key = normalise_name(text)
+  if not name_key:
+    return None, None
+  tokens = name_key.split()
+  block_key = next((token for token in tokens if token not in STOP_TOKENS), tokens[0])
+  return name_key, block_key
+
+class ResolutionIndex:
+  """In-process hash index of the resolved IDs of written entities by type and name key, with per-tier hit counts.
+
+  Entities are added once their document is written, so entities of the
+  document being resolved never match each other, as with the vector lookup.
+  """
+
+  def __init__(self):
+    self._ids: Dict[Tuple[EntityType, str], str] = {}
+    self._lock = threading.Lock()
+    self.hits: Counter = Counter()
+
+  def get(self, entity_type: EntityType, name_key: str) -> Optional[str]:
+    with self._lock:
+      return self._ids.get((entity_type, name_key))
+
+  def remember(self, extraction: CompactExtraction) -> None:
+    """Add the entities of a written extraction"""
+    with self._lock:
+      for entity in extraction.entities:
+        name_key = entity.properties.get('nameKey')
+        if name_key and entity.row >= 0:
+          self._ids[(entity.type, name_key)] = entity.properties['id']
+
+  def record(self, tier: str) -> None:
+    with self._lock:
+      self.hits[tier] += 1
+
+  def summary(self) -> str:
+    total = sum(self.hits.values())
+    if not total:
+      return "no lookups"
+    return ", ".join(f"{tier} {self.hits[tier]} ({self.hits[tier] / total:.0%})" for tier in RESOLUTION_TIERS)
+
+def backfill_resolution_keys(driver, batch_size: int = 1000) -> int:
+  """Set nameKey and blockKey on nodes written before the keys existed
+
+  Returns:
+    Number of updated nodes
+  """
+  updated = 0
+  with driver.session() as session:
+    for entity_type in ENTITY_RESOLUTION_TYPES:
+      while True:
+        records = session.run(
+          f"""
+          MATCH (e:`{entity_type.value}`)
+          WHERE e.nameKey IS NULL AND coalesce(e.name, e.description) IS NOT NULL
+          RETURN elementId(e) AS element_id, e.name AS name, e.description AS description
+          LIMIT $batch_size
+          """,
+          batch_size=batch_size
+        ).data()
+        rows = []
+        for record in records:
+          name_key, block_key = resolution_keys(record)
+          # Names without letters or digits get an empty key, so they are not selected again
+          rows.append({'element_id': record['element_id'], 'name_key': name_key or '', 'block_key': block_key or ''})
+        if not rows:
+          break
+        session.run(
+          """
+          UNWIND $rows AS row
+          MATCH (e) WHERE elementId(e) = row.element_id
+          SET e.nameKey = row.name_key, e.blockKey = row.block_key
+          """,
+          rows=rows
+        )
+        updated += len(rows)
+  return updated
+
+def run_backfill():
+  from .loader import create_loader_from_env
+
+  parser = argparse.ArgumentParser(description="Set the resolution keys on nodes written before they existed")
+  parser.add_argument('--batch-size', type=int, default=1000)
+  args = parser.parse_args()
+
+  loader = create_loader_from_env()
+  print(f"Set resolution keys on {backfill_resolution_keys(loader.neo4j_driver, args.batch_size)} nodes")
+
+if __name__ == "__main__":
+  run_backfill()
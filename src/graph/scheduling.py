@@ -0,0 +1,120 @@
+import mmap
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+from .document_entity_extractor_agent import infer_document_type
+
+if TYPE_CHECKING:
+  from .loader import DocumentLoader
+
+# Rough cost model in seconds; scheduling only depends on the relative order of the estimates
+COST_MODEL = {
+  'parse_overhead': 8.0,
+  'parse_per_page': 2.0,
+  'extract_overhead': 4.0,
+  'extract_per_page': 6.0,
+  'embed_and_write': 1.0,
+}
+# Relative extraction effort per page by document type
+TYPE_WEIGHTS = {'contract': 1.5, 'invoice': 1.0, 'paystub': 0.6}
+# Page size assumed when the page count cannot be read cheaply
+BYTES_PER_PAGE = 50_000
+
+PDF_PAGE_PATTERN = re.compile(rb'/Type\s*/Page\b')
+PERIOD_PATTERN = re.compile(r'(\d{6})\d{0,2}$')
+
+@dataclass
+class WorkItem:
+  file_path: str
+  size_bytes: int
+  pages: int
+  document_type: Optional[str]
+  # Latest YYYYMM period in the file name, e.g. 202303 for RENT-MAIN-202303.pdf
+  period: Optional[str]
+  cached_stage: Optional[str]
+  estimated_seconds: float
+
+def count_pdf_pages(file_path: str) -> Optional[int]:
+  """Count the page objects of an uncompressed PDF, or None when they are hidden in object streams"""
+  with open(file_path, 'rb') as f:
+    if os.fstat(f.fileno()).st_size == 0:
+      return None
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+      pages = sum(1 for _ in PDF_PAGE_PATTERN.finditer(mapped))
+  return pages or None
+
+def cached_stage(loader: 'DocumentLoader', file_path: str) -> Optional[str]:
+  """Furthest pipeline stage whose result is cached, from the journal or the cache files"""
+  if loader.journal is not None and loader.journal.completed(file_path, 'written'):
+    return 'written'
+  parse_cache_path = loader.parse_cache_path(file_path, 'json' if loader.table_extraction else 'markdown')
+  if not parse_cache_path.exists():
+    return None
+  try:
+    parsed_content, _ = loader.prepare_content(file_path)
+  except (OSError, ValueError):
+    # Unreadable cache entry, the document will be parsed again
+    return None
+  if loader.extraction_cache_path(parsed_content).exists():
+    return 'extracted'
+  return 'parsed'
+
+def estimate_cost(loader: 'DocumentLoader', file_path: str) -> WorkItem:
+  """Estimate the processing time of a file from its size, page count, type and cache state"""
+  size_bytes = os.stat(file_path).st_size
+  pages = count_pdf_pages(file_path) if file_path.lower().endswith('.pdf') else None
+  pages = pages or max(1, size_bytes // BYTES_PER_PAGE)
+  document_type = infer_document_type(file_path)
+  stage = cached_stage(loader, file_path)
+  match = PERIOD_PATTERN.search(Path(file_path).stem)
+
+  seconds = 0.0
+  if stage != 'written':
+    seconds += COST_MODEL['embed_and_write']
+    if stage is None:
+      seconds += COST_MODEL['parse_overhead'] + COST_MODEL['parse_per_page'] * pages
+    if stage in (None, 'parsed'):
+      weight = TYPE_WEIGHTS.get(document_type, 1.0)
+      seconds += COST_MODEL['extract_overhead'] + COST_MODEL['extract_per_page'] * pages * weight
+
+  return WorkItem(
+    file_path=file_path,
+    size_bytes=size_bytes,
+    pages=pages,
+    document_type=document_type,
+    period=match.group(1) if match else None,
+    cached_stage=stage,
+    estimated_seconds=seconds,
+  )
+
+SCHEDULE_POLICIES: Dict[str, Callable[[List[WorkItem]], List[WorkItem]]] = {
+  # Longest processing time first keeps the tail short when workers run in parallel
+  'longest-first': lambda items: sorted(items, key=lambda i: -i.estimated_seconds),
+  # Latest periods first, so the most recent documents are in the graph early
+  'recent-first': lambda items: sorted(items, key=lambda i: (i.period or '', i.estimated_seconds), reverse=True),
+  'path': lambda items: sorted(items, key=lambda i: i.file_path),
+}
+
+def plan_work(loader: 'DocumentLoader', file_paths: List[str], policy: str = 'longest-first') -> List[WorkItem]:
+  """Estimate the cost of every file and order them by a schedule policy"""
+  if policy not in SCHEDULE_POLICIES:
+    raise ValueError(f"Unknown schedule policy {policy}, expected one of {', '.join(SCHEDULE_POLICIES)}")
+  items = [estimate_cost(loader, file_path) for file_path in file_paths]
+  return SCHEDULE_POLICIES[policy](items)
+
+def ideal_makespan(durations: List[float], workers: int) -> float:
+  """Lower bound of the makespan: the work spread evenly, but never less than the longest item"""
+  if not durations:
+    return 0.0
+  return max(sum(durations) / workers, max(durations))
+
+def makespan_report(durations: List[float], makespan: float, workers: int) -> str:
+  ideal = ideal_makespan(durations, workers)
+  efficiency = ideal / makespan if makespan else 1.0
+  return (
+    f"makespan {makespan:.1f}s with {workers} workers, ideal {ideal:.1f}s "
+    f"({efficiency:.0%} efficiency, {sum(durations):.1f}s of work)"
+  )
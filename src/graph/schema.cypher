@@ -69,6 +69,18 @@ CREATE VECTOR INDEX IF NOT EXISTS FOR (d:Department) ON (d.embedding);
 CREATE VECTOR INDEX IF NOT EXISTS FOR (cc:CostCenter) ON (cc.embedding);
 CREATE VECTOR INDEX IF NOT EXISTS FOR (o:Organization) ON (o.embedding);
 
+// Resolution keys, looked up before the vector comparison
+CREATE INDEX IF NOT EXISTS FOR (o:Organization) ON (o.nameKey);
+CREATE INDEX IF NOT EXISTS FOR (o:Organization) ON (o.blockKey);
+CREATE INDEX IF NOT EXISTS FOR (e:Employee) ON (e.nameKey);
+CREATE INDEX IF NOT EXISTS FOR (e:Employee) ON (e.blockKey);
+CREATE INDEX IF NOT EXISTS FOR (d:Department) ON (d.nameKey);
+CREATE INDEX IF NOT EXISTS FOR (d:Department) ON (d.blockKey);
+CREATE INDEX IF NOT EXISTS FOR (cc:CostCenter) ON (cc.nameKey);
+CREATE INDEX IF NOT EXISTS FOR (cc:CostCenter) ON (cc.blockKey);
+CREATE INDEX IF NOT EXISTS FOR (si:ServiceItem) ON (si.nameKey);
+CREATE INDEX IF NOT EXISTS FOR (si:ServiceItem) ON (si.blockKey);
+
 // Date index
 CREATE INDEX IF NOT EXISTS FOR (d:Document) ON (d.processedAt);
 CREATE INDEX IF NOT EXISTS FOR (pt:PaymentTerm) ON (pt.daysToPayment);
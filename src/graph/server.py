@@ -0,0 +1,252 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shortuuid
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from .loader import DocumentLoader, create_loader_from_env
+from .table_extraction import merge_table_items
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+SAFE_FILE_NAME_PATTERN = re.compile(r'[^A-Za-z0-9._-]')
+
+@dataclass
+class Job:
+  id: str
+  digest: str
+  path: str
+  status: str  # queued, running, done, failed
+  submitted_at: float
+  started_at: Optional[float] = None
+  finished_at: Optional[float] = None
+  error: Optional[str] = None
+
+class IngestionService:
+  """Runs submitted documents through a shared, warm DocumentLoader.
+
+  Jobs go through an asyncio queue on a background event loop, and a fixed
+  number of worker coroutines run them on a thread pool, which bounds the
+  number of documents in flight. Submissions are deduplicated by content
+  digest: a document with the same content as a queued, running or finished
+  job returns that job instead of creating a new one.
+  """
+
+  def __init__(self, loader: DocumentLoader, concurrency: int = 2, upload_dir: str = '.uploads', root: Optional[str] = None):
+    self.loader = loader
+    self.concurrency = concurrency
+    self.upload_dir = Path(upload_dir)
+    # Path submissions are limited to this tree
+    self.root = Path(root).resolve() if root else None
+    self.jobs: Dict[str, Job] = {}
+    self.jobs_by_digest: Dict[str, Job] = {}
+    self._lock = threading.Lock()
+    self._executor = ThreadPoolExecutor(max_workers=concurrency)
+    self._loop = asyncio.new_event_loop()
+    self._queue: Optional[asyncio.Queue] = None
+    self._started = threading.Event()
+    threading.Thread(target=self._run_loop, daemon=True).start()
+    self._started.wait()
+
+  def _run_loop(self) -> None:
+    asyncio.set_event_loop(self._loop)
+    self._queue = asyncio.Queue()
+    for _ in range(self.concurrency):
+      self._loop.create_task(self._worker())
+    self._started.set()
+    self._loop.run_forever()
+
+  async def _worker(self) -> None:
+    while True:
+      job = await self._queue.get()
+      job.status = 'running'
+      job.started_at = time.time()
+      try:
+        processed = await self._loop.run_in_executor(self._executor, self.loader.process_file_isolated, job.path)
+        if processed:
+          job.status = 'done'
+        else:
+          letter = self.loader.dead_letters.get(job.path)
+          job.status = 'failed'
+          job.error = f"{letter['stage']}: {letter['error']}" if letter else "processing failed"
+      except Exception as e:
+        job.status = 'failed'
+        job.error = str(e)
+      job.finished_at = time.time()
+      self._queue.task_done()
+
+  def submit(self, path: Path, digest: str) -> Tuple[Job, bool]:
+    """Queue a document unless a job with the same content exists.
+
+    Returns:
+      The job and whether it was newly created
+    """
+    with self._lock:
+      existing = self.jobs_by_digest.get(digest)
+      if existing is not None and existing.status != 'failed':
+        return existing, False
+      job = Job(id=shortuuid.uuid(), digest=digest, path=str(path), status='queued', submitted_at=time.time())
+      self.jobs[job.id] = job
+      self.jobs_by_digest[digest] = job
+    self._loop.call_soon_threadsafe(self._queue.put_nowait, job)
+    return job, True
+
+  def submit_path(self, file_path: str) -> Tuple[Job, bool]:
+    """Queue a document that is already on disk.
+
+    The path is normalised relative to the working directory, since the
+    loader keys its caches by it: an absolute path would escape the cache
+    directories, and different spellings of a path would be separate
+    documents in the caches and the graph.
+
+    Raises:
+      PermissionError: The path is outside the service root or the working directory
+      ValueError: The file does not exist or is not supported
+    """
+    resolved = Path(file_path).resolve()
+    if self.root is not None and not resolved.is_relative_to(self.root):
+      raise PermissionError(f"{file_path} is outside {self.root}")
+    if not resolved.is_relative_to(Path.cwd()):
+      raise PermissionError(f"{file_path} is outside the working directory {Path.cwd()}")
+    path = resolved.relative_to(Path.cwd())
+    if not path.is_file() or not self.loader.check_file_supported(path):
+      raise ValueError(f"Not a supported document: {file_path}")
+    return self.submit(path, self.loader.file_digest(str(path)))
+
+  def submit_upload(self, file_name: str, body, length: int) -> Tuple[Job, bool]:
+    """Store an uploaded document under its content digest and queue it, streaming the body to disk
+
+    Raises:
+      ValueError: The file type is not supported
+    """
+    file_name = SAFE_FILE_NAME_PATTERN.sub('_', Path(file_name).name)
+    if not self.loader.check_file_supported(file_name):
+      raise ValueError(f"Unsupported file type: {file_name}")
+
+    self.upload_dir.mkdir(parents=True, exist_ok=True)
+    temp_path = self.upload_dir / f".{shortuuid.uuid()}.tmp"
+    digest = hashlib.md5()
+    remaining = length
+    with open(temp_path, 'wb') as f:
+      while remaining > 0:
+        chunk = body.read(min(UPLOAD_CHUNK_SIZE, remaining))
+        if not chunk:
+          break
+        digest.update(chunk)
+        f.write(chunk)
+        remaining -= len(chunk)
+    if remaining > 0:
+      temp_path.unlink()
+      raise ValueError("Upload ended before Content-Length bytes were received")
+
+    # The file name is kept, the document type is inferred from it
+    path = self.upload_dir / digest.hexdigest() / file_name
+    if path.exists():
+      # Same content uploaded before, keep the stored file and its modification time
+      temp_path.unlink()
+    else:
+      path.parent.mkdir(parents=True, exist_ok=True)
+      os.replace(temp_path, path)
+    return self.submit(path, digest.hexdigest())
+
+  def extraction(self, job: Job) -> Optional[str]:
+    """Extraction of a finished job as JSON, as written to the graph: the cached LLM extraction with the table line items"""
+    if job.status != 'done':
+      return None
+    parsed_content, tables = self.loader.prepare_content(job.path)
+    if not self.loader.extraction_cache_path(parsed_content).exists():
+      return None
+    return merge_table_items(self.loader.extract_triples(parsed_content), tables).model_dump_json()
+
+def make_handler(service: IngestionService):
+  class IngestionHandler(BaseHTTPRequestHandler):
+    """
+    POST /documents?filename=<name>  upload a document as the raw request body
+    POST /documents                  {"path": "..."} to ingest a document on disk
+    GET  /jobs/<id>                  job status
+    GET  /jobs/<id>/extraction       extraction of a finished job
+    """
+
+    def _send_json(self, status: int, payload) -> None:
+      body = (payload if isinstance(payload, str) else json.dumps(payload)).encode()
+      self.send_response(status)
+      self.send_header('Content-Type', 'application/json')
+      self.send_header('Content-Length', str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+
+    def do_POST(self) -> None:
+      url = urlparse(self.path)
+      if url.path != '/documents':
+        self._send_json(404, {'error': 'not found'})
+        return
+      # The body is read by length, so chunked requests and requests without a length are refused
+      if 'chunked' in self.headers.get('Transfer-Encoding', '').lower() or self.headers.get('Content-Length') is None:
+        self._send_json(411, {'error': 'a Content-Length is required, chunked uploads are not supported'})
+        return
+      length = int(self.headers['Content-Length'])
+      if length <= 0:
+        self._send_json(400, {'error': 'request has no body'})
+        return
+      try:
+        if self.headers.get('Content-Type', '').startswith('application/json'):
+          request = json.loads(self.rfile.read(length) or b'{}')
+          job, created = service.submit_path(request['path'])
+        else:
+          file_name = parse_qs(url.query).get('filename', [None])[0]
+          if not file_name:
+            raise ValueError("Uploads need a filename query parameter")
+          job, created = service.submit_upload(file_name, self.rfile, length)
+      except PermissionError as e:
+        self._send_json(403, {'error': str(e)})
+        return
+      except (KeyError, ValueError) as e:
+        self._send_json(400, {'error': str(e)})
+        return
+      self._send_json(202 if created else 200, {**asdict(job), 'duplicate': not created})
+
+    def do_GET(self) -> None:
+      parts = urlparse(self.path).path.strip('/').split('/')
+      job = service.jobs.get(parts[1]) if len(parts) >= 2 and parts[0] == 'jobs' else None
+      if job is None:
+        self._send_json(404, {'error': 'job not found'})
+      elif len(parts) == 2:
+        self._send_json(200, asdict(job))
+      elif len(parts) == 3 and parts[2] == 'extraction':
+        extraction = service.extraction(job)
+        if extraction is None:
+          self._send_json(409, {'error': f"job is {job.status}", 'status': job.status})
+        else:
+          self._send_json(200, extraction)
+      else:
+        self._send_json(404, {'error': 'not found'})
+
+  return IngestionHandler
+
+def run_server():
+  parser = argparse.ArgumentParser(description="Local HTTP service that ingests submitted documents")
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=8765)
+  parser.add_argument('--concurrency', type=int, default=2, help="Documents processed at the same time")
+  parser.add_argument('--root', default='company_documents', help="Only documents under this directory can be submitted by path")
+  args = parser.parse_args()
+
+  loader = create_loader_from_env()
+  # Load the embedding model or connect to the embedding server now, so the first request does not pay for it
+  loader.preload_embeddings()
+  service = IngestionService(loader, concurrency=args.concurrency, root=args.root)
+  server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+  print(f"Ingestion service listening on http://{args.host}:{args.port}")
+  server.serve_forever()
+
+if __name__ == "__main__":
+  run_server()
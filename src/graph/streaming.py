@@ -0,0 +1,272 @@
+import json
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from pydantic import ValidationError
+from swarm import Swarm
+
+from ..lib.file_streams import write_text_atomic
+from ..lib.llm import LLMClient
+from .compact import CompactExtraction
+from .document_entity_extractor_agent import (
+  EXTRACTION_RESPONSE_FORMAT,
+  AgentContextVariables,
+  get_triage_agent,
+  infer_document_type
+)
+from .extraction_repair import ExtractionRepairError
+from .extraction_schema import ENTITY_RESOLUTION_TYPES, DocumentExtraction, Entity
+from .table_extraction import LineItemTable, merge_table_items
+
+if TYPE_CHECKING:
+  from .loader import DocumentLoader, ParsedContent
+
+ENTITIES_ARRAY_PATTERN = re.compile(r'"entities"\s*:\s*\[')
+
+class EntityStreamParser:
+  """Incrementally parses the entities array of an extraction while it is generated.
+
+  Text is fed as it arrives; every entity object that is complete and valid is
+  returned once. Everything after the entities array is ignored, the full
+  output is validated separately when the stream ends.
+  """
+
+  def __init__(self):
+    self.buffer = ''
+    self.position = 0
+    self.state = 'seek'  # seek -> array -> done
+    self.depth = 0
+    self.in_string = False
+    self.escaped = False
+    self.start = 0
+
+  def feed(self, text: str) -> List[Entity]:
+    self.buffer += text
+    entities = []
+    while self.state != 'done' and self.position < len(self.buffer):
+      if self.state == 'seek':
+        match = ENTITIES_ARRAY_PATTERN.search(self.buffer, self.position)
+        if match is None:
+          # Keep the tail, the key may be split across deltas
+          self.position = max(self.position, len(self.buffer) - 32)
+          break
+        self.position = match.end()
+        self.state = 'array'
+        continue
+
+      char = self.buffer[self.position]
+      if self.in_string:
+        if self.escaped:
+          self.escaped = False
+        elif char == '\\':
+          self.escaped = True
+        elif char == '"':
+          self.in_string = False
+      elif char == '"':
+        self.in_string = True
+      elif char == '{':
+        if self.depth == 0:
+          self.start = self.position
+        self.depth += 1
+      elif char == '}':
+        self.depth -= 1
+        if self.depth == 0:
+          entity = self._parse_entity(self.buffer[self.start:self.position + 1])
+          if entity is not None:
+            entities.append(entity)
+      elif char == ']' and self.depth == 0:
+        self.state = 'done'
+      self.position += 1
+    return entities
+
+  def _parse_entity(self, text: str) -> Optional[Entity]:
+    try:
+      return Entity.model_validate(json.loads(text))
+    except (ValidationError, json.JSONDecodeError):
+      return None
+
+def _entity_key(entity: Entity) -> str:
+  return entity.model_dump_json()
+
+@dataclass
+class StreamedExtraction:
+  """Embedded extraction of a streamed document and the properties of the entities
+  matched while it streamed, by entity index"""
+  extraction: CompactExtraction
+  matches: Dict[int, Dict[str, Any]]
+
+class StreamingExtractor:
+  """Extracts a document with a streamed response, embedding and resolving
+  entities while the rest of the response is still being generated.
+
+  Each entity completed in the stream is handed to a worker that embeds it and
+  matches it against the entities in the graph. Entities without a match and
+  the relationships are resolved once the whole response is in, under the
+  loader's graph lock like the regular resolution step. The extraction
+  and embedding caches are written as in the regular pipeline, so later runs
+  load the document from cache.
+  """
+
+  def __init__(self, loader: 'DocumentLoader'):
+    self.loader = loader
+
+  def _embed_and_match(self, entity: Entity) -> Tuple[Optional[np.ndarray], Optional[Dict[str, Any]]]:
+    """Embedding of a streamed entity, and its properties with the matched ID and resolution keys if it matches an existing entity"""
+    embedding = None
+    if entity.type in ENTITY_RESOLUTION_TYPES:
+      embedding = self.loader.embed_texts([self.loader.entity_text(entity.type, entity.properties)])[0]
+    properties = dict(entity.properties)
+    with self.loader.neo4j_driver.session() as session:
+      matched_id = self.loader.match_entity(session, entity.type, properties, embedding)
+    return embedding, properties if matched_id is not None else None
+
+  def run(self, parsed_content: 'ParsedContent', tables: List[LineItemTable]) -> Optional[StreamedExtraction]:
+    """Extract and embed a document, matching its entities against the graph while it streams.
+
+    Returns:
+      The embedded extraction with the streamed matches, which resolve finishes,
+      or None if the streamed output did not validate and the document has to
+      go through the regular pipeline
+    """
+    resolved: Dict[str, Future] = {}
+    # One worker, so entities are embedded and resolved in the order they are generated
+    with ThreadPoolExecutor(max_workers=1) as executor:
+      # Same key as the regular extraction: a document with identical content
+      # that is being extracted elsewhere is waited for instead of streamed again,
+      # and its entities are then resolved after the stream like unstreamed ones
+      digest = self.loader.extraction_digest(parsed_content)
+      document_extraction = self.loader.single_flight.do(
+        f"extract:{digest}",
+        lambda: self._stream(parsed_content, executor, resolved),
+        lookup=lambda: self.loader.find_cached_extraction(digest)
+      )
+      if document_extraction is None:
+        return None
+      if not self.loader.extraction_cache_path(parsed_content).exists():
+        # Coalesced with a duplicate document at another path
+        document_extraction = self.loader.adopt_extraction(document_extraction, parsed_content)
+
+      extraction = merge_table_items(document_extraction, tables)
+      embedding_cache_path = self.loader.embedding_cache_path(extraction)
+      compact = CompactExtraction.from_extraction(extraction)
+      matches: Dict[int, Dict[str, Any]] = {}
+      streamed, streamed_vectors, to_embed = [], [], []
+      for index, (entity, compact_entity) in enumerate(zip(extraction.entities, compact.entities)):
+        future = resolved.get(_entity_key(entity))
+        if future is None:
+          # Repaired, table or otherwise changed entities were not streamed
+          if compact_entity.type in ENTITY_RESOLUTION_TYPES:
+            to_embed.append(compact_entity)
+          continue
+        embedding, matched_properties = future.result()
+        if embedding is not None:
+          streamed.append(compact_entity)
+          streamed_vectors.append(embedding)
+        if matched_properties is not None:
+          matches[index] = matched_properties
+
+    compact.set_embeddings(streamed, np.asarray(streamed_vectors))
+    if to_embed:
+      compact.set_embeddings(to_embed, self.loader.embed_texts([self.loader.entity_text(e.type, e.properties) for e in to_embed]))
+    compact.to_artifact(embedding_cache_path, self.loader.cache_vector_dtype)
+    return StreamedExtraction(compact, matches)
+
+  def _stream(
+    self,
+    parsed_content: 'ParsedContent',
+    executor: ThreadPoolExecutor,
+    resolved: Dict[str, Future]
+  ) -> Optional[DocumentExtraction]:
+    """Stream the extraction of a document, handing each completed entity to the executor.
+
+    Returns:
+      The cached extraction, or None if the output did not validate
+    """
+    file_name = parsed_content['file_name']
+    content = f"Here is the content of the document: {parsed_content['markdown']}"
+    print(f"Streaming extraction of {file_name}")
+    processed_at = datetime.now().isoformat()
+    context_variables = AgentContextVariables(
+      document_path=file_name,
+      document_processed_at=processed_at,
+      structured_output=self.loader.structured_output
+    )
+    route = self.loader.model_router.route(infer_document_type(file_name), len(content) // 4)
+    swarm = Swarm(client=LLMClient(
+      response_format=EXTRACTION_RESPONSE_FORMAT if self.loader.structured_output else None,
+      request_params={'timeout': route['timeout'], 'max_tokens': route['max_tokens']}
+    ))
+
+    parser = EntityStreamParser()
+    response = None
+    for chunk in swarm.run(
+      agent=get_triage_agent(),
+      context_variables=context_variables,
+      model_override=route['model'],
+      messages=[{'role': 'user', 'content': content}],
+      stream=True
+    ):
+      if 'response' in chunk:
+        response = chunk['response']
+      elif chunk.get('delim') == 'start':
+        # Every agent turn starts a new message, only the last one is the extraction
+        parser = EntityStreamParser()
+      elif chunk.get('content'):
+        for entity in parser.feed(chunk['content']):
+          key = _entity_key(entity)
+          if key not in resolved:
+            resolved[key] = executor.submit(self._embed_and_match, entity)
+    print(f"Streamed {len(resolved)} entities of {file_name} into resolution")
+
+    results = response.messages[-1]['content']
+    try:
+      if self.loader.structured_output:
+        document_extraction = DocumentExtraction.model_validate_json(results)
+      else:
+        document_extraction = DocumentExtraction.model_validate(json.loads(results))
+    except (ValidationError, json.JSONDecodeError) as e:
+      print(f"Error validating streamed extraction, attempting repair: {e}")
+      try:
+        document_extraction = self.loader.extraction_repairer.repair(
+          results,
+          route['model'],
+          (len(content) + len(results)) // 4,
+          document=content
+        )
+      except ExtractionRepairError:
+        return None
+    self.loader.model_router.record(file_name, route)
+
+    cache_path = self.loader.extraction_cache_path(parsed_content)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    write_text_atomic(cache_path, document_extraction.model_dump_json())
+    return document_extraction
+
+  def resolve(self, streamed: StreamedExtraction) -> CompactExtraction:
+    """Resolve the entities of a streamed extraction and rewrite its relationships.
+
+    Runs under the loader's graph lock like the regular resolution. Entities
+    matched while streaming keep their match, existing entities stay valid;
+    the others are resolved now, so an entity another document wrote after it
+    was streamed is found instead of duplicated. Works on a copy, so a retry
+    starts from the streamed state.
+    """
+    extraction = streamed.extraction.copy()
+    id_mapping = {}
+    with self.loader.neo4j_driver.session() as session:
+      for index, entity in enumerate(extraction.entities):
+        original_id = entity.properties.get('id')
+        matched_properties = streamed.matches.get(index)
+        if matched_properties is None:
+          self.loader.resolve_entity(session, entity.type, entity.properties, extraction.embedding(entity))
+        else:
+          # The ID and the resolution keys set on the streamed copy, which are stored on the node
+          entity.properties.update(matched_properties)
+        if original_id:
+          id_mapping[f"{entity.type}_{original_id}"] = entity.properties['id']
+    self.loader.remap_relationships(extraction.relationships, id_mapping)
+    return extraction
@@ -0,0 +1,201 @@
+import re
+from typing import Dict, List, Optional, Tuple, TypedDict
+
+from ..lib.llama_parse import DEFAULT_PAGE_SEPARATOR, Item, JsonJobResult
+from .extraction_schema import (
+  DocumentExtraction,
+  Entity,
+  EntityRef,
+  EntityType,
+  Relationship,
+  RelationshipType
+)
+
+# Header aliases used to recognise line item tables, keyed by the normalised column role
+COLUMN_ALIASES = {
+  'description': ['description', 'item', 'service', 'details'],
+  'quantity': ['qty', 'quantity', 'hours/units', 'hours', 'units'],
+  'unit': ['unit', 'uom'],
+  'rate': ['rate', 'unit price', 'price'],
+  'amount': ['amount', 'total', 'line total'],
+}
+
+# Rows that summarise a table rather than describe a line item
+SUMMARY_ROW_PATTERN = re.compile(r'^(sub)?total|^gross pay|^net pay|^total due|^total deductions', re.IGNORECASE)
+
+class LineItemTable(TypedDict):
+  heading: Optional[str]
+  rows: List[Dict[str, str]]
+
+def _normalise_header(cell: str) -> Optional[str]:
+  cell = cell.strip().lower()
+  for role, aliases in COLUMN_ALIASES.items():
+    if cell in aliases:
+      return role
+  return None
+
+def _parse_amount(value: str) -> Optional[float]:
+  cleaned = re.sub(r'[^0-9.\-]', '', value or '')
+  if not cleaned or cleaned in ('.', '-'):
+    return None
+  try:
+    return float(cleaned)
+  except ValueError:
+    return None
+
+def _table_to_line_items(rows: List[List[str]]) -> Tuple[List[Dict[str, str]], List[List[str]]]:
+  """Map the rows of a line item table to dicts keyed by column role.
+
+  Only tables whose header row names a description and an amount column are
+  line item tables. Key/value tables (employee details, invoice totals) are
+  left alone, even when their second column is numeric.
+
+  Returns:
+    The line items, and the header with every row that is not a line item
+    (Subtotal, Total, Net Pay and rows without an amount), which stays in the
+    markdown. No line items and all rows when this is not a line item table.
+  """
+  rows = [[cell.strip() for cell in row] for row in rows if any(cell.strip() for cell in row)]
+  if not rows:
+    return [], rows
+
+  columns = [_normalise_header(cell) for cell in rows[0]]
+  if 'description' not in columns or 'amount' not in columns:
+    return [], rows
+
+  line_items = []
+  remaining = [rows[0]]
+  for row in rows[1:]:
+    item = {role: cell for role, cell in zip(columns, row) if role}
+    if (
+      not item.get('description')
+      or SUMMARY_ROW_PATTERN.match(item['description'])
+      or _parse_amount(item.get('amount', '')) is None
+    ):
+      remaining.append(row)
+      continue
+    line_items.append(item)
+  return line_items, remaining
+
+def _table_markdown(rows: List[List[str]]) -> str:
+  width = max(len(row) for row in rows)
+  lines = [
+    "| " + " | ".join(row + [''] * (width - len(row))) + " |"
+    for row in rows
+  ]
+  lines.insert(1, "|" + " --- |" * width)
+  return "\n".join(lines)
+
+def split_tables(json_result: JsonJobResult) -> Tuple[str, List[LineItemTable]]:
+  """Separate line item tables from the rest of a LlamaParse JSON result.
+
+  Args:
+    json_result: JSON job result with per-page items
+
+  Returns:
+    The markdown of everything that is not a line item, with a short
+    placeholder where each table's line items were, and the extracted tables.
+    Summary rows of a line item table are kept in the markdown below its
+    placeholder, so totals still reach the LLM.
+  """
+  pages = []
+  tables: List[LineItemTable] = []
+  for page in json_result['pages']:
+    parts = []
+    heading = None
+    for item in page.get('items', []):
+      if item.get('type') == 'heading':
+        heading = item.get('value')
+      if item.get('type') == 'table' and item.get('rows'):
+        line_items, remaining = _table_to_line_items(item['rows'])
+        if line_items:
+          tables.append({'heading': heading, 'rows': line_items})
+          parts.append(f"[{heading or 'Table'}: {len(line_items)} line items extracted separately]")
+          if len(remaining) > 1:
+            parts.append(_table_markdown(remaining))
+          continue
+      parts.append(_item_markdown(item))
+    pages.append("\n\n".join(part for part in parts if part))
+  return DEFAULT_PAGE_SEPARATOR.join(pages), tables
+
+def _item_markdown(item: Item) -> str:
+  return item.get('md') or item.get('value') or ''
+
+def merge_table_items(extraction: DocumentExtraction, tables: List[LineItemTable]) -> DocumentExtraction:
+  """Attach table line items to the invoice or payroll extracted from the remainder.
+
+  Invoices get ServiceItem entities linked with CONTAINS_ITEM, pay stubs get
+  PayrollItem entities linked with HAS_PAYROLL_ITEM.
+
+  Args:
+    extraction: DocumentExtraction produced by the LLM from the non-tabular remainder
+    tables: Line item tables returned by split_tables
+
+  Returns:
+    New DocumentExtraction including the table entities and relationships
+  """
+  if not tables:
+    return extraction
+
+  merged = extraction.model_copy(deep=True)
+  anchor = next(
+    (e for e in merged.entities if e.type in (EntityType.INVOICE, EntityType.PAYROLL)),
+    None
+  )
+  if anchor is None:
+    print("No invoice or payroll entity found, table line items are added without relationships")
+
+  index = 0
+  for table in tables:
+    for row in table['rows']:
+      index += 1
+      if anchor is not None and anchor.type == EntityType.PAYROLL:
+        entity, relationship = _payroll_item(anchor, table['heading'], row, index)
+      else:
+        entity, relationship = _service_item(anchor, row, index)
+      merged.entities.append(entity)
+      if relationship is not None:
+        merged.relationships.append(relationship)
+  return merged
+
+def _service_item(anchor: Optional[Entity], row: Dict[str, str], index: int) -> Tuple[Entity, Optional[Relationship]]:
+  entity_id = f"service_item_table_{index}"
+  properties = {'id': entity_id, 'description': row['description']}
+  rate = _parse_amount(row.get('rate', ''))
+  if rate is not None:
+    properties['unitPrice'] = rate
+  entity = Entity(type=EntityType.SERVICE_ITEM, properties=properties)
+
+  if anchor is None:
+    return entity, None
+  relationship = Relationship(
+    from_=EntityRef(type=anchor.type, id=anchor.properties['id']),
+    to=EntityRef(type=EntityType.SERVICE_ITEM, id=entity_id),
+    type=RelationshipType.CONTAINS_ITEM,
+    properties={
+      'quantity': _parse_amount(row.get('quantity', '')) or 1,
+      'unit': row.get('unit') or 'each',
+      'amount': _parse_amount(row['amount']),
+    }
+  )
+  return entity, relationship
+
+def _payroll_item(anchor: Entity, heading: Optional[str], row: Dict[str, str], index: int) -> Tuple[Entity, Relationship]:
+  entity_id = f"payroll_item_table_{index}"
+  item_type = (heading or 'earnings').strip().lower()
+  entity = Entity(
+    type=EntityType.PAYROLL_ITEM,
+    properties={
+      'id': entity_id,
+      'description': row['description'],
+      'amount': _parse_amount(row['amount']),
+      'type': item_type,
+    }
+  )
+  relationship = Relationship(
+    from_=EntityRef(type=EntityType.PAYROLL, id=anchor.properties['id']),
+    to=EntityRef(type=EntityType.PAYROLL_ITEM, id=entity_id),
+    type=RelationshipType.HAS_PAYROLL_ITEM,
+    properties={'appliedDate': anchor.properties.get('payPeriod')}
+  )
+  return entity, relationship
@@ -0,0 +1,152 @@
+import argparse
+import json
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, TypedDict
+
+import numpy as np
+
+from ..lib.artifact import VECTOR_DTYPES, ArtifactError
+from ..lib.embedding_backends import RESOLUTION_THRESHOLD
+from .compact import CompactExtraction
+from .extraction_schema import DocumentExtraction
+
+# 'list' stores embeddings as a list of 64-bit floats with SET, 'float32' as a
+# float32 vector property with db.create.setNodeVectorProperty
+GRAPH_VECTOR_TYPES = ('list', 'float32')
+# Bytes per element of an embedding on a node
+GRAPH_ELEMENT_BYTES = {'list': 8, 'float32': 4}
+
+def set_vector_clause(node: str, value: str, carry: Optional[str] = None) -> str:
+  """Cypher appended to a write query that stores an embedding as a float32 vector property"""
+  variables = f"{node}, {carry}" if carry else node
+  return f"""
+      WITH {variables}
+      WHERE {value} IS NOT NULL
+      CALL db.create.setNodeVectorProperty({node}, 'embedding', {value})
+      """
+
+def load_cached_embeddings(cache_dir: str = '.embeddings') -> List[CompactExtraction]:
+  """Every embedded extraction in the cache, binary artifacts and legacy JSON files"""
+  extractions = []
+  for cache_path in sorted(Path(cache_dir).glob('*.bin')):
+    try:
+      extractions.append(CompactExtraction.from_artifact(cache_path))
+    except ArtifactError as e:
+      print(f"Skipping {cache_path}: {e}")
+  for legacy_path in sorted(Path(cache_dir).glob('*.json')):
+    if not legacy_path.with_suffix('.bin').exists():
+      extractions.append(CompactExtraction.from_extraction(DocumentExtraction.model_validate_json(legacy_path.read_bytes())))
+  return extractions
+
+class PrecisionComparison(TypedDict):
+  pairs: int
+  # Pairs above the resolution threshold with float64 vectors
+  matches: int
+  # Pairs on the other side of the threshold than with float64 vectors
+  flipped_pairs: int
+  max_similarity_drift: float
+
+def compare_precision(vectors_by_type: Dict[str, np.ndarray], dtype: np.dtype, threshold: float = RESOLUTION_THRESHOLD) -> PrecisionComparison:
+  """Compare the cosine similarities of same-type entity pairs in a storage type with float64 ones"""
+  comparison: PrecisionComparison = {'pairs': 0, 'matches': 0, 'flipped_pairs': 0, 'max_similarity_drift': 0.0}
+  for vectors in vectors_by_type.values():
+    reference = vectors.astype(np.float64)
+    reference /= np.linalg.norm(reference, axis=1, keepdims=True)
+    # Rounded to the storage type, compared in float32 arithmetic
+    stored = vectors.astype(dtype).astype(np.float32)
+    stored /= np.linalg.norm(stored, axis=1, keepdims=True)
+    upper = np.triu_indices(len(vectors), k=1)
+    expected = (reference @ reference.T)[upper]
+    actual = (stored @ stored.T)[upper]
+    comparison['pairs'] += len(expected)
+    comparison['matches'] += int((expected >= threshold).sum())
+    comparison['flipped_pairs'] += int(((expected >= threshold) != (actual >= threshold)).sum())
+    if len(expected):
+      comparison['max_similarity_drift'] = max(comparison['max_similarity_drift'], float(np.abs(expected - actual).max()))
+  return comparison
+
+def vector_report(extractions: List[CompactExtraction], cache_dir: str = '.embeddings', limit: int = 5000) -> None:
+  """Print the footprint of the embeddings in each storage type and the resolution outcomes they lead to"""
+  vectors_by_type: Dict[str, List[np.ndarray]] = defaultdict(list)
+  for extraction in extractions:
+    for entity in extraction.entities:
+      embedding = extraction.embedding(entity)
+      if embedding is not None and len(vectors_by_type[entity.type.value]) < limit:
+        vectors_by_type[entity.type.value].append(embedding)
+  if not vectors_by_type:
+    print(f"No embeddings in {cache_dir}")
+    return
+  stacked = {entity_type: np.stack(vectors) for entity_type, vectors in vectors_by_type.items()}
+  count = sum(len(vectors) for vectors in stacked.values())
+  dimensions = next(iter(stacked.values())).shape[1]
+  sample = np.concatenate(list(stacked.values()))
+
+  cache_bytes = sum(path.stat().st_size for path in Path(cache_dir).glob('*') if path.is_file())
+  print(f"{count} embeddings of {dimensions} dimensions from {len(extractions)} cached extractions, {cache_bytes / 1e6:.1f} MB in {cache_dir}")
+  print("Disk, vector block of the cache:")
+  print(f"  JSON lists (legacy cache): {len(json.dumps(sample.tolist())) / 1e6:.2f} MB")
+  for name, dtype in VECTOR_DTYPES.items():
+    print(f"  {name}: {count * dimensions * dtype.itemsize / 1e6:.2f} MB")
+  print("Memory per embedding:")
+  print(f"  list of Python floats: {sys.getsizeof(sample[0].tolist()) + dimensions * sys.getsizeof(1.0)} bytes")
+  for name, dtype in VECTOR_DTYPES.items():
+    print(f"  numpy {name}: {dimensions * dtype.itemsize} bytes")
+  print("Graph, embedding property values:")
+  for name, element_bytes in GRAPH_ELEMENT_BYTES.items():
+    print(f"  {name}: {count * dimensions * element_bytes / 1e6:.2f} MB ({dimensions * element_bytes} bytes per node)")
+
+  print(f"Resolution at a cosine threshold of {RESOLUTION_THRESHOLD} over same-type pairs, compared with float64:")
+  for name, dtype in VECTOR_DTYPES.items():
+    comparison = compare_precision(stacked, dtype)
+    print(
+      f"  {name}: {comparison['matches']} of {comparison['pairs']} pairs match, "
+      f"{comparison['flipped_pairs']} change outcome, similarity drift up to {comparison['max_similarity_drift']:.2e}"
+    )
+
+def convert_cache(cache_dir: str, vector_dtype: str) -> int:
+  """Rewrite the binary artifacts of the embedding cache with another vector type"""
+  converted = 0
+  for cache_path in sorted(Path(cache_dir).glob('*.bin')):
+    try:
+      CompactExtraction.from_artifact(cache_path).to_artifact(cache_path, vector_dtype)
+      converted += 1
+    except ArtifactError as e:
+      print(f"Skipping {cache_path}: {e}")
+  return converted
+
+def convert_graph(driver) -> int:
+  """Store every list embedding in the graph as a float32 vector property"""
+  with driver.session() as session:
+    result = session.run(
+      """
+      CALL apoc.periodic.iterate(
+        "MATCH (e) WHERE e.embedding IS NOT NULL RETURN e",
+        "CALL db.create.setNodeVectorProperty(e, 'embedding', e.embedding)",
+        {batchSize: 1000}
+      )
+      YIELD total
+      RETURN total
+      """
+    )
+    return result.single()['total']
+
+def run_vector_report():
+  parser = argparse.ArgumentParser(description="Report the footprint of embeddings by storage type and convert stored embeddings")
+  parser.add_argument('--cache-dir', default='.embeddings')
+  parser.add_argument('--limit', type=int, default=5000, help="Embeddings per entity type compared pairwise")
+  parser.add_argument('--convert-cache', choices=list(VECTOR_DTYPES), help="Rewrite the embedding cache with this vector type")
+  parser.add_argument('--convert-graph', action='store_true', help="Store all graph embeddings as float32 vector properties")
+  args = parser.parse_args()
+
+  vector_report(load_cached_embeddings(args.cache_dir), args.cache_dir, args.limit)
+  if args.convert_cache:
+    print(f"Rewrote {convert_cache(args.cache_dir, args.convert_cache)} cache files as {args.convert_cache}")
+  if args.convert_graph:
+    from .loader import create_loader_from_env
+    loader = create_loader_from_env()
+    print(f"Stored {convert_graph(loader.neo4j_driver)} graph embeddings as float32 vector properties")
+
+if __name__ == "__main__":
+  run_vector_report()
@@ -0,0 +1,208 @@
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+from .loader import DocumentLoader, create_loader_from_env
+
+# inotify event flags from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct('iIII')
+
+class InotifyWatcher:
+  """Recursive directory watcher on Linux inotify through ctypes.
+
+  New subdirectories are watched as they appear, and files already in them
+  are reported, since they may have been written before the watch was added.
+  """
+
+  def __init__(self, root: str):
+    libc_name = ctypes.util.find_library('c')
+    if libc_name is None:
+      raise OSError("libc not found")
+    self.libc = ctypes.CDLL(libc_name, use_errno=True)
+    if not hasattr(self.libc, 'inotify_init1'):
+      raise OSError("inotify is not available")
+    self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if self.fd < 0:
+      raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+    self.directories: Dict[int, Path] = {}
+    self._add_tree(Path(root))
+
+  def _add_watch(self, directory: Path) -> None:
+    wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+    if wd < 0:
+      raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+    self.directories[wd] = directory
+
+  def _add_tree(self, root: Path) -> List[Path]:
+    """Watch a directory tree and return the files already in it"""
+    files = []
+    for directory, _, file_names in os.walk(root):
+      self._add_watch(Path(directory))
+      files.extend(Path(directory) / name for name in file_names)
+    return files
+
+  def events(self, timeout: float) -> List[Path]:
+    """Paths created or written within the timeout"""
+    readable, _, _ = select.select([self.fd], [], [], timeout)
+    if not readable:
+      return []
+    try:
+      data = os.read(self.fd, 64 * 1024)
+    except BlockingIOError:
+      return []
+
+    paths = []
+    offset = 0
+    while offset < len(data):
+      wd, mask, _, name_length = EVENT_HEADER.unpack_from(data, offset)
+      name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + name_length].rstrip(b'\0')
+      offset += EVENT_HEADER.size + name_length
+      if mask & IN_Q_OVERFLOW:
+        print("inotify queue overflowed, rescanning the watched tree")
+        for directory in list(self.directories.values()):
+          paths.extend(p for p in directory.iterdir() if p.is_file())
+        continue
+      directory = self.directories.get(wd)
+      if directory is None or not name:
+        continue
+      path = directory / os.fsdecode(name)
+      if mask & IN_ISDIR:
+        if mask & (IN_CREATE | IN_MOVED_TO):
+          paths.extend(self._add_tree(path))
+      else:
+        paths.append(path)
+    return paths
+
+  def close(self) -> None:
+    os.close(self.fd)
+
+class PollingWatcher:
+  """Fallback watcher that compares file sizes and modification times on every poll"""
+
+  def __init__(self, root: str, interval: float = 2.0):
+    self.root = Path(root)
+    self.interval = interval
+    self.state = self._scan()
+
+  def _scan(self) -> Dict[Path, Tuple[int, int]]:
+    state = {}
+    for path in self.root.glob('**/*'):
+      try:
+        stat = path.stat()
+      except FileNotFoundError:
+        continue
+      if path.is_file():
+        state[path] = (stat.st_size, stat.st_mtime_ns)
+    return state
+
+  def events(self, timeout: float) -> List[Path]:
+    time.sleep(min(timeout, self.interval))
+    state = self._scan()
+    changed = [path for path, signature in state.items() if self.state.get(path) != signature]
+    self.state = state
+    return changed
+
+  def close(self) -> None:
+    pass
+
+class Debouncer:
+  """Collects paths until they have been quiet for a while, so bursty writes are processed once"""
+
+  def __init__(self, quiet_seconds: float):
+    self.quiet_seconds = quiet_seconds
+    self.pending: Dict[Path, float] = {}
+
+  def add(self, paths: List[Path]) -> None:
+    now = time.monotonic()
+    for path in paths:
+      self.pending[path] = now
+
+  def next_timeout(self, idle_timeout: float) -> float:
+    if not self.pending:
+      return idle_timeout
+    return max(0.0, min(self.pending.values()) + self.quiet_seconds - time.monotonic())
+
+  def ready(self) -> List[Path]:
+    now = time.monotonic()
+    ready = sorted(path for path, seen in self.pending.items() if now - seen >= self.quiet_seconds)
+    for path in ready:
+      del self.pending[path]
+    return ready
+
+def create_watcher(root: str, polling: bool = False, poll_interval: float = 2.0):
+  """inotify watcher, or the polling watcher when requested or inotify is unavailable"""
+  if not polling:
+    try:
+      return InotifyWatcher(root)
+    except OSError as e:
+      print(f"inotify unavailable ({e}), falling back to polling every {poll_interval}s")
+  return PollingWatcher(root, poll_interval)
+
+def watch(
+  loader: DocumentLoader,
+  root: str,
+  polling: bool = False,
+  debounce_seconds: float = 2.0,
+  scan_first: bool = False
+) -> Iterator[Tuple[Path, bool, float]]:
+  """Process supported files under root as they are created or modified.
+
+  The loader stays alive between events, so the embedding model, the Neo4j
+  driver and the in-process caches stay warm. Yields each processed path with
+  whether it succeeded and the seconds from its last write to the end of processing.
+  With scan_first the whole tree is processed first; the watcher is created
+  before the scan, so files written during it are processed afterwards.
+  """
+  watcher = create_watcher(root, polling)
+  debouncer = Debouncer(debounce_seconds)
+  print(f"Watching {root} with {type(watcher).__name__}")
+  try:
+    if scan_first:
+      loader.process_directory(root)
+    while True:
+      debouncer.add(watcher.events(debouncer.next_timeout(idle_timeout=60.0)))
+      for path in debouncer.ready():
+        if not path.is_file() or not loader.check_file_supported(path):
+          continue
+        try:
+          written_at = path.stat().st_mtime
+        except FileNotFoundError:
+          # Removed or renamed again before it was quiet
+          continue
+        processed = loader.process_file_isolated(str(path))
+        yield path, processed, time.time() - written_at
+  finally:
+    watcher.close()
+
+def run_watch():
+  parser = argparse.ArgumentParser(description="Continuously ingest documents created or modified in a directory tree")
+  parser.add_argument('directory', nargs='?', default='company_documents')
+  parser.add_argument('--poll', action='store_true', help="Poll for changes instead of using inotify")
+  parser.add_argument('--debounce', type=float, default=2.0, help="Seconds a file must be quiet before it is processed")
+  parser.add_argument('--scan-first', action='store_true', help="Process the whole directory before watching it")
+  args = parser.parse_args()
+
+  loader = create_loader_from_env()
+  # Load the embedding model or connect to the embedding server now, so the first event does not pay for it
+  loader.preload_embeddings()
+  for path, processed, latency in watch(loader, args.directory, args.poll, args.debounce, args.scan_first):
+    print(f"{'Ingested' if processed else 'Dead-lettered'} {path} {latency:.1f}s after its last write")
+
+if __name__ == "__main__":
+  run_watch()
@@ -0,0 +1,162 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, TypedDict
+
+class ConcurrencySettings(TypedDict, total=False):
+    initial: int
+    minimum: int
+    maximum: int
+    # Fraction the window is multiplied by on overload
+    decrease_factor: float
+    # A request slower than baseline latency times this factor counts as a latency spike
+    latency_spike_factor: float
+
+DEFAULT_CONCURRENCY_SETTINGS: Dict[str, ConcurrencySettings] = {
+    'llama_parse': {'initial': 4, 'minimum': 1, 'maximum': 16},
+    'llm': {'initial': 8, 'minimum': 1, 'maximum': 64},
+    'neo4j': {'initial': 4, 'minimum': 1, 'maximum': 32},
+}
+FALLBACK_CONCURRENCY_SETTINGS: ConcurrencySettings = {
+    'initial': 4,
+    'minimum': 1,
+    'maximum': 32,
+    'decrease_factor': 0.5,
+    'latency_spike_factor': 3.0,
+}
+
+OVERLOAD_STATUS_CODES = (429, 503)
+
+def is_overload_error(error: Exception) -> bool:
+    """Whether an error means the service is overloaded (HTTP 429/503 or a Neo4j transient error)"""
+    status_code = getattr(error, 'status_code', None)
+    if status_code is None:
+        status_code = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status_code in OVERLOAD_STATUS_CODES:
+        return True
+    code = getattr(error, 'code', None)
+    return isinstance(code, str) and code.startswith('Neo.TransientError')
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD limit on the number of in-flight requests to one service.
+
+    Every healthy completion grows the window by 1/window, so the window grows
+    by about one per round of requests. An overload error or a latency spike
+    multiplies the window by the decrease factor, at most once per round so a
+    burst of failures from the same round only backs off once.
+
+    Latency spikes are judged against a baseline per operation, since the
+    operations of one service (e.g. an upload and a status poll) take very
+    different times.
+    """
+
+    def __init__(self, service: str, settings: ConcurrencySettings):
+        self.service = service
+        self.settings = {**FALLBACK_CONCURRENCY_SETTINGS, **settings}
+        self.window = float(self.settings['initial'])
+        self.in_flight = 0
+        self.baseline_latencies: Dict[str, float] = {}
+        self.last_latency = None
+        self.increases = 0
+        self.decreases = 0
+        self.errors = 0
+        self.completed = 0
+        self._last_decrease_at = 0.0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def slot(self, operation: str = 'request') -> Iterator[None]:
+        """Hold one in-flight slot for the duration of a request of the given operation class"""
+        with self._condition:
+            while self.in_flight >= int(self.window):
+                self._condition.wait()
+            self.in_flight += 1
+
+        started_at = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            # Also an abandoned stream (GeneratorExit), so the slot is never leaked
+            self._release(operation, started_at, overloaded=is_overload_error(e), failed=True)
+            raise
+        else:
+            self._release(operation, started_at, overloaded=False, failed=False)
+
+    def _release(self, operation: str, started_at: float, overloaded: bool, failed: bool) -> None:
+        now = time.monotonic()
+        latency = now - started_at
+        with self._condition:
+            self.in_flight -= 1
+            self.completed += 1
+            self.last_latency = latency
+            if failed:
+                self.errors += 1
+
+            baseline = self.baseline_latencies.get(operation)
+            spike = (
+                not failed
+                and baseline is not None
+                and latency > baseline * self.settings['latency_spike_factor']
+            )
+            if not failed:
+                # Slow moving baseline, so a spike stands out but a lasting change in latency is absorbed
+                self.baseline_latencies[operation] = latency if baseline is None else 0.9 * baseline + 0.1 * latency
+            if overloaded or spike:
+                self._decrease(now, operation)
+            elif not failed:
+                if self.window < self.settings['maximum']:
+                    self.window = min(self.settings['maximum'], self.window + 1 / self.window)
+                    self.increases += 1
+            self._condition.notify_all()
+
+    def _decrease(self, now: float, operation: str) -> None:
+        round_seconds = self.baseline_latencies.get(operation) or 0.0
+        if now - self._last_decrease_at < round_seconds:
+            return
+        self.window = max(self.settings['minimum'], self.window * self.settings['decrease_factor'])
+        self.decreases += 1
+        self._last_decrease_at = now
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                'window': self.window,
+                'in_flight': self.in_flight,
+                'baseline_latencies': dict(self.baseline_latencies),
+                'last_latency': self.last_latency,
+                'increases': self.increases,
+                'decreases': self.decreases,
+                'errors': self.errors,
+                'completed': self.completed,
+            }
+
+_limiters: Dict[str, AdaptiveConcurrencyLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def load_concurrency_settings() -> Dict[str, ConcurrencySettings]:
+    """Per-service settings, with overrides from the ADAPTIVE_CONCURRENCY environment variable.
+
+    ADAPTIVE_CONCURRENCY holds a JSON object keyed by service name, for example
+    {"llm": {"initial": 16, "maximum": 128}}
+    """
+    settings = {service: dict(service_settings) for service, service_settings in DEFAULT_CONCURRENCY_SETTINGS.items()}
+    overrides = os.getenv('ADAPTIVE_CONCURRENCY')
+    if overrides:
+        for service, service_settings in json.loads(overrides).items():
+            settings.setdefault(service, {}).update(service_settings)
+    return settings
+
+def get_concurrency_limiter(service: str) -> AdaptiveConcurrencyLimiter:
+    """Get the limiter shared by every caller of a service in this process"""
+    with _limiters_lock:
+        if service not in _limiters:
+            _limiters[service] = AdaptiveConcurrencyLimiter(service, load_concurrency_settings().get(service, {}))
+        return _limiters[service]
+
+def concurrency_windows() -> Dict[str, Dict[str, Any]]:
+    """Current concurrency window and counters of every service seen so far"""
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {service: limiter.snapshot() for service, limiter in limiters.items()}
@@ -0,0 +1,130 @@
+import json
+import os
+import struct
+import uuid
+from pathlib import Path
+from typing import Any, Optional, Tuple
+
+import numpy as np
+
+try:
+  import msgpack
+except ImportError:
+  msgpack = None
+
+MAGIC = b'DLAF'
+# Version 2 adds the vector type after the header, version 1 artifacts are always float32
+FORMAT_VERSION = 2
+
+ENCODING_JSON = 0
+ENCODING_MSGPACK = 1
+
+# magic, format version, structure encoding, structure version, structure length, vector rows, vector dimensions
+HEADER = struct.Struct('<4sHBBIII')
+
+# vector type code, padding
+VECTOR_HEADER = struct.Struct('<B3x')
+
+# Vectors are stored as raw little-endian floats after the structure, aligned for np.frombuffer
+VECTOR_DTYPES = {'float32': np.dtype('<f4'), 'float16': np.dtype('<f2')}
+VECTOR_DTYPE_CODES = {'float32': 0, 'float16': 1}
+VECTOR_DTYPE = VECTOR_DTYPES['float32']
+VECTOR_ALIGNMENT = VECTOR_DTYPE.itemsize
+
+class ArtifactError(ValueError):
+  """Raised when a file is not an artifact of the expected format or structure version"""
+
+def write_artifact(
+  path: Path,
+  structure: Any,
+  vectors: Optional[np.ndarray],
+  structure_version: int,
+  vector_dtype: str = 'float32'
+) -> None:
+  """Write a structure (msgpack if available, JSON otherwise) and a vector block to one file.
+
+  The file is written to a temporary name and renamed, so readers never see a partial artifact.
+
+  Args:
+    path: Destination path
+    structure: JSON-compatible structure
+    vectors: 2D array of vectors, or None
+    structure_version: Version of the structure's layout, checked when reading
+    vector_dtype: 'float32', or 'float16' to halve the size of the vector block
+  """
+  if msgpack is not None:
+    encoding, body = ENCODING_MSGPACK, msgpack.packb(structure, use_bin_type=True)
+  else:
+    encoding, body = ENCODING_JSON, json.dumps(structure, separators=(',', ':')).encode()
+
+  if vector_dtype not in VECTOR_DTYPES:
+    raise ValueError(f"Unsupported vector type {vector_dtype}, expected one of {', '.join(VECTOR_DTYPES)}")
+  dtype = VECTOR_DTYPES[vector_dtype]
+  if vectors is None:
+    vectors = np.empty((0, 0), dtype=dtype)
+  vectors = np.ascontiguousarray(vectors, dtype=dtype)
+  rows, dimensions = vectors.shape
+
+  header = (
+    HEADER.pack(MAGIC, FORMAT_VERSION, encoding, structure_version, len(body), rows, dimensions)
+    + VECTOR_HEADER.pack(VECTOR_DTYPE_CODES[vector_dtype])
+  )
+  padding = -(len(header) + len(body)) % VECTOR_ALIGNMENT
+
+  path.parent.mkdir(parents=True, exist_ok=True)
+  # Unique per writer, threads of one process may write the same artifact
+  temp_path = path.with_name(f"{path.name}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+  with open(temp_path, 'wb') as f:
+    f.write(header)
+    f.write(body)
+    f.write(b'\0' * padding)
+    if vectors.size:
+      # Written from the array's buffer without a copy; a view with a zero-length axis cannot be cast
+      f.write(memoryview(vectors).cast('B'))
+  os.replace(temp_path, path)
+
+def read_artifact(path: Path, structure_version: int) -> Tuple[Any, np.ndarray]:
+  """Read an artifact written by write_artifact.
+
+  The vectors are a read-only view over the file contents in their stored type, they are not copied.
+
+  Raises:
+    ArtifactError: The file is not an artifact, or has another format or structure version
+  """
+  data = memoryview(path.read_bytes())
+  if len(data) < HEADER.size:
+    raise ArtifactError(f"{path} is too short to be an artifact")
+  magic, format_version, encoding, version, body_length, rows, dimensions = HEADER.unpack_from(data)
+  if magic != MAGIC or format_version not in (1, FORMAT_VERSION):
+    raise ArtifactError(f"{path} is not a version 1 or {FORMAT_VERSION} artifact")
+  if version != structure_version:
+    raise ArtifactError(f"{path} has structure version {version}, expected {structure_version}")
+
+  header_size = HEADER.size
+  dtype = VECTOR_DTYPE
+  if format_version >= 2:
+    if len(data) < HEADER.size + VECTOR_HEADER.size:
+      raise ArtifactError(f"{path} is truncated")
+    code, = VECTOR_HEADER.unpack_from(data, HEADER.size)
+    names = {code: name for name, code in VECTOR_DTYPE_CODES.items()}
+    if code not in names:
+      raise ArtifactError(f"{path} has unknown vector type {code}")
+    dtype = VECTOR_DTYPES[names[code]]
+    header_size += VECTOR_HEADER.size
+
+  body = data[header_size:header_size + body_length]
+  if encoding == ENCODING_MSGPACK:
+    if msgpack is None:
+      raise ArtifactError(f"{path} is msgpack encoded but msgpack is not installed")
+    structure = msgpack.unpackb(body, raw=False)
+  elif encoding == ENCODING_JSON:
+    structure = json.loads(bytes(body))
+  else:
+    raise ArtifactError(f"{path} has unknown structure encoding {encoding}")
+
+  offset = header_size + body_length
+  offset += -offset % VECTOR_ALIGNMENT
+  if len(data) < offset + rows * dimensions * dtype.itemsize:
+    raise ArtifactError(f"{path} is truncated")
+  vectors = np.frombuffer(data, dtype=dtype, count=rows * dimensions, offset=offset).reshape(rows, dimensions)
+  return structure, vectors
@@ -0,0 +1,268 @@
+import argparse
+import json
+import sys
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import List, Optional, TypedDict
+
+import numpy as np
+
+DEFAULT_MODEL = 'all-MiniLM-L6-v2'
+DEFAULT_ONNX_DIR = '.models/all-MiniLM-L6-v2-int8'
+# Entity resolution merges entities above this cosine similarity
+RESOLUTION_THRESHOLD = 0.95
+# Largest allowed drop of the cosine between reference and candidate vectors of the same text
+DEFAULT_TOLERANCE = 0.01
+
+class EmbeddingBackend(ABC):
+  """Encodes texts into float32 rows of a fixed dimension"""
+
+  dimensions: int
+
+  @abstractmethod
+  def encode(self, texts: List[str]) -> np.ndarray:
+    """Embeddings of the texts as a (len(texts), dimensions) float32 array, also when texts is empty"""
+
+class SentenceTransformerBackend(EmbeddingBackend):
+  """Reference backend running the SentenceTransformer model with PyTorch"""
+
+  def __init__(self, model_name: str = DEFAULT_MODEL, threads: Optional[int] = None):
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    if threads:
+      torch.set_num_threads(threads)
+    self.model = SentenceTransformer(model_name)
+    self.dimensions = self.model.get_sentence_embedding_dimension()
+
+  def encode(self, texts: List[str]) -> np.ndarray:
+    if not texts:
+      return np.empty((0, self.dimensions), dtype=np.float32)
+    return self.model.encode(texts, convert_to_numpy=True).astype(np.float32, copy=False)
+
+class OnnxBackend(EmbeddingBackend):
+  """int8-quantised export of a SentenceTransformer model on ONNX Runtime's CPU provider.
+
+  Mean pooling and normalisation, which SentenceTransformer runs as modules
+  after the transformer, are done in numpy on the token embeddings.
+  """
+
+  def __init__(self, model_dir: str = DEFAULT_ONNX_DIR, threads: Optional[int] = None, batch_size: int = 64):
+    import onnxruntime
+    from tokenizers import Tokenizer
+
+    model_dir = Path(model_dir)
+    config = json.loads((model_dir / 'backend.json').read_text())
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    # Batches run one at a time, parallelism is within the operators
+    options.inter_op_num_threads = 1
+    if threads:
+      options.intra_op_num_threads = threads
+    self.session = onnxruntime.InferenceSession(
+      str(model_dir / config['model_file']),
+      options,
+      providers=['CPUExecutionProvider']
+    )
+    self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+    self.tokenizer = Tokenizer.from_file(str(model_dir / 'tokenizer.json'))
+    self.tokenizer.enable_truncation(config['max_seq_length'])
+    self.tokenizer.enable_padding()
+    self.dimensions = config['dimensions']
+    self.normalize = config['normalize']
+    self.batch_size = batch_size
+
+  def encode(self, texts: List[str]) -> np.ndarray:
+    vectors = np.empty((len(texts), self.dimensions), dtype=np.float32)
+    # Texts of similar length are batched together to keep padding short
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    for start in range(0, len(order), self.batch_size):
+      indices = order[start:start + self.batch_size]
+      encodings = self.tokenizer.encode_batch([texts[i] for i in indices])
+      mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+      feed = {'input_ids': np.array([e.ids for e in encodings], dtype=np.int64), 'attention_mask': mask}
+      if 'token_type_ids' in self.input_names:
+        feed['token_type_ids'] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+      hidden = self.session.run(['last_hidden_state'], feed)[0]
+      weights = mask[..., None].astype(np.float32)
+      pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+      if self.normalize:
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+      vectors[indices] = pooled
+    return vectors
+
+def create_embedding_backend(spec: str = 'sentence-transformers', threads: Optional[int] = None) -> EmbeddingBackend:
+  """Backend from a spec: 'sentence-transformers[:<model>]' or 'onnx[:<model dir>]'"""
+  kind, _, argument = spec.partition(':')
+  if kind == 'sentence-transformers':
+    return SentenceTransformerBackend(argument or DEFAULT_MODEL, threads)
+  if kind == 'onnx':
+    return OnnxBackend(argument or DEFAULT_ONNX_DIR, threads)
+  raise ValueError(f"Unknown embedding backend {spec}, expected sentence-transformers[:<model>] or onnx[:<model dir>]")
+
+def canonical_backend_spec(spec: str) -> str:
+  """Spec without the default model, so equivalent specs compare equal, e.g. 'onnx' for 'onnx:<default dir>'"""
+  kind, _, argument = spec.partition(':')
+  if (kind, argument) in (('sentence-transformers', DEFAULT_MODEL), ('onnx', DEFAULT_ONNX_DIR)):
+    return kind
+  return spec
+
+def export_onnx(model_name: str = DEFAULT_MODEL, output_dir: str = DEFAULT_ONNX_DIR, opset: int = 17) -> Path:
+  """Export the transformer of a SentenceTransformer model to ONNX and quantise its weights to int8
+
+  Returns:
+    The directory holding the quantised model, its tokenizer and backend.json
+  """
+  import torch
+  from onnxruntime.quantization import QuantType, quantize_dynamic
+  from sentence_transformers import SentenceTransformer
+
+  model = SentenceTransformer(model_name, device='cpu')
+  pooling = model[1]
+  if not getattr(pooling, 'pooling_mode_mean_tokens', False):
+    raise ValueError(f"{model_name} does not use mean pooling, which the ONNX backend implements")
+  transformer = model[0].auto_model.eval()
+
+  class LastHiddenState(torch.nn.Module):
+    def __init__(self):
+      super().__init__()
+      self.transformer = transformer
+
+    def forward(self, *inputs):
+      return self.transformer(*inputs).last_hidden_state
+
+  output = Path(output_dir)
+  output.mkdir(parents=True, exist_ok=True)
+  model.tokenizer.save_pretrained(output)
+  sample = model.tokenizer(['ServiceTech Solutions : Organization'], return_tensors='pt')
+  input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+  dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names + ['last_hidden_state']}
+
+  float_path = output / 'model.onnx'
+  with torch.no_grad():
+    torch.onnx.export(
+      LastHiddenState(),
+      tuple(sample[name] for name in input_names),
+      str(float_path),
+      input_names=input_names,
+      output_names=['last_hidden_state'],
+      dynamic_axes=dynamic_axes,
+      opset_version=opset,
+    )
+  quantize_dynamic(str(float_path), str(output / 'model.int8.onnx'), weight_type=QuantType.QInt8)
+
+  (output / 'backend.json').write_text(json.dumps({
+    'model': model_name,
+    'model_file': 'model.int8.onnx',
+    'max_seq_length': model.max_seq_length,
+    'dimensions': model.get_sentence_embedding_dimension(),
+    'normalize': any(type(module).__name__ == 'Normalize' for module in model),
+  }, indent=2))
+  return output
+
+class BackendComparison(TypedDict):
+  texts: int
+  min_cosine: float
+  mean_cosine: float
+  # Largest change of a pairwise similarity between the two backends
+  max_similarity_drift: float
+  # Pairs on different sides of the resolution threshold with the two backends
+  flipped_pairs: int
+  reference_seconds: float
+  candidate_seconds: float
+
+def compare_backends(
+  reference: EmbeddingBackend,
+  candidate: EmbeddingBackend,
+  texts: List[str],
+  threshold: float = RESOLUTION_THRESHOLD
+) -> BackendComparison:
+  """Compare the vectors of two backends for the same texts, and the resolution decisions they lead to"""
+  start = time.perf_counter()
+  expected = reference.encode(texts)
+  reference_seconds = time.perf_counter() - start
+  start = time.perf_counter()
+  actual = candidate.encode(texts)
+  candidate_seconds = time.perf_counter() - start
+
+  expected = expected / np.linalg.norm(expected, axis=1, keepdims=True)
+  actual = actual / np.linalg.norm(actual, axis=1, keepdims=True)
+  cosines = (expected * actual).sum(axis=1)
+  expected_similarity = expected @ expected.T
+  actual_similarity = actual @ actual.T
+  upper = np.triu_indices(len(texts), k=1)
+  flipped = (expected_similarity[upper] >= threshold) != (actual_similarity[upper] >= threshold)
+
+  return {
+    'texts': len(texts),
+    'min_cosine': float(cosines.min()),
+    'mean_cosine': float(cosines.mean()),
+    'max_similarity_drift': float(np.abs(expected_similarity - actual_similarity)[upper].max(initial=0.0)),
+    'flipped_pairs': int(flipped.sum()),
+    'reference_seconds': reference_seconds,
+    'candidate_seconds': candidate_seconds,
+  }
+
+def sample_texts(limit: int = 2000) -> List[str]:
+  """Entity texts, as embedded for resolution, from the extraction cache"""
+  texts = set()
+  for cache_path in sorted(Path('.extracted').glob('**/*.json')):
+    for entity in json.loads(cache_path.read_text()).get('entities', []):
+      properties = entity.get('properties', {})
+      name = properties.get('name') or properties.get('description')
+      if name:
+        texts.add(f"{name} : {entity['type']}")
+    if len(texts) >= limit:
+      break
+  return sorted(texts)[:limit]
+
+def run_embedding_backends():
+  parser = argparse.ArgumentParser(description="Export and verify the quantised ONNX embedding backend")
+  subparsers = parser.add_subparsers(dest='command', required=True)
+  export_parser = subparsers.add_parser('export', help="Export and quantise the model, then verify it")
+  export_parser.add_argument('--model', default=DEFAULT_MODEL)
+  export_parser.add_argument('--output', default=DEFAULT_ONNX_DIR)
+  verify_parser = subparsers.add_parser('verify', help="Compare a backend with the reference SentenceTransformer model")
+  verify_parser.add_argument('--backend', default=f"onnx:{DEFAULT_ONNX_DIR}")
+  for subparser in (export_parser, verify_parser):
+    subparser.add_argument('--texts', help="File with one text per line, default: entity names from .extracted/")
+    subparser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    subparser.add_argument('--threads', type=int)
+  args = parser.parse_args()
+
+  if args.command == 'export':
+    output = export_onnx(args.model, args.output)
+    print(f"Exported {args.model} to {output}")
+    with open(output / 'backend.json') as f:
+      reference_spec = f"sentence-transformers:{json.load(f)['model']}"
+    candidate_spec = f"onnx:{output}"
+  else:
+    candidate_spec = args.backend
+    reference_spec = 'sentence-transformers'
+    if candidate_spec.startswith('onnx'):
+      backend_config = Path(candidate_spec.partition(':')[2] or DEFAULT_ONNX_DIR) / 'backend.json'
+      reference_spec = f"sentence-transformers:{json.loads(backend_config.read_text())['model']}"
+
+  texts = Path(args.texts).read_text().splitlines() if args.texts else sample_texts()
+  if not texts:
+    print("No texts to verify with, pass --texts or run the loader first")
+    sys.exit(1)
+  comparison = compare_backends(
+    create_embedding_backend(reference_spec, args.threads),
+    create_embedding_backend(candidate_spec, args.threads),
+    texts
+  )
+  print(
+    f"{comparison['texts']} texts: cosine to reference min {comparison['min_cosine']:.4f}, "
+    f"mean {comparison['mean_cosine']:.4f}; pairwise similarity drift up to {comparison['max_similarity_drift']:.4f}, "
+    f"{comparison['flipped_pairs']} pairs change side of the {RESOLUTION_THRESHOLD} resolution threshold"
+  )
+  print(f"Encoding took {comparison['reference_seconds']:.2f}s with the reference, {comparison['candidate_seconds']:.2f}s with {candidate_spec}")
+  if comparison['min_cosine'] < 1 - args.tolerance or comparison['max_similarity_drift'] > args.tolerance:
+    print(f"{candidate_spec} is outside the tolerance of {args.tolerance}, keep the reference backend")
+    sys.exit(1)
+  print(f"{candidate_spec} is within the tolerance of {args.tolerance}")
+
+if __name__ == "__main__":
+  run_embedding_backends()
@@ -0,0 +1,262 @@
+import argparse
+import atexit
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .embedding_backends import EmbeddingBackend, canonical_backend_spec, create_embedding_backend
+
+DEFAULT_SOCKET_PATH = '.embedding.sock'
+# Messages are a 4 byte big-endian length followed by a JSON body
+LENGTH = struct.Struct('>I')
+
+def send_message(sock: socket.socket, message: Dict[str, Any]) -> None:
+  body = json.dumps(message).encode()
+  sock.sendall(LENGTH.pack(len(body)) + body)
+
+def receive_message(sock: socket.socket) -> Optional[Dict[str, Any]]:
+  """Next message on the socket, or None when the peer closed it"""
+  header = _receive_exactly(sock, LENGTH.size)
+  if header is None:
+    return None
+  body = _receive_exactly(sock, LENGTH.unpack(header)[0])
+  if body is None:
+    return None
+  return json.loads(body)
+
+def _receive_exactly(sock: socket.socket, size: int) -> Optional[bytes]:
+  data = bytearray()
+  while len(data) < size:
+    chunk = sock.recv(size - len(data))
+    if not chunk:
+      return None
+    data.extend(chunk)
+  return bytes(data)
+
+def attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+  """Attach to a block created by another process without taking ownership of it.
+
+  Before Python 3.13 every attaching process registers the block with its
+  resource tracker, which unlinks it when that process exits.
+  """
+  block = shared_memory.SharedMemory(name=name)
+  resource_tracker.unregister(block._name, 'shared_memory')
+  return block
+
+class MicroBatcher:
+  """Encodes the texts of concurrent requests together.
+
+  The first waiting request opens a batch, which collects further requests
+  for up to window seconds or until it holds max_batch texts, and is then
+  encoded with one call to the model.
+  """
+
+  def __init__(self, model: EmbeddingBackend, window: float = 0.005, max_batch: int = 256):
+    self.model = model
+    self.window = window
+    self.max_batch = max_batch
+    self._requests: queue.Queue = queue.Queue()
+    self.batches = 0
+    self.texts = 0
+    threading.Thread(target=self._run, daemon=True).start()
+
+  def encode(self, texts: List[str]) -> np.ndarray:
+    done = threading.Event()
+    slot: Dict[str, Any] = {}
+    self._requests.put((texts, done, slot))
+    done.wait()
+    if 'error' in slot:
+      raise slot['error']
+    return slot['vectors']
+
+  def _collect(self) -> List[Tuple[List[str], threading.Event, Dict[str, Any]]]:
+    batch = [self._requests.get()]
+    size = len(batch[0][0])
+    deadline = time.monotonic() + self.window
+    while size < self.max_batch:
+      remaining = deadline - time.monotonic()
+      if remaining <= 0:
+        break
+      try:
+        request = self._requests.get(timeout=remaining)
+      except queue.Empty:
+        break
+      batch.append(request)
+      size += len(request[0])
+    return batch
+
+  def _run(self) -> None:
+    while True:
+      batch = self._collect()
+      texts = [text for request_texts, _, _ in batch for text in request_texts]
+      try:
+        vectors = self.model.encode(texts)
+        self.batches += 1
+        self.texts += len(texts)
+        offset = 0
+        for request_texts, _, slot in batch:
+          slot['vectors'] = vectors[offset:offset + len(request_texts)]
+          offset += len(request_texts)
+      except Exception as e:
+        for _, _, slot in batch:
+          slot['error'] = e
+      for _, done, _ in batch:
+        done.set()
+
+class EmbeddingRequestHandler(socketserver.BaseRequestHandler):
+  """One connection of a loader thread: a hello with the dimensions, then encode requests"""
+
+  def handle(self) -> None:
+    batcher: MicroBatcher = self.server.batcher
+    blocks: Dict[str, shared_memory.SharedMemory] = {}
+    try:
+      while (message := receive_message(self.request)) is not None:
+        if message['op'] == 'hello':
+          send_message(self.request, {'dimensions': self.server.dimensions, 'model': self.server.model_name})
+          continue
+        try:
+          vectors = batcher.encode(message['texts'])
+          block = blocks.get(message['shm'])
+          if block is None:
+            # The client replaces its block when it needs a larger one
+            for old in blocks.values():
+              old.close()
+            blocks = {message['shm']: attach_shared_memory(message['shm'])}
+            block = blocks[message['shm']]
+          out = np.ndarray(vectors.shape, dtype=np.float32, buffer=block.buf)
+          out[:] = vectors
+          del out
+          send_message(self.request, {'rows': len(vectors)})
+        except Exception as e:
+          send_message(self.request, {'error': f"{type(e).__name__}: {e}"})
+    finally:
+      for block in blocks.values():
+        block.close()
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+  """Serves one embedding model to every loader process on the host over a Unix socket"""
+
+  daemon_threads = True
+
+  def __init__(self, socket_path: str, model: EmbeddingBackend, model_name: str, window: float = 0.005, max_batch: int = 256):
+    if os.path.exists(socket_path):
+      os.unlink(socket_path)
+    super().__init__(socket_path, EmbeddingRequestHandler)
+    self.model_name = model_name
+    self.dimensions = model.dimensions
+    self.batcher = MicroBatcher(model, window, max_batch)
+
+class _Connection:
+  def __init__(self, socket_path: str):
+    self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    self.sock.connect(socket_path)
+    send_message(self.sock, {'op': 'hello'})
+    hello = receive_message(self.sock)
+    if hello is None:
+      raise ConnectionError("Embedding server closed the connection")
+    self.dimensions = hello['dimensions']
+    self.model = hello['model']
+    self.block: Optional[shared_memory.SharedMemory] = None
+
+  def encode(self, texts: List[str]) -> np.ndarray:
+    size = len(texts) * self.dimensions * 4
+    if self.block is None or self.block.size < size:
+      self.close_block()
+      # Grown in powers of two so a few large requests do not reallocate every time
+      self.block = shared_memory.SharedMemory(create=True, size=max(1 << (size - 1).bit_length(), 64 * 1024))
+    send_message(self.sock, {'op': 'encode', 'texts': texts, 'shm': self.block.name})
+    reply = receive_message(self.sock)
+    if reply is None:
+      raise ConnectionError("Embedding server closed the connection")
+    if 'error' in reply:
+      raise RuntimeError(f"Embedding server failed: {reply['error']}")
+    # The vectors are read straight out of the shared block, one copy detaches them from it
+    return np.ndarray((reply['rows'], self.dimensions), dtype=np.float32, buffer=self.block.buf).copy()
+
+  def close_block(self) -> None:
+    if self.block is not None:
+      self.block.close()
+      self.block.unlink()
+      self.block = None
+
+  def close(self) -> None:
+    self.close_block()
+    self.sock.close()
+
+class EmbeddingClient:
+  """Client of an EmbeddingServer with one connection and shared-memory block per thread.
+
+  The backend the server reports must be expected_model when one is given,
+  otherwise the one reported on the first connection, so vectors of different
+  models are never mixed, for example after the server was restarted with
+  another backend.
+  """
+
+  def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH, expected_model: Optional[str] = None):
+    self.socket_path = socket_path
+    self.expected_model = canonical_backend_spec(expected_model) if expected_model else None
+    self._local = threading.local()
+    self._connections: List[_Connection] = []
+    self._lock = threading.Lock()
+    atexit.register(self.close)
+
+  def _connection(self) -> _Connection:
+    connection = getattr(self._local, 'connection', None)
+    if connection is None:
+      connection = _Connection(self.socket_path)
+      with self._lock:
+        if self.expected_model is None:
+          self.expected_model = connection.model
+        if connection.model != self.expected_model:
+          connection.close()
+          raise ValueError(f"Embedding server at {self.socket_path} serves {connection.model}, expected {self.expected_model}")
+        self._connections.append(connection)
+      self._local.connection = connection
+    return connection
+
+  @property
+  def model(self) -> str:
+    """Backend spec of the model the server encodes with"""
+    return self._connection().model
+
+  def encode(self, texts: List[str]) -> np.ndarray:
+    """Embed texts as float32 rows"""
+    if not texts:
+      return np.empty((0, self._connection().dimensions), dtype=np.float32)
+    return self._connection().encode(texts)
+
+  def close(self) -> None:
+    with self._lock:
+      for connection in self._connections:
+        connection.close()
+      self._connections = []
+
+def run_embedding_server():
+  parser = argparse.ArgumentParser(description="Serve one embedding model to the loader processes on this host")
+  parser.add_argument('--socket', default=DEFAULT_SOCKET_PATH)
+  parser.add_argument('--backend', default='sentence-transformers', help="sentence-transformers[:<model>] or onnx[:<model dir>]")
+  parser.add_argument('--threads', type=int, help="CPU threads of the embedding backend")
+  parser.add_argument('--window-ms', type=float, default=5.0, help="How long a batch waits for more requests")
+  parser.add_argument('--max-batch', type=int, default=256, help="Texts per model call")
+  args = parser.parse_args()
+
+  backend = create_embedding_backend(args.backend, args.threads)
+  server = EmbeddingServer(args.socket, backend, canonical_backend_spec(args.backend), args.window_ms / 1000, args.max_batch)
+  print(f"Embedding server for {args.backend} listening on {args.socket}")
+  try:
+    server.serve_forever()
+  finally:
+    print(f"Encoded {server.batcher.texts} texts in {server.batcher.batches} batches")
+    os.unlink(args.socket)
+
+if __name__ == "__main__":
+  run_embedding_server()
@@ -0,0 +1,89 @@
+import hashlib
+import io
+import mmap
+import os
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterator, List, Optional, Union
+
+# Read size for hashing and uploads, large enough for sequential throughput and small enough to keep memory flat
+CHUNK_SIZE = 1024 * 1024
+
+def file_md5(path: Union[str, Path], chunk_size: int = CHUNK_SIZE) -> str:
+    """MD5 of a file, hashed in chunks from a memory map so the file is never read into memory as a whole"""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        digest = hashlib.md5()
+        if size == 0:
+            return digest.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, size, chunk_size):
+                    digest.update(view[offset:offset + chunk_size])
+            finally:
+                view.release()
+    return digest.hexdigest()
+
+class MultipartFileBody:
+    """multipart/form-data request body that streams a file from disk.
+
+    requests sends iterable, file-like bodies in blocks instead of building the
+    body in memory, and takes the Content-Length from the len attribute. Form fields and
+    part headers are small and kept in memory, the file itself is read as it is sent.
+    """
+
+    def __init__(self, fields: Dict[str, str], file_field: str, path: Union[str, Path], file_name: str, mime_type: str):
+        self.boundary = uuid.uuid4().hex
+        preamble = b''.join(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+            for name, value in fields.items()
+        )
+        preamble += (
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="{file_field}"; filename="{file_name}"\r\n'
+            f'Content-Type: {mime_type}\r\n\r\n'
+        ).encode()
+        epilogue = f'\r\n--{self.boundary}--\r\n'.encode()
+
+        self.path = Path(path)
+        self.len = len(preamble) + self.path.stat().st_size + len(epilogue)
+        self._parts: List[Optional[BinaryIO]] = [io.BytesIO(preamble), None, io.BytesIO(epilogue)]
+        self._index = 0
+
+    @property
+    def content_type(self) -> str:
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            # Reading everything returns the next chunk instead, so the body is never held in memory
+            size = CHUNK_SIZE
+        while self._index < len(self._parts):
+            part = self._parts[self._index]
+            if part is None:
+                # The file is only opened once the preamble has been sent
+                part = self._parts[self._index] = open(self.path, 'rb')
+            chunk = part.read(size)
+            if chunk:
+                return chunk
+            part.close()
+            self._index += 1
+        return b''
+
+    def __iter__(self) -> Iterator[bytes]:
+        while chunk := self.read(CHUNK_SIZE):
+            yield chunk
+
+    def close(self) -> None:
+        for part in self._parts:
+            if part is not None:
+                part.close()
+
+def write_text_atomic(path: Union[str, Path], text: str) -> None:
+    """Write a text file through a temporary file and a rename, so readers never see a partial file"""
+    path = Path(path)
+    temp_path = path.with_name(f"{path.name}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+    with open(temp_path, 'w') as f:
+        f.write(text)
+    os.replace(temp_path, path)
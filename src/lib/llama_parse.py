@@ -2,8 +2,14 @@ import os
 import time
 from typing import Union, Literal, TypedDict, Optional, List, Dict, Any
 from io import BufferedReader, BytesIO
+from pathlib import Path
 import requests
 
+from .adaptive_concurrency import get_concurrency_limiter
+from .file_streams import MultipartFileBody
+
+DEFAULT_PAGE_SEPARATOR = "\n\n---\n\n"
+
 class TimeoutError(Exception):
     pass
 
@@ -65,14 +71,24 @@ class LlamaParseClient:
     def __init__(self, api_key: str):
         self.api_key = api_key
         self.base_url = 'https://api.cloud.llamaindex.ai/api/parsing'
+        self.concurrency = get_concurrency_limiter('llama_parse')
+
+    def _request(self, method: str, url: str, operation: str, **kwargs) -> requests.Response:
+        """Send a request within the adaptive concurrency window of the LlamaParse API.
+        Uploads, status polls and result downloads keep separate latency baselines."""
+        with self.concurrency.slot(operation):
+            response = requests.request(method, url, **kwargs)
+            response.raise_for_status()
+        return response
 
     def upload_file(
         self,
-        file_content: Union[BufferedReader, bytes, str],
+        file_content: Union[BufferedReader, bytes, str, Path],
         file_name: str,
         mime_type: str,
         **options
     ) -> UploadResponse:
+        """Upload a document. A Path is streamed from disk instead of being read into memory."""
         main_mime_type = mime_type.split(';')[0]
         if main_mime_type not in SUPPORTED_MIME_TYPES:
             raise ValueError(f"Unsupported mime type: {main_mime_type}")
@@ -81,27 +97,42 @@ class LlamaParseClient:
         if isinstance(file_content, str):
             file_content = file_content.encode('utf-8')
 
-        files = {
-            'file': (file_name, file_content, main_mime_type)
-        }
-
         # Prepare form data
         data = {k: str(v) for k, v in options.items() if v is not None}
         if 'page_separator' not in data:
-            data['page_separator'] = "\n\n---\n\n"
+            data['page_separator'] = DEFAULT_PAGE_SEPARATOR
 
         headers = {
             'Accept': 'application/json',
             'Authorization': f'Bearer {self.api_key}'
         }
 
-        response = requests.post(
+        if isinstance(file_content, Path):
+            body = MultipartFileBody(data, 'file', file_content, os.path.basename(file_name), main_mime_type)
+            try:
+                response = self._request(
+                    'POST',
+                    f"{self.base_url}/upload",
+                    'upload',
+                    headers={**headers, 'Content-Type': body.content_type},
+                    data=body
+                )
+            finally:
+                body.close()
+            return response.json()
+
+        files = {
+            'file': (file_name, file_content, main_mime_type)
+        }
+
+        response = self._request(
+            'POST',
             f"{self.base_url}/upload",
+            'upload',
             headers=headers,
             files=files,
             data=data
         )
-        response.raise_for_status()
         return response.json()
 
     def get_job(self, job_id: str) -> JobStatus:
@@ -109,11 +140,12 @@ class LlamaParseClient:
             'Accept': 'application/json',
             'Authorization': f'Bearer {self.api_key}'
         }
-        response = requests.get(
+        response = self._request(
+            'GET',
             f"{self.base_url}/job/{job_id}",
+            'status',
             headers=headers
         )
-        response.raise_for_status()
         return response.json()
 
     def get_result(self, job_id: str, result_type: Literal['markdown', 'json']):
@@ -122,8 +154,7 @@ class LlamaParseClient:
             'Accept': 'application/json',
             'Authorization': f'Bearer {self.api_key}'
         }
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
+        response = self._request('GET', url, 'result', headers=headers)
         return response.json()
 
     def get_result_in_json(self, job_id: str) -> JsonJobResult:
@@ -134,7 +165,7 @@ class LlamaParseClient:
 
     def process_file(
         self,
-        file_content: Union[BufferedReader, bytes, str],
+        file_content: Union[BufferedReader, bytes, str, Path],
         file_name: str,
         mime_type: str,
         result_type: Literal['markdown', 'json'] = 'markdown',
@@ -0,0 +1,88 @@
+import json
+from typing import Any, Iterator, Optional
+
+import openai
+
+from .adaptive_concurrency import get_concurrency_limiter
+from .rate_limiter import get_rate_limiter
+
+def estimate_prompt_tokens(params: dict) -> int:
+    """Rough prompt token count of a chat completion request, about 4 characters per token"""
+    characters = 0
+    for message in params.get('messages') or []:
+        content = message.get('content') if isinstance(message, dict) else getattr(message, 'content', None)
+        characters += len(content if isinstance(content, str) else json.dumps(content, default=str))
+    if params.get('tools'):
+        characters += len(json.dumps(params['tools'], default=str))
+    return characters // 4 + 1
+
+class _Completions:
+    def __init__(self, llm_client: 'LLMClient'):
+        self._llm_client = llm_client
+
+    def create(self, **params):
+        return self._llm_client.create_chat_completion(**params)
+
+class _Chat:
+    def __init__(self, llm_client: 'LLMClient'):
+        self.completions = _Completions(llm_client)
+
+class LLMClient:
+    """OpenAI client wrapper that sends every chat completion through the shared rate limiter
+    and the adaptive concurrency window of the LLM service.
+
+    It exposes the same chat.completions.create interface as the OpenAI client,
+    so it can be handed to Swarm or used by the generators in its place.
+
+    A response_format is added to every request without tools, which with Swarm
+    means the parsing agents but not the triage agent that has to call a tool.
+    Request params (e.g. timeout and max_tokens) are added to every request that
+    does not set them itself.
+    """
+
+    def __init__(
+        self,
+        client: Optional[openai.OpenAI] = None,
+        response_format: Optional[dict] = None,
+        request_params: Optional[dict] = None
+    ):
+        self.client = client or openai.OpenAI()
+        self.response_format = response_format
+        self.request_params = request_params or {}
+        self.chat = _Chat(self)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.client, name)
+
+    def create_chat_completion(self, **params):
+        if self.response_format is not None and not params.get('tools'):
+            params.setdefault('response_format', self.response_format)
+        for name, value in self.request_params.items():
+            params.setdefault(name, value)
+
+        limiter = get_rate_limiter(params['model'])
+        completion_tokens = params.get('max_tokens') or limiter.default_completion_tokens()
+        estimated_tokens = estimate_prompt_tokens(params) + completion_tokens
+
+        # Tool calls (triage), extractions and streams of each model keep their own latency baseline
+        operation = f"{params['model']}:{'tools' if params.get('tools') else 'completion'}"
+        limiter.acquire(estimated_tokens)
+        if params.get('stream'):
+            return self._stream(params, f"{operation}:stream", limiter, estimated_tokens)
+        with get_concurrency_limiter('llm').slot(operation):
+            response = self.client.chat.completions.create(**params)
+
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            limiter.settle(estimated_tokens, usage.total_tokens)
+        return response
+
+    def _stream(self, params: dict, operation: str, limiter, estimated_tokens: int) -> Iterator[Any]:
+        """Chunks of a streamed completion, holding the concurrency slot until the stream is consumed or closed"""
+        usage = None
+        with get_concurrency_limiter('llm').slot(operation):
+            for chunk in self.client.chat.completions.create(**params):
+                usage = getattr(chunk, 'usage', None) or usage
+                yield chunk
+        if usage is not None:
+            limiter.settle(estimated_tokens, usage.total_tokens)
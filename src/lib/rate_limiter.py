@@ -0,0 +1,141 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, TypedDict
+
+class RateLimits(TypedDict, total=False):
+    requests_per_minute: int
+    tokens_per_minute: int
+    # Completion tokens assumed for a request that does not set max_tokens
+    default_completion_tokens: int
+
+# Defaults roughly follow the OpenAI tier 1 limits, override with LLM_RATE_LIMITS
+DEFAULT_RATE_LIMITS: Dict[str, RateLimits] = {
+    'gpt-4o-mini': {'requests_per_minute': 500, 'tokens_per_minute': 200000, 'default_completion_tokens': 2000},
+    'gpt-4o': {'requests_per_minute': 500, 'tokens_per_minute': 30000, 'default_completion_tokens': 2000},
+    'gpt-4': {'requests_per_minute': 500, 'tokens_per_minute': 10000, 'default_completion_tokens': 2000},
+}
+FALLBACK_RATE_LIMITS: RateLimits = {'requests_per_minute': 60, 'tokens_per_minute': 10000, 'default_completion_tokens': 2000}
+
+class TokenBucket:
+    """Bucket refilled continuously at capacity per minute"""
+
+    def __init__(self, capacity: float):
+        self.capacity = capacity
+        self.available = capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.capacity / 60)
+        self.updated_at = now
+
+    def seconds_until(self, amount: float) -> float:
+        """Seconds until the bucket holds amount, capped at a full bucket for oversized requests"""
+        missing = min(amount, self.capacity) - self.available
+        return max(0.0, missing * 60 / self.capacity)
+
+class ModelRateLimiter:
+    """Limits requests and estimated tokens per minute for one model.
+
+    Callers are served strictly in arrival order: a caller waits until every
+    earlier caller has been admitted, so a large request is not starved by a
+    stream of small ones.
+    """
+
+    def __init__(self, model: str, limits: RateLimits):
+        self.model = model
+        self.limits = {**FALLBACK_RATE_LIMITS, **limits}
+        self.requests = TokenBucket(self.limits['requests_per_minute'])
+        self.tokens = TokenBucket(self.limits['tokens_per_minute'])
+        self._condition = threading.Condition()
+        self._queue = deque()
+        self._admitted_requests = 0
+        self._admitted_tokens = 0
+        self._wait_seconds = 0.0
+
+    def acquire(self, estimated_tokens: int) -> None:
+        """Block until a request with the estimated prompt plus completion tokens may be sent"""
+        ticket = object()
+        started_at = time.monotonic()
+        with self._condition:
+            self._queue.append(ticket)
+            try:
+                while True:
+                    self.requests.refill()
+                    self.tokens.refill()
+                    if self._queue[0] is ticket:
+                        wait = max(self.requests.seconds_until(1), self.tokens.seconds_until(estimated_tokens))
+                        if wait == 0:
+                            break
+                        self._condition.wait(wait)
+                    else:
+                        self._condition.wait()
+            finally:
+                self._queue.remove(ticket)
+                self._condition.notify_all()
+
+            self.requests.available -= 1
+            self.tokens.available -= estimated_tokens
+            self._admitted_requests += 1
+            self._admitted_tokens += estimated_tokens
+            self._wait_seconds += time.monotonic() - started_at
+
+    def settle(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """Correct the token budget once the actual usage of a request is known"""
+        with self._condition:
+            self.tokens.available = min(self.tokens.capacity, self.tokens.available + estimated_tokens - actual_tokens)
+            self._admitted_tokens += actual_tokens - estimated_tokens
+            self._condition.notify_all()
+
+    def default_completion_tokens(self) -> int:
+        return self.limits['default_completion_tokens']
+
+    def metrics(self) -> Dict[str, float]:
+        """Current budget use of this model"""
+        with self._condition:
+            self.requests.refill()
+            self.tokens.refill()
+            return {
+                'requests_per_minute': self.requests.capacity,
+                'tokens_per_minute': self.tokens.capacity,
+                'request_budget_used': 1 - self.requests.available / self.requests.capacity,
+                'token_budget_used': 1 - self.tokens.available / self.tokens.capacity,
+                'queued_callers': len(self._queue),
+                'admitted_requests': self._admitted_requests,
+                'admitted_tokens': self._admitted_tokens,
+                'total_wait_seconds': self._wait_seconds,
+            }
+
+_limiters: Dict[str, ModelRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def load_rate_limits() -> Dict[str, RateLimits]:
+    """Per-model limits, with overrides from the LLM_RATE_LIMITS environment variable.
+
+    LLM_RATE_LIMITS holds a JSON object keyed by model name, for example
+    {"gpt-4o-mini": {"requests_per_minute": 5000, "tokens_per_minute": 2000000}}
+    """
+    limits = {model: dict(model_limits) for model, model_limits in DEFAULT_RATE_LIMITS.items()}
+    overrides = os.getenv('LLM_RATE_LIMITS')
+    if overrides:
+        for model, model_limits in json.loads(overrides).items():
+            limits.setdefault(model, {}).update(model_limits)
+    return limits
+
+def get_rate_limiter(model: str) -> ModelRateLimiter:
+    """Get the limiter shared by every caller of a model in this process"""
+    with _limiters_lock:
+        if model not in _limiters:
+            _limiters[model] = ModelRateLimiter(model, load_rate_limits().get(model, {}))
+        return _limiters[model]
+
+def rate_limit_metrics(model: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    """Budget use of every model seen so far, or of a single model"""
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    if model is not None:
+        limiters = {model: limiters[model]} if model in limiters else {}
+    return {name: limiter.metrics() for name, limiter in limiters.items()}
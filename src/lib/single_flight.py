@@ -0,0 +1,80 @@
+import fcntl
+import hashlib
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Callable, Dict, Optional, TypeVar
+
+T = TypeVar('T')
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one execution.
+
+    Within a process, the first caller of a key runs the function and later
+    callers wait on its future and share its result (or exception), so results
+    must not be mutated by the callers. Across processes on one host, the
+    running caller holds an exclusive flock on a lock file of the key. A caller
+    that finds the lock taken waits for it and then calls lookup, which returns
+    the result the other process has cached in the meantime, or None to run the
+    function after all.
+    """
+
+    def __init__(self, lock_dir: str = '.locks'):
+        self.lock_dir = Path(lock_dir)
+        self._calls: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+        self.waited = 0
+
+    def _lock_path(self, key: str) -> Path:
+        return self.lock_dir / f"{hashlib.md5(key.encode()).hexdigest()}.lock"
+
+    def do(self, key: str, func: Callable[[], T], lookup: Optional[Callable[[], Optional[T]]] = None) -> T:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = self._run_locked(key, func, lookup)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def _run_locked(self, key: str, func: Callable[[], T], lookup: Optional[Callable[[], Optional[T]]]) -> T:
+        self.lock_dir.mkdir(parents=True, exist_ok=True)
+        # Lock files are left in place, removing them would race with processes waiting on them
+        with open(self._lock_path(key), 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                with self._lock:
+                    self.waited += 1
+                result = lookup() if lookup is not None else None
+                if result is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    return result
+            try:
+                with self._lock:
+                    self.executed += 1
+                return func()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def report(self) -> str:
+        return (
+            f"{self.executed} executed, {self.coalesced} coalesced in process, "
+            f"{self.waited} waited on another process"
+        )
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from src.graph.compact import EMBEDDING_DIMENSIONS, CompactExtraction
+from src.graph.extraction_schema import DocumentExtraction, EntityType
+from src.lib.artifact import read_artifact, write_artifact
+
+@pytest.mark.parametrize('vector_dtype', ['float32', 'float16'])
+@pytest.mark.parametrize('vectors, shape', [
+  (None, (0, 0)),
+  (np.empty((0, EMBEDDING_DIMENSIONS), dtype=np.float32), (0, EMBEDDING_DIMENSIONS)),
+  (np.arange(6, dtype=np.float32).reshape(2, 3), (2, 3)),
+])
+def test_artifact_round_trip(tmp_path, vectors, shape, vector_dtype):
+  path = tmp_path / 'artifact.bin'
+  write_artifact(path, {'entities': [1, 2]}, vectors, structure_version=1, vector_dtype=vector_dtype)
+
+  structure, stored = read_artifact(path, structure_version=1)
+
+  assert structure == {'entities': [1, 2]}
+  assert stored.shape == shape
+  if vectors is not None:
+    np.testing.assert_array_equal(stored.astype(np.float32), vectors)
+
+def test_extraction_without_embedded_entities_round_trips(tmp_path):
+  extraction = DocumentExtraction.model_validate({
+    'entities': [{'type': 'Invoice', 'properties': {'id': 'invoice_1', 'amount': 100}}],
+    'relationships': []
+  })
+  compact = CompactExtraction.from_extraction(extraction)
+  path = tmp_path / 'invoice.bin'
+
+  compact.to_artifact(path)
+  loaded = CompactExtraction.from_artifact(path)
+
+  assert [(e.type, e.properties) for e in loaded.entities] == [(EntityType.INVOICE, {'id': 'invoice_1', 'amount': 100})]
+  assert loaded.embeddings.shape[0] == 0
+
+def test_extraction_with_embeddings_round_trips(tmp_path):
+  extraction = DocumentExtraction.model_validate({
+    'entities': [
+      {'type': 'Invoice', 'properties': {'id': 'invoice_1'}},
+      {'type': 'Organization', 'properties': {'id': 'organization_1', 'name': 'ServiceTech'}},
+    ],
+    'relationships': []
+  })
+  compact = CompactExtraction.from_extraction(extraction)
+  vector = np.linspace(-1, 1, EMBEDDING_DIMENSIONS, dtype=np.float32)
+  compact.set_embeddings([compact.entities[1]], vector[None, :])
+  path = tmp_path / 'invoice.bin'
+
+  compact.to_artifact(path)
+  loaded = CompactExtraction.from_artifact(path)
+
+  assert loaded.embedding(loaded.entities[0]) is None
+  np.testing.assert_array_equal(loaded.embedding(loaded.entities[1]), vector)
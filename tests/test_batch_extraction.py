@@ -0,0 +1,80 @@
+import json
+import time
+
+import pytest
+
+from src.graph.batch_extraction import BatchExtractor, LocalBatchBackend
+from src.graph.extraction_repair import ExtractionRepairer
+from src.graph.extraction_schema import DocumentExtraction
+from src.graph.loader import DocumentLoader
+from src.graph.model_routing import ModelRouter
+
+class FakeLoader:
+  """The parts of DocumentLoader a BatchExtractor uses, without Neo4j or LlamaParse"""
+  extraction_digest = DocumentLoader.extraction_digest
+  extraction_cache_path = DocumentLoader.extraction_cache_path
+
+  def __init__(self):
+    self.structured_output = False
+    self.extraction_repairer = ExtractionRepairer()
+    self.model_router = ModelRouter()
+
+def respond(body: dict) -> str:
+  """Extraction of the invoice number in the prompt; prompts without one fail"""
+  content = body['messages'][-1]['content']
+  if 'INV-' not in content:
+    raise ValueError("no invoice number")
+  invoice_id = content.rsplit('INV-', 1)[1]
+  return json.dumps({
+    'entities': [{'type': 'Invoice', 'properties': {'id': f"invoice_{invoice_id}", 'invoiceNumber': f"INV-{invoice_id}"}}],
+    'relationships': []
+  })
+
+@pytest.fixture
+def documents(tmp_path, monkeypatch):
+  # Cache paths are relative to the working directory, as in a loader run
+  monkeypatch.chdir(tmp_path)
+  return [
+    {'file_name': 'docs/invoice_1.pdf', 'markdown': 'Invoice INV-1'},
+    {'file_name': 'docs/invoice_2.pdf', 'markdown': 'Invoice INV-2'},
+    {'file_name': 'docs/invoice_3.pdf', 'markdown': 'Invoice without a number'},
+  ]
+
+def batch_extractor(delay_seconds: float) -> BatchExtractor:
+  backend = LocalBatchBackend(respond, delay_seconds=delay_seconds, state_dir='.batches/local')
+  return BatchExtractor(FakeLoader(), backend, state_dir='.batches')
+
+def test_batch_results_are_collected_after_a_restart(documents):
+  loader = FakeLoader()
+  batch_id = batch_extractor(delay_seconds=0.3).submit(documents)
+
+  assert batch_id is not None
+  assert batch_extractor(delay_seconds=0.3).poll() == 1
+  assert not any(loader.extraction_cache_path(document).exists() for document in documents)
+
+  time.sleep(0.3)
+  # A new extractor finds the open batch through the state directory
+  restarted = batch_extractor(delay_seconds=0.3)
+  assert [state['batch_id'] for state in restarted.open_batches()] == [batch_id]
+  assert restarted.poll() == 0
+
+  assert restarted.open_batches() == []
+  for number, document in enumerate(documents[:2], start=1):
+    extraction = DocumentExtraction.model_validate_json(loader.extraction_cache_path(document).read_bytes())
+    assert extraction.entities[0].properties == {'id': f"invoice_{number}", 'invoiceNumber': f"INV-{number}"}
+  # The failed request is left for interactive extraction
+  assert not loader.extraction_cache_path(documents[2]).exists()
+
+def test_documents_in_open_batches_are_not_submitted_again(documents):
+  extractor = batch_extractor(delay_seconds=60)
+  extractor.submit(documents[:1])
+
+  batch_id = extractor.submit(documents[:2])
+
+  submitted = {
+    request['file_name']
+    for state in extractor.open_batches()
+    if state['batch_id'] == batch_id
+    for request in state['requests'].values()
+  }
+  assert submitted == {'docs/invoice_2.pdf'}
@@ -0,0 +1,80 @@
+from src.graph.chunking import merge_chunk_extractions, split_markdown
+from src.graph.extraction_schema import DocumentExtraction
+from src.lib.llama_parse import DEFAULT_PAGE_SEPARATOR
+
+def extraction(entities, relationships=()):
+  return DocumentExtraction.model_validate({
+    'entities': [{'type': entity_type, 'properties': properties} for entity_type, properties in entities],
+    'relationships': [
+      {'from_': {'type': from_type, 'id': from_id}, 'to': {'type': to_type, 'id': to_id}, 'type': relationship_type, 'properties': properties}
+      for from_type, from_id, relationship_type, to_type, to_id, properties in relationships
+    ]
+  })
+
+def ids(merged):
+  return [(e.type.value, e.properties['id']) for e in merged.entities]
+
+def test_split_markdown_packs_pages_up_to_the_limit():
+  pages = ['a' * 40, 'b' * 40, 'c' * 40]
+
+  chunks = split_markdown(DEFAULT_PAGE_SEPARATOR.join(pages), 100)
+
+  assert chunks == [f"{pages[0]}\n\n{pages[1]}", pages[2]]
+
+def test_document_level_entities_merge_across_chunks():
+  merged = merge_chunk_extractions([
+    extraction([('Invoice', {'id': 'invoice_1', 'invoiceNumber': 'INV-1'})]),
+    extraction(
+      [('Invoice', {'id': 'invoice_a', 'totalAmount': 864}), ('ServiceItem', {'id': 'service_item_1', 'description': 'Support'})],
+      [('Invoice', 'invoice_a', 'CONTAINS_ITEM', 'ServiceItem', 'service_item_1', {'amount': 864})]
+    ),
+  ])
+
+  assert ids(merged) == [('Invoice', 'invoice_1'), ('ServiceItem', 'service_item_1')]
+  assert merged.entities[0].properties == {'id': 'invoice_1', 'invoiceNumber': 'INV-1', 'totalAmount': 864}
+  assert merged.relationships[0].from_.id == 'invoice_1'
+
+def test_entities_with_the_same_name_merge_across_chunks():
+  merged = merge_chunk_extractions([
+    extraction([('Organization', {'id': 'organization_1', 'name': 'ACME Corp'})]),
+    extraction(
+      [('Invoice', {'id': 'invoice_1'}), ('Organization', {'id': 'organization_2', 'name': 'Acme  corp', 'taxId': '12'})],
+      [('Invoice', 'invoice_1', 'BILLED_TO', 'Organization', 'organization_2', {})]
+    ),
+  ])
+
+  assert ids(merged) == [('Organization', 'organization_1'), ('Invoice', 'invoice_1')]
+  assert merged.entities[0].properties == {'id': 'organization_1', 'name': 'ACME Corp', 'taxId': '12'}
+  assert merged.relationships[0].to.id == 'organization_1'
+
+def test_contradicting_entities_and_entities_of_one_chunk_stay_apart():
+  merged = merge_chunk_extractions([
+    extraction([
+      ('Organization', {'id': 'organization_1', 'name': 'ACME', 'taxId': '12'}),
+      ('ServiceItem', {'id': 'service_item_1', 'description': 'Support'}),
+    ]),
+    extraction([
+      ('Organization', {'id': 'organization_1', 'name': 'ACME', 'taxId': '34'}),
+      ('ServiceItem', {'id': 'service_item_1', 'description': 'Support'}),
+      ('ServiceItem', {'id': 'service_item_2', 'description': 'Support'}),
+    ]),
+  ])
+
+  assert ids(merged) == [
+    ('Organization', 'organization_1'),
+    ('ServiceItem', 'service_item_1'),
+    ('Organization', 'organization_1_chunk1'),
+    ('ServiceItem', 'service_item_2'),
+  ]
+
+def test_only_exact_duplicate_relationships_are_dropped():
+  entities = [('Invoice', {'id': 'invoice_1'}), ('ServiceItem', {'id': 'service_item_1', 'description': 'Support'})]
+  merged = merge_chunk_extractions([
+    extraction(entities, [('Invoice', 'invoice_1', 'CONTAINS_ITEM', 'ServiceItem', 'service_item_1', {'amount': 10})]),
+    extraction(entities, [
+      ('Invoice', 'invoice_1', 'CONTAINS_ITEM', 'ServiceItem', 'service_item_1', {'amount': 10}),
+      ('Invoice', 'invoice_1', 'CONTAINS_ITEM', 'ServiceItem', 'service_item_1', {'amount': 20}),
+    ]),
+  ])
+
+  assert [r.properties['amount'] for r in merged.relationships] == [10, 20]
@@ -0,0 +1,73 @@
+import pytest
+
+from src.graph.delta_extraction import apply_delta, series_key
+from src.graph.extraction_schema import DocumentExtraction
+
+def relationship(from_type, from_id, relationship_type, to_type, to_id, properties=None):
+  return {
+    'from_': {'type': from_type, 'id': from_id},
+    'to': {'type': to_type, 'id': to_id},
+    'type': relationship_type,
+    'properties': properties or {}
+  }
+
+TEMPLATE = DocumentExtraction.model_validate({
+  'entities': [
+    {'type': 'Invoice', 'properties': {'id': 'invoice_1', 'invoiceNumber': 'RENT-MAIN-202301', 'totalAmount': 1000}},
+    {'type': 'ServiceItem', 'properties': {'id': 'service_item_1', 'description': 'Rent'}},
+    {'type': 'ServiceItem', 'properties': {'id': 'service_item_2', 'description': 'Parking'}},
+    {'type': 'Document', 'properties': {'id': 'document_1', 'path': 'docs/RENT-MAIN-202301.pdf', 'processedAt': 'then'}},
+  ],
+  'relationships': [
+    relationship('Invoice', 'invoice_1', 'CONTAINS_ITEM', 'ServiceItem', 'service_item_1', {'amount': 900}),
+    relationship('Invoice', 'invoice_1', 'CONTAINS_ITEM', 'ServiceItem', 'service_item_2', {'amount': 100}),
+    relationship('Invoice', 'invoice_1', 'MENTIONED_IN', 'Document', 'document_1', {'confidence': 1.0}),
+  ]
+})
+
+def test_series_key_splits_off_the_period():
+  assert series_key('docs/RENT-MAIN-202302.pdf') == ('RENT-MAIN-.pdf', '202302')
+  assert series_key('docs/contract.pdf') is None
+
+def test_delta_changes_adds_and_removes_items():
+  delta = {
+    'entities': [
+      {'type': 'Invoice', 'properties': {'id': 'invoice_1', 'invoiceNumber': 'RENT-MAIN-202302', 'totalAmount': 1050}},
+      {'type': 'ServiceItem', 'properties': {'id': 'service_item_3', 'description': 'Cleaning'}},
+    ],
+    'removed_entity_ids': ['service_item_2'],
+    'relationships': [
+      relationship('Invoice', 'invoice_1', 'CONTAINS_ITEM', 'ServiceItem', 'service_item_1', {'amount': 950}),
+      relationship('Invoice', 'invoice_1', 'CONTAINS_ITEM', 'ServiceItem', 'service_item_3', {'amount': 100}),
+    ],
+  }
+
+  result = apply_delta(TEMPLATE, delta, 'docs/RENT-MAIN-202302.pdf', 'now')
+
+  entities = {e.properties['id']: e.properties for e in result.entities}
+  assert set(entities) == {'invoice_1', 'service_item_1', 'service_item_3', 'document_1'}
+  assert entities['invoice_1']['totalAmount'] == 1050
+  assert entities['document_1'] == {'id': 'document_1', 'path': 'docs/RENT-MAIN-202302.pdf', 'processedAt': 'now'}
+  amounts = {r.to.id: r.properties.get('amount') for r in result.relationships}
+  assert amounts == {'service_item_1': 950, 'service_item_3': 100, 'document_1': None}
+  # The template is left as it was
+  assert TEMPLATE.entities[0].properties['totalAmount'] == 1000
+
+def test_delta_removes_relationships():
+  removed = relationship('Invoice', 'invoice_1', 'CONTAINS_ITEM', 'ServiceItem', 'service_item_2')
+  # Removed relationships are named without their properties
+  del removed['properties']
+
+  result = apply_delta(TEMPLATE, {'removed_relationships': [removed]}, 'docs/RENT-MAIN-202302.pdf', 'now')
+
+  assert [r.to.id for r in result.relationships] == ['service_item_1', 'document_1']
+  assert len(result.entities) == 4
+
+@pytest.mark.parametrize('delta', [
+  ['not', 'an', 'object'],
+  {'removed_entity_ids': ['document_1'], 'relationships': [relationship('Invoice', 'invoice_1', 'MENTIONED_IN', 'Document', 'document_1')]},
+  {'entities': [{'type': 'Spaceship', 'properties': {'id': 'x'}}]},
+])
+def test_invalid_deltas_raise(delta):
+  with pytest.raises(ValueError):
+    apply_delta(TEMPLATE, delta, 'docs/RENT-MAIN-202302.pdf', 'now')
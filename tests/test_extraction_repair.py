@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from src.graph.extraction_repair import (
+  ExtractionRepairError,
+  repair_truncated_json,
+  salvage_extraction,
+  strip_fences
+)
+from src.graph.extraction_schema import EntityType
+
+INVOICE = {'type': 'Invoice', 'properties': {'id': 'invoice_1', 'invoiceNumber': 'INV-1'}}
+ORGANIZATION = {'type': 'Organization', 'properties': {'id': 'organization_1', 'name': 'ServiceTech'}}
+BILLED_BY = {
+  'from_': {'type': 'Invoice', 'id': 'invoice_1'},
+  'to': {'type': 'Organization', 'id': 'organization_1'},
+  'type': 'BILLED_BY',
+  'properties': {}
+}
+
+def test_complete_json_is_not_cut():
+  text = json.dumps({'entities': [INVOICE], 'relationships': []})
+
+  assert repair_truncated_json(text) == ({'entities': [INVOICE], 'relationships': []}, False)
+
+def test_truncated_json_keeps_the_complete_elements():
+  text = json.dumps({'entities': [INVOICE, ORGANIZATION], 'relationships': [BILLED_BY]})
+  truncated = text[:text.index('"Organization"') + 5]
+
+  data, cut = repair_truncated_json(truncated)
+
+  assert cut
+  assert data == {'entities': [INVOICE]}
+
+def test_truncated_json_ignores_brackets_in_strings():
+  entity = {'type': 'ServiceItem', 'properties': {'id': 'item_1', 'description': 'Rack [42U], "quoted" {x}'}}
+  text = json.dumps({'entities': [entity, ORGANIZATION]})
+  truncated = text[:text.index('ServiceTech')]
+
+  data, cut = repair_truncated_json(truncated)
+
+  assert cut
+  assert data == {'entities': [entity]}
+
+def test_unrepairable_json_raises():
+  with pytest.raises(ExtractionRepairError):
+    repair_truncated_json('{"entities": ')
+
+def test_strip_fences_removes_fences_and_prose():
+  text = 'Here it is:\n```json\n{"entities": []}\n```\nAnything else?'
+
+  assert strip_fences(text) == '{"entities": []}'
+
+def test_salvage_drops_invalid_items():
+  data = {
+    'entities': [INVOICE, ORGANIZATION, {'type': 'Spaceship', 'properties': {'id': 'spaceship_1'}}],
+    'relationships': [
+      BILLED_BY,
+      {**BILLED_BY, 'to': {'type': 'Organization', 'id': 'organization_2'}},
+      {'from_': {'type': 'Invoice', 'id': 'invoice_1'}},
+    ]
+  }
+
+  extraction, invalid = salvage_extraction(data)
+
+  assert [e.type for e in extraction.entities] == [EntityType.INVOICE, EntityType.ORGANIZATION]
+  assert len(extraction.relationships) == 1
+  assert [item['kind'] for item in invalid] == ['entity', 'relationship', 'relationship']
+  assert invalid[1]['errors'] == ['Organization organization_2 is not an extracted entity']
+
+@pytest.mark.parametrize('data', [
+  [INVOICE],
+  {'document': {}},
+  {'entities': [{'type': 'Spaceship', 'properties': {}}]},
+])
+def test_salvage_rejects_output_without_valid_entities(data):
+  with pytest.raises(ExtractionRepairError):
+    salvage_extraction(data)
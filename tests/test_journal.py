@@ -0,0 +1,73 @@
+import json
+import os
+
+import pytest
+
+from src.graph.journal import CheckpointJournal
+
+@pytest.fixture
+def documents(tmp_path):
+  paths = []
+  for name in ('a.pdf', 'b.pdf'):
+    path = tmp_path / name
+    path.write_bytes(name.encode())
+    paths.append(str(path))
+  return paths
+
+def journal_lines(journal):
+  return [json.loads(line) for line in journal.path.read_text().splitlines()]
+
+def test_completed_stages_are_replayed_after_a_restart(tmp_path, documents):
+  journal = CheckpointJournal(str(tmp_path / 'journal.jsonl'))
+  journal.record(documents[0], 'parsed', 'digest-a')
+  journal.record(documents[0], 'written')
+  journal.record(documents[1], 'extracted', 'digest-b')
+
+  restarted = CheckpointJournal(str(tmp_path / 'journal.jsonl'))
+
+  assert restarted.completed(documents[0], 'written')
+  assert restarted.completed(documents[1], 'extracted')
+  assert not restarted.completed(documents[1], 'embedded')
+  # The digest of an unchanged file is carried over to its later stages
+  assert restarted.entries[documents[0]]['digest'] == 'digest-a'
+
+def test_changed_and_removed_files_are_not_completed(tmp_path, documents):
+  journal = CheckpointJournal(str(tmp_path / 'journal.jsonl'))
+  for path in documents:
+    journal.record(path, 'written')
+
+  with open(documents[0], 'ab') as f:
+    f.write(b'changed')
+  os.remove(documents[1])
+
+  assert not journal.completed(documents[0], 'parsed')
+  assert not journal.completed(documents[1], 'parsed')
+
+def test_torn_last_line_is_ignored(tmp_path, documents):
+  journal = CheckpointJournal(str(tmp_path / 'journal.jsonl'))
+  journal.record(documents[0], 'written')
+  with open(journal.path, 'a') as f:
+    f.write('{"path": "' + documents[1] + '", "si')
+
+  restarted = CheckpointJournal(str(tmp_path / 'journal.jsonl'))
+
+  assert list(restarted.entries) == [documents[0]]
+  assert restarted.completed(documents[0], 'written')
+
+def test_compaction_keeps_the_latest_entry_per_document(tmp_path, documents):
+  journal = CheckpointJournal(str(tmp_path / 'journal.jsonl'), compact_every=4)
+  # Another process sharing the journal
+  other = CheckpointJournal(str(tmp_path / 'journal.jsonl'))
+  for stage in ('parsed', 'extracted', 'embedded'):
+    journal.record(documents[0], stage)
+  other.record(documents[1], 'parsed')
+  assert len(journal_lines(journal)) == 4
+
+  journal.record(documents[0], 'written')
+
+  assert [(entry['path'], entry['stage']) for entry in journal_lines(journal)] == [
+    (documents[0], 'written'),
+    (documents[1], 'parsed'),
+  ]
+  assert journal.completed(documents[1], 'parsed')
+  assert CheckpointJournal(str(tmp_path / 'journal.jsonl')).completed(documents[0], 'written')
@@ -0,0 +1,44 @@
+import json
+
+from src.graph.streaming import EntityStreamParser
+
+ENTITIES = [
+  {'type': 'Invoice', 'properties': {'id': 'invoice_1', 'note': 'braces } and "quotes" ] in a string'}},
+  {'type': 'Organization', 'properties': {'id': 'organization_1', 'name': 'ServiceTech', 'address': {'city': 'Berlin'}}},
+]
+OUTPUT = json.dumps({
+  'entities': ENTITIES,
+  'relationships': [{'from_': {'type': 'Invoice', 'id': 'invoice_1'}, 'to': {'type': 'Organization', 'id': 'organization_1'}, 'type': 'BILLED_BY', 'properties': {}}]
+})
+
+def stream(text, size):
+  parser = EntityStreamParser()
+  streamed = []
+  for start in range(0, len(text), size):
+    streamed.append([e.model_dump(mode='json') for e in parser.feed(text[start:start + size])])
+  return streamed
+
+def test_entities_are_returned_once_they_are_complete():
+  streamed = stream(OUTPUT, 1)
+
+  assert [entity for batch in streamed for entity in batch] == ENTITIES
+  # Each entity arrives with the delta that closes it, not at the end
+  first_entity_end = OUTPUT.index('}}') + 2
+  assert streamed[first_entity_end - 1] == ENTITIES[:1]
+
+def test_entities_key_split_across_deltas():
+  streamed = stream('Sure, here it is: ```json\n' + OUTPUT, 5)
+
+  assert [entity for batch in streamed for entity in batch] == ENTITIES
+
+def test_invalid_entities_are_skipped():
+  text = json.dumps({'entities': [{'type': 'Spaceship', 'properties': {}}, ENTITIES[1]]})
+
+  assert [e.model_dump(mode='json') for e in EntityStreamParser().feed(text)] == [ENTITIES[1]]
+
+def test_objects_after_the_entities_array_are_ignored():
+  parser = EntityStreamParser()
+  parser.feed(OUTPUT)
+
+  assert parser.state == 'done'
+  assert parser.feed(json.dumps({'entities': ENTITIES})) == []
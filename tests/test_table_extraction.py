@@ -0,0 +1,55 @@
+from src.graph.extraction_schema import DocumentExtraction, EntityType, RelationshipType
+from src.graph.table_extraction import merge_table_items, split_tables
+
+def _result(*items):
+  return {'pages': [{'page': 1, 'md': '', 'text': '', 'items': list(items)}]}
+
+def _table(*rows):
+  return {'type': 'table', 'rows': [list(row) for row in rows], 'md': 'original table'}
+
+def test_line_item_table_keeps_summary_rows_in_markdown():
+  markdown, tables = split_tables(_result(
+    {'type': 'heading', 'value': 'Services', 'md': '# Services'},
+    _table(
+      ['Description', 'Qty', 'Rate', 'Amount'],
+      ['Network audit', '2', '$150.00', '$300.00'],
+      ['Firewall setup', '1', '$500.00', '$500.00'],
+      ['Subtotal', '', '', '$800.00'],
+      ['Total', '', '', '$864.00'],
+    )
+  ))
+
+  assert [row['description'] for row in tables[0]['rows']] == ['Network audit', 'Firewall setup']
+  assert tables[0]['heading'] == 'Services'
+  assert '[Services: 2 line items extracted separately]' in markdown
+  assert '| Subtotal |  |  | $800.00 |' in markdown
+  assert '| Total |  |  | $864.00 |' in markdown
+  assert 'Network audit' not in markdown
+
+def test_line_item_table_without_summary_rows_is_only_a_placeholder():
+  markdown, _ = split_tables(_result(_table(['Item', 'Amount'], ['Support', '100'])))
+
+  assert markdown == '[Table: 1 line items extracted separately]'
+
+def test_key_value_tables_stay_in_markdown():
+  employee = _table(['Employee ID', '1001'], ['Pay Period', '202411'], ['Hours', '80'])
+  totals = _table(['Subtotal', '$800.00'], ['Tax (8%)', '$64.00'], ['Total', '$864.00'])
+
+  markdown, tables = split_tables(_result(employee, totals))
+
+  assert tables == []
+  assert markdown == 'original table\n\noriginal table'
+
+def test_table_items_attach_to_invoice():
+  extraction = DocumentExtraction.model_validate({
+    'entities': [{'type': 'Invoice', 'properties': {'id': 'invoice_1'}}],
+    'relationships': []
+  })
+  _, tables = split_tables(_result(_table(['Description', 'Qty', 'Amount'], ['Support', '3', '$90.00'])))
+
+  merged = merge_table_items(extraction, tables)
+
+  assert merged.entities[1].type == EntityType.SERVICE_ITEM
+  assert merged.relationships[0].type == RelationshipType.CONTAINS_ITEM
+  assert merged.relationships[0].properties == {'quantity': 3.0, 'unit': 'each', 'amount': 90.0}
+  assert len(extraction.entities) == 1